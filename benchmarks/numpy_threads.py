@@ -0,0 +1,50 @@
+"""benchmark :meth:`NumpyMetric.metric` throughput as recording threads increase
+
+Run as ``python -m benchmarks.numpy_threads`` from the top of the source tree.
+Prints samples recorded per second for each thread count, for both a single
+shared metric name and one name per thread.
+"""
+import sys
+import time
+import threading
+from io import StringIO
+
+from instrument.output.table import TableMetric
+
+THREAD_COUNTS = (1, 2, 4, 8, 16, 32)
+SAMPLES = 400000 #: total samples recorded per run, split among threads
+
+def run(nthreads, shared):
+    per_thread = SAMPLES // nthreads
+    barrier = threading.Barrier(nthreads + 1)
+
+    def record(i):
+        name = "bench" if shared else "bench.%d" % i
+        metric = TableMetric.metric
+        barrier.wait()
+        for _ in range(per_thread):
+            metric(name, 1, 0.5)
+
+    threads = [threading.Thread(target=record, args=(i,)) for i in range(nthreads)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    t = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - t
+
+    TableMetric.dump()
+    return per_thread * nthreads / elapsed
+
+def main():
+    TableMetric.dump_atexit = False
+    TableMetric.outfile = StringIO()
+
+    print("%8s %16s %16s" % ("threads", "shared name/s", "per-thread name/s"))
+    for n in THREAD_COUNTS:
+        print("%8d %16.0f %16.0f" % (n, run(n, True), run(n, False)))
+        sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+"""benchmark the overhead of measurement functions & metric backends
+
+Run as ``python -m benchmarks.overhead`` from the top of the source tree.
+
+Measurement functions are compared against uninstrumented baselines, in both
+function and method forms, using a metric that does nothing. Metric backends
+are timed per event, for several numbers of recording threads & distinct
+metric names. All results are nanoseconds per operation (per item for
+iterables & reducers).
+
+Absolute timings vary between machines & runs, so each result is also
+expressed relative to a baseline measured in the same run: a call of a
+metric that does nothing.
+
+Results are written as JSON to ``benchmarks/results.json`` (see ``--output``).
+With ``--check``, exits with an error if any relative result exceeds its
+threshold in ``benchmarks/thresholds.json``. ``--update`` rewrites the
+thresholds from the current relative results, multiplied by ``--margin``.
+"""
+import os
+import sys
+import json
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import time
+import timeit
+from collections import deque
+from contextlib import redirect_stdout
+
+import instrument
+from instrument.output import print_metric
+from instrument.output.logging import log_metric
+from instrument.output.csv import CSVFileMetric, CSVDirMetric
+from instrument.output.table import TableMetric
+from instrument.output.plot import PlotMetric
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+THRESHOLDS = os.path.join(HERE, 'thresholds.json')
+RESULTS = os.path.join(HERE, 'results.json')
+
+ITEMS = 100 #: length of iterables
+THREAD_COUNTS = (1, 4, 16)
+CARDINALITIES = (1, 16, 256) #: number of distinct metric names
+EVENTS = 40000 #: events recorded per backend run
+
+BASELINE = 'baseline.call' #: result that others are relative to
+
+def null_metric(name, count, elapsed):
+    pass
+
+def best(func, number):
+    """best time per call of ``func``, in nanoseconds"""
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e9
+
+def overhead(instrumented, baseline, ops = 1, number = 2000):
+    """nanoseconds added per operation"""
+    return (best(instrumented, number) - best(baseline, number)) / ops
+
+def consume(iterable):
+    deque(iterable, maxlen=0)
+
+def calibrate():
+    """nanoseconds per call of a metric that does nothing"""
+    return best(lambda: null_metric("bench", 1, 0.001), 20000)
+
+def primitives():
+    """overhead of each measurement function, in function & method forms"""
+    items = range(ITEMS)
+    kw = dict(name="bench", metric=null_metric)
+
+    def gen(n):
+        yield from range(n)
+
+    def reduce(iterable):
+        return sum(iterable)
+
+    def produce(n):
+        return list(range(n))
+
+    def func():
+        pass
+
+    class Plain(object):
+        def gen(self, n):
+            yield from range(n)
+
+        def reduce(self, iterable):
+            return sum(iterable)
+
+        def produce(self, n):
+            return list(range(n))
+
+        def func(self):
+            pass
+
+    class Measured(object):
+        all = instrument.all(**kw)(Plain.gen)
+        each = instrument.each(**kw)(Plain.gen)
+        first = instrument.first(**kw)(Plain.gen)
+        reducer = instrument.reducer(**kw)(Plain.reduce)
+        producer = instrument.producer(**kw)(Plain.produce)
+        function = instrument.function(**kw)(Plain.func)
+
+    def block():
+        with instrument.block(**kw):
+            pass
+
+    all_ = instrument.all(**kw)(gen)
+    each_ = instrument.each(**kw)(gen)
+    first_ = instrument.first(**kw)(gen)
+    reducer_ = instrument.reducer(**kw)(reduce)
+    producer_ = instrument.producer(**kw)(produce)
+    function_ = instrument.function(**kw)(func)
+    plain, measured = Plain(), Measured()
+
+    return {
+        'all': overhead(lambda: consume(instrument.all(items, **kw)), lambda: consume(items), ITEMS),
+        'each': overhead(lambda: consume(instrument.each(items, **kw)), lambda: consume(items), ITEMS),
+        'first': overhead(lambda: consume(instrument.first(items, **kw)), lambda: consume(items)),
+        'block': overhead(block, func, number=20000),
+        'function.all': overhead(lambda: consume(all_(ITEMS)), lambda: consume(gen(ITEMS)), ITEMS),
+        'function.each': overhead(lambda: consume(each_(ITEMS)), lambda: consume(gen(ITEMS)), ITEMS),
+        'function.first': overhead(lambda: consume(first_(ITEMS)), lambda: consume(gen(ITEMS))),
+        'function.reducer': overhead(lambda: reducer_(items), lambda: reduce(items), ITEMS),
+        'function.producer': overhead(lambda: producer_(ITEMS), lambda: produce(ITEMS)),
+        'function.function': overhead(function_, func, number=20000),
+        'method.all': overhead(lambda: consume(measured.all(ITEMS)), lambda: consume(plain.gen(ITEMS)), ITEMS),
+        'method.each': overhead(lambda: consume(measured.each(ITEMS)), lambda: consume(plain.gen(ITEMS)), ITEMS),
+        'method.first': overhead(lambda: consume(measured.first(ITEMS)), lambda: consume(plain.gen(ITEMS))),
+        'method.reducer': overhead(lambda: measured.reducer(items), lambda: plain.reduce(items), ITEMS),
+        'method.producer': overhead(lambda: measured.producer(ITEMS), lambda: plain.produce(ITEMS)),
+        'method.function': overhead(lambda: measured.function(), lambda: plain.func(), number=20000),
+    }
+
+def record(metric, nthreads, cardinality):
+    """nanoseconds per event for ``metric``, spread over threads & names"""
+    names = ["bench.%d" % i for i in range(cardinality)]
+    per_thread = EVENTS // nthreads
+    barrier = threading.Barrier(nthreads + 1)
+
+    def run():
+        barrier.wait()
+        for i in range(per_thread):
+            metric(names[i % cardinality], 1, 0.001)
+
+    threads = [threading.Thread(target=run) for _ in range(nthreads)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    t = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return (time.perf_counter() - t) / (per_thread * nthreads) * 1e9
+
+def backends(tmpdir):
+    """per-event cost of each metric backend"""
+    devnull = open(os.devnull, 'w')
+    logger = logging.getLogger('instrument')
+    logger.addHandler(logging.StreamHandler(devnull))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    for cls in (CSVDirMetric, TableMetric, PlotMetric):
+        cls.dump_atexit = False
+    TableMetric.outfile = devnull
+    PlotMetric.outdir = os.path.join(tmpdir, 'plots')
+
+    def plot_reset():
+        # recording cost only; plotting is slow & not on the measured path
+        with PlotMetric.lock:
+            for buf in PlotMetric.buffers.values():
+                del buf[:]
+            if PlotMetric.arena is not None:
+                PlotMetric.arena.seek(0)
+                PlotMetric.arena.truncate()
+
+    def csv_dir_dump():
+        CSVDirMetric.dump()
+        CSVDirMetric.instances.clear()
+
+    results = {}
+    for nthreads in THREAD_COUNTS:
+        for cardinality in CARDINALITIES:
+            suffix = ".threads%d.names%d" % (nthreads, cardinality)
+
+            with redirect_stdout(devnull):
+                results['print_metric' + suffix] = record(print_metric, nthreads, cardinality)
+            results['log_metric' + suffix] = record(log_metric, nthreads, cardinality)
+
+            csvfm = CSVFileMetric(os.path.join(tmpdir, 'file.csv'), dump_atexit=False)
+            results['CSVFileMetric' + suffix] = record(csvfm.metric, nthreads, cardinality)
+            csvfm.dump()
+
+            CSVDirMetric.outdir = os.path.join(tmpdir, 'csv')
+            results['CSVDirMetric' + suffix] = record(CSVDirMetric.metric, nthreads, cardinality)
+            csv_dir_dump()
+
+            results['TableMetric' + suffix] = record(TableMetric.metric, nthreads, cardinality)
+            TableMetric.dump()
+
+            results['PlotMetric' + suffix] = record(PlotMetric.metric, nthreads, cardinality)
+            plot_reset()
+
+    devnull.close()
+    return results
+
+def relative(results):
+    """:return: each result divided by its baseline from the same run"""
+    baseline = results[BASELINE]
+    return {k: v / baseline for k, v in results.items() if k != BASELINE}
+
+def check(ratios, thresholds):
+    """:return: list of messages for relative results exceeding their thresholds"""
+    failures = []
+    for key, limit in sorted(thresholds.items()):
+        if key not in ratios:
+            failures.append("%s: missing result" % key)
+        elif ratios[key] > limit:
+            failures.append("%s: %.1fx baseline exceeds threshold of %.1fx" % (key, ratios[key], limit))
+    return failures
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default=RESULTS, help="file to write JSON results to")
+    parser.add_argument('--check', action='store_true', help="fail if results exceed thresholds")
+    parser.add_argument('--update', action='store_true', help="rewrite thresholds from results")
+    parser.add_argument('--margin', type=float, default=4.0, help="multiplier for --update")
+    args = parser.parse_args(argv)
+
+    # measure overhead only
+    instrument.default_metric = null_metric
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        results = {BASELINE: calibrate()}
+        results.update(('primitive.' + k, v) for k, v in primitives().items())
+        results.update(('backend.' + k, v) for k, v in backends(tmpdir).items())
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    ratios = relative(results)
+
+    for key, value in sorted(results.items()):
+        if key in ratios:
+            print("%-50s %10.0f ns %8.1fx" % (key, value, ratios[key]))
+        else:
+            print("%-50s %10.0f ns" % (key, value))
+
+    with open(args.output, 'w') as fh:
+        json.dump(results, fh, indent=2, sort_keys=True)
+
+    if args.update:
+        with open(THRESHOLDS, 'w') as fh:
+            # overheads near zero get a floor of one baseline, so noise doesn't fail them
+            json.dump({k: round(max(v, 1.0) * args.margin, 1) for k, v in ratios.items()},
+                      fh, indent=2, sort_keys=True)
+
+    if args.check:
+        with open(THRESHOLDS) as fh:
+            failures = check(ratios, json.load(fh))
+        for f in failures:
+            print("FAIL", f, file=sys.stderr)
+        return 1 if failures else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
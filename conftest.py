@@ -1,9 +1,19 @@
+import time
+
 import pytest
 import fakesleep
 
+import instrument
+
+
+def fake_clock():
+    """nanosecond clock driven by fakesleep's patched `time.time`"""
+    return round(time.time() * 1e9)
+
 
 @pytest.fixture(autouse=True)
-def auto_fakesleep():
+def auto_fakesleep(monkeypatch):
     fakesleep.monkey_patch()
+    monkeypatch.setattr(instrument, 'clock', fake_clock)
     yield
     fakesleep.monkey_restore()
@@ -23,6 +23,8 @@ def monkeypatch_pytest():
 
                 root = logging.getLogger()
                 root.setLevel(logging.DEBUG)
+                # don't capture asyncio's debugging noise
+                logging.getLogger('asyncio').setLevel(logging.WARNING)
 
                 if handler:
                     root.addHandler(handler)
@@ -7,8 +7,12 @@ __version__ = '0.6.1'
 
 import time
 from functools import wraps
+from types import MethodType
 from contextlib import contextmanager
+import contextvars
 import inspect
+import asyncio
+import weakref
 
 from .output import print_metric
 
@@ -16,6 +20,60 @@ from .output import print_metric
 _builtin_all = all
 
 default_metric = print_metric #: user-supplied function to use as global default metric
+clock = time.perf_counter_ns #: user-supplied function returning a monotonic time in integer nanoseconds
+track_spans = False #: track nesting of :func:`block`, :func:`function`, :func:`producer` & :func:`reducer`, to report self time
+
+def _seconds(ns):
+    """convert integer nanoseconds from :data:`clock` to float seconds for metrics"""
+    return ns / 1e9
+
+class Span(object):
+    """a measurement in progress, when :data:`track_spans` is set
+
+    :ivar str name: name of the metric
+    :ivar parent: the enclosing :class:`Span`, or None
+    :ivar int child_time: nanoseconds spent in enclosed spans that have finished
+    """
+    __slots__ = ['name', 'parent', 'child_time']
+
+    def __init__(self, name, parent):
+        self.name = name
+        self.parent = parent
+        self.child_time = 0
+
+_current_span = contextvars.ContextVar('instrument.span', default=None)
+
+def current_span():
+    """:return: the innermost :class:`Span` in progress in this thread or task, or None"""
+    return _current_span.get()
+
+def _push_span(name):
+    span = Span(name, _current_span.get())
+    _current_span.set(span)
+    return span
+
+def _pop_span(span, metric, count, elapsed):
+    """finish ``span``, which took ``elapsed`` nanoseconds, and record a metric
+
+    If the metric, or the object it's a method of, has a ``span(name, count,
+    elapsed, self_elapsed, parent)`` method, it's passed the time not spent in
+    enclosed spans & the enclosing span's name.
+    """
+    parent = span.parent
+    _current_span.set(parent)
+    if parent is not None:
+        parent.child_time += elapsed
+
+    if metric is call_default:
+        metric = default_metric
+    record = getattr(getattr(metric, '__self__', metric), 'span', None)
+    if record is None:
+        metric(span.name, count, _seconds(elapsed))
+    else:
+        # enclosed spans in concurrent tasks may overlap
+        self_elapsed = max(elapsed - span.child_time, 0)
+        record(span.name, count, _seconds(elapsed), _seconds(self_elapsed),
+               parent.name if parent is not None else None)
 
 def call_default(name, count, elapsed):
     """call the global :func:`default_metric`
@@ -32,73 +90,166 @@ def _do_all(iterable, name, metric):
     it = enumerate(iterable, 1) # count, item
     try:
         while True:
-            t = time.time()
+            t = clock()
             try:
                 count, x = next(it)
+            except StopIteration:
+                return
             finally:
-                total_time += time.time() - t
+                total_time += clock() - t
             yield x
     finally:
         # underlying iterable is exhausted (StopIteration) or errored. Record
         # the `metric` and allow exception to propogate
-        metric(name, count, total_time)
+        metric(name, count, _seconds(total_time))
 
 def _do_each(iterable, name, metric):
+    # sampled metrics (see instrument.output.sampling) decide before measuring
+    if hasattr(metric, 'sample'):
+        return _do_each_sampled(iterable, name, metric)
+    return _do_each_all(iterable, name, metric)
+
+def _do_each_all(iterable, name, metric):
     it = iter(iterable)
     while True:
-        t = time.time()
+        t = clock()
         try:
             x = next(it)
         except StopIteration:
             # don't record a metric for final next() call
+            return
+        except Exception:
+            # record a metric for other exceptions, than raise
+            metric(name, 1, _seconds(clock() - t))
             raise
+        else:
+            # normal path, record metric and yield
+            metric(name, 1, _seconds(clock() - t))
+            yield x
+
+def _do_each_sampled(iterable, name, metric):
+    it = iter(iterable)
+    sample = metric.sample
+    record = metric.record
+    # take back the decision for the final next() call, which has no item
+    unsample = getattr(metric, 'unsample', None) or (lambda name: None)
+    while True:
+        if not sample(name):
+            # unsampled, so don't read the clock at all
+            try:
+                x = next(it)
+            except StopIteration:
+                unsample(name)
+                return
+            yield x
+            continue
+
+        t = clock()
+        try:
+            x = next(it)
+        except StopIteration:
+            # don't record a metric for final next() call
+            unsample(name)
+            return
         except Exception:
             # record a metric for other exceptions, than raise
-            metric(name, 1, time.time() - t)
+            record(name, 1, _seconds(clock() - t))
             raise
         else:
             # normal path, record metric and yield
-            metric(name, 1, time.time() - t)
+            record(name, 1, _seconds(clock() - t))
             yield x
 
 def _do_first(iterable, name, metric):
     it = iter(iterable)
-    t = time.time()
+    t = clock()
     try:
         x = next(it)
     except StopIteration:
         # don't record a metric for final next() call
-        raise
+        return
     except Exception:
         # record a metric for other exceptions, than raise
-        metric(name, 1, time.time() - t)
+        metric(name, 1, _seconds(clock() - t))
         raise
     else:
         # normal path, record metric and yield
-        metric(name, 1, time.time() - t)
+        metric(name, 1, _seconds(clock() - t))
         yield x
 
     yield from it
 
+class _instrument_decorator(object): # must be a class for descriptor magic to work
+    """descriptor for measuring functions & methods
+
+    :arg func: the function to measure
+    :arg str name: name for the metric, or None to infer one
+    :arg instrumenter: f(name, *args, **kwargs), which calls ``func`` & records a metric
+
+    Methods & their metric names are created once per class and bound with
+    :class:`types.MethodType`, like a plain function, to keep attribute access cheap.
+
+    If ``instrumenter`` is a coroutine function, methods made from the
+    descriptor are ``async def`` functions, which
+    :func:`inspect.iscoroutinefunction` recognizes. The descriptor itself is
+    marked as a coroutine function, but as it isn't a function object,
+    :func:`inspect.iscoroutinefunction` only recognizes that on Python 3.12+;
+    before then, only the deprecated :func:`asyncio.iscoroutinefunction` does.
+    """
+
+    def __init__(self, func, name, instrumenter):
+        wraps(func)(self)
+        self.func = func
+        self.name = name
+        self.name_ = name if name is not None else func.__module__ + '.' +func.__name__
+        self.instrumenter = instrumenter
+        self.methods = weakref.WeakKeyDictionary() # class -> method, not keeping classes alive
+        self.is_coroutine = inspect.iscoroutinefunction(instrumenter)
+        if self.is_coroutine:
+            _mark_coroutine_function(self)
+
+    def __call__(self, *args, **kwargs):
+        return self.instrumenter(self.name_, *args, **kwargs)
+
+    def __get__(self, instance, class_):
+        try:
+            method = self.methods[class_]
+        except KeyError:
+            method = self.methods[class_] = self._make_method(class_)
+        return method if instance is None else MethodType(method, instance)
+
+    def _make_method(self, class_):
+        name_ = self.name if self.name is not None else\
+            ".".join((class_.__module__, class_.__name__, self.func.__name__))
+        instrumenter = self.instrumenter
+
+        if self.is_coroutine:
+            @wraps(self.func)
+            async def wrapped_method(*args, **kwargs):
+                return await instrumenter(name_, *args, **kwargs)
+        else:
+            @wraps(self.func)
+            def wrapped_method(*args, **kwargs):
+                return instrumenter(name_, *args, **kwargs)
+        return wrapped_method
+
+def _mark_coroutine_function(obj):
+    """mark a callable object as a coroutine function"""
+    if hasattr(inspect, 'markcoroutinefunction'):
+        # python 3.12+
+        inspect.markcoroutinefunction(obj)
+    else:
+        # recognized by asyncio.iscoroutinefunction, but not inspect's
+        obj._is_coroutine = asyncio.coroutines._is_coroutine
+
 def _make_decorator(measuring_func):
     """morass of closures for making decorators/descriptors"""
     def _decorator(name = None, metric = call_default):
         def wrapper(func):
+            def instrumenter(name_, *args, **kwargs):
+                return measuring_func(func(*args, **kwargs), name_, metric)
 
-            name_ = name if name is not None else func.__module__ + '.' +func.__name__
-            class instrument_decorator(object): # must be a class for descriptor magic to work
-                @wraps(func)
-                def __call__(self, *args, **kwargs):
-                    return measuring_func(func(*args, **kwargs), name_, metric)
-
-                def __get__(self, instance, class_):
-                    name_ = name if name is not None else\
-                        ".".join((class_.__module__, class_.__name__, func.__name__))
-                    @wraps(func)
-                    def wrapped_method(*args, **kwargs):
-                        return measuring_func(func(instance, *args, **kwargs), name_, metric)
-                    return wrapped_method
-            return instrument_decorator()
+            return _instrument_decorator(func, name, instrumenter)
 
         return wrapper
     return _decorator
@@ -201,7 +352,8 @@ def reducer(*, name = None, metric = call_default):
             self.orig_func = func
             self.wrapping = wraps(func)
             self.metric_name = name if name is not None else func.__module__ + '.' +func.__name__
-            self.varargs = inspect.getargspec(func).varargs is not None
+            self.varargs = inspect.getfullargspec(func).varargs is not None
+            self.methods = weakref.WeakKeyDictionary() # class -> method, not keeping classes alive
             if self.varargs:
                 self.method = _varargs_to_iterable_method(func)
                 self.func = _varargs_to_iterable_func(func)
@@ -218,28 +370,49 @@ def reducer(*, name = None, metric = call_default):
 
         def _call(self, iterable, **kwargs):
             it = counted_iterable(iterable)
-            t = time.time()
+            if track_spans:
+                span = _push_span(self.metric_name)
+                t = clock()
+                try:
+                    return self.func(it, **kwargs)
+                finally:
+                    _pop_span(span, metric, it.count, clock() - t)
+
+            t = clock()
             try:
                 return self.func(it, **kwargs)
             finally:
-                metric(self.metric_name, it.count, time.time() - t)
+                metric(self.metric_name, it.count, _seconds(clock() - t))
 
         def __get__(self, instance, class_):
+            try:
+                method = self.methods[class_]
+            except KeyError:
+                method = self.methods[class_] = self._make_method(class_)
+            return method if instance is None else MethodType(method, instance)
+
+        def _make_method(self, class_):
             metric_name = name if name is not None else\
                 ".".join((class_.__module__, class_.__name__, self.orig_func.__name__))
 
-            def wrapped_method(iterable, **kwargs):
+            def wrapped_method(instance, iterable, **kwargs):
                 it = counted_iterable(iterable)
-                t = time.time()
+                if track_spans:
+                    span = _push_span(metric_name)
+                    t = clock()
+                    try:
+                        return self.method(instance, it, **kwargs)
+                    finally:
+                        _pop_span(span, metric, it.count, clock() - t)
+
+                t = clock()
                 try:
                     return self.method(instance, it, **kwargs)
                 finally:
-                    metric(metric_name, it.count, time.time() - t)
+                    metric(metric_name, it.count, _seconds(clock() - t))
 
-            # wrap in func version b/c self is handled for us by descriptor (ie, `instance`)
-            if self.varargs: wrapped_method = _iterable_to_varargs_func(wrapped_method)
-            wrapped_method = self.wrapping(wrapped_method)
-            return wrapped_method
+            if self.varargs: wrapped_method = _iterable_to_varargs_method(wrapped_method)
+            return self.wrapping(wrapped_method)
 
     return instrument_reducer_decorator
 
@@ -248,71 +421,110 @@ def producer(*, name = None, metric = call_default):
 
     The function should return an object that supports ``__len__`` (ie, a
     list). If the function returns an iterator, use :func:`all` instead.
+    Coroutine functions (``async def``) are measured until their result is
+    available. Before Python 3.12, :func:`inspect.iscoroutinefunction` is
+    false for the decorated function, though not for methods made from it.
 
     :arg function metric: f(name, count, total_time)
     :arg str name: name for the metric
     """
 
     def wrapper(func):
-        def instrumenter(name_, *args, **kwargs):
-            t = time.time()
-            try:
-                ret = func(*args, **kwargs)
-            except Exception:
-                # record a metric for other exceptions, than raise
-                metric(name_, 0, time.time() - t)
-                raise
-            else:
-                # normal path, record metric & return
-                metric(name_, len(ret), time.time() - t)
-                return ret
-
-        name_ = name if name is not None else func.__module__ + '.' +func.__name__
-        class instrument_decorator(object): # must be a class for descriptor magic to work
-            @wraps(func)
-            def __call__(self, *args, **kwargs):
-                return instrumenter(name_, *args, **kwargs)
-
-            def __get__(self, instance, class_):
-                name_ = name if name is not None else\
-                    ".".join((class_.__module__, class_.__name__, func.__name__))
-                @wraps(func)
-                def wrapped_method(*args, **kwargs):
-                    return instrumenter(name_, instance, *args, **kwargs)
-                return wrapped_method
-
-        return instrument_decorator()
+        if inspect.iscoroutinefunction(func):
+            async def instrumenter(name_, *args, **kwargs):
+                if track_spans:
+                    span = _push_span(name_)
+                    t = clock()
+                    count = 0
+                    try:
+                        ret = await func(*args, **kwargs)
+                        count = len(ret)
+                        return ret
+                    finally:
+                        _pop_span(span, metric, count, clock() - t)
+
+                t = clock()
+                try:
+                    ret = await func(*args, **kwargs)
+                except Exception:
+                    # record a metric for other exceptions, than raise
+                    metric(name_, 0, _seconds(clock() - t))
+                    raise
+                else:
+                    # normal path, record metric & return
+                    metric(name_, len(ret), _seconds(clock() - t))
+                    return ret
+        else:
+            def instrumenter(name_, *args, **kwargs):
+                if track_spans:
+                    span = _push_span(name_)
+                    t = clock()
+                    count = 0
+                    try:
+                        ret = func(*args, **kwargs)
+                        count = len(ret)
+                        return ret
+                    finally:
+                        _pop_span(span, metric, count, clock() - t)
+
+                t = clock()
+                try:
+                    ret = func(*args, **kwargs)
+                except Exception:
+                    # record a metric for other exceptions, than raise
+                    metric(name_, 0, _seconds(clock() - t))
+                    raise
+                else:
+                    # normal path, record metric & return
+                    metric(name_, len(ret), _seconds(clock() - t))
+                    return ret
+
+        return _instrument_decorator(func, name, instrumenter)
     return wrapper
 
 def function(*, name = None, metric = call_default):
     """Decorator to measure function execution time.
 
+    Coroutine functions (``async def``) are measured until their result is
+    available. Before Python 3.12, :func:`inspect.iscoroutinefunction` is
+    false for the decorated function, though not for methods made from it.
+
     :arg function metric: f(name, 1, total_time)
     :arg str name: name for the metric
     """
     def wrapper(func):
-        def instrumenter(name_, *args, **kwargs):
-            t = time.time()
-            try:
-                return func(*args, **kwargs)
-            finally:
-                metric(name_, 1, time.time() - t)
-
-        name_ = name if name is not None else func.__module__ + '.' +func.__name__
-        class instrument_decorator(object): # must be a class for descriptor magic to work
-            @wraps(func)
-            def __call__(self, *args, **kwargs):
-                return instrumenter(name_, *args, **kwargs)
-
-            def __get__(self, instance, class_):
-                name_ = name if name is not None else\
-                    ".".join((class_.__module__, class_.__name__, func.__name__))
-                @wraps(func)
-                def wrapped_method(*args, **kwargs):
-                    return instrumenter(name_, instance, *args, **kwargs)
-                return wrapped_method
+        if inspect.iscoroutinefunction(func):
+            async def instrumenter(name_, *args, **kwargs):
+                if track_spans:
+                    span = _push_span(name_)
+                    t = clock()
+                    try:
+                        return await func(*args, **kwargs)
+                    finally:
+                        _pop_span(span, metric, 1, clock() - t)
+
+                t = clock()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    metric(name_, 1, _seconds(clock() - t))
+        else:
+            def instrumenter(name_, *args, **kwargs):
+                if track_spans:
+                    span = _push_span(name_)
+                    t = clock()
+                    try:
+                        return func(*args, **kwargs)
+                    finally:
+                        _pop_span(span, metric, 1, clock() - t)
+
+                t = clock()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    metric(name_, 1, _seconds(clock() - t))
 
-        return instrument_decorator()
+        return _instrument_decorator(func, name, instrumenter)
     return wrapper
 
 @contextmanager
@@ -323,8 +535,17 @@ def block(*, name = None, metric = call_default, count = 1):
     :arg str name: name for the metric
     :arg int count: user-supplied number of items, defaults to 1
     """
-    t = time.time()
+    if track_spans:
+        span = _push_span(name)
+        t = clock()
+        try:
+            yield
+        finally:
+            _pop_span(span, metric, count, clock() - t)
+        return
+
+    t = clock()
     try:
         yield
     finally:
-        metric(name, count, time.time() - t)
+        metric(name, count, _seconds(clock() - t))
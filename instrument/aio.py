@@ -0,0 +1,138 @@
+"""asyncio counterparts of measurement functions
+
+:func:`all`, :func:`each` and :func:`first` measure asynchronous iterables
+(consumed with ``async for``) and :func:`block` measures ``async with``
+blocks. Elapsed time is wall clock time, including time spent running other
+tasks while awaiting. :func:`instrument.function` and
+:func:`instrument.producer` measure coroutine functions directly.
+"""
+from contextlib import asynccontextmanager
+
+import instrument
+from . import call_default, function, producer, _make_decorator, _seconds, _push_span, _pop_span
+
+__all__ = ['all', 'each', 'first', 'function', 'producer', 'block']
+
+async def _do_all(iterable, name, metric):
+    total_time = 0
+    count = 0
+    it = iterable.__aiter__()
+    try:
+        while True:
+            t = instrument.clock()
+            try:
+                x = await it.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                total_time += instrument.clock() - t
+            count += 1
+            yield x
+    finally:
+        # underlying iterable is exhausted or errored. Record the `metric` and
+        # allow exception to propogate
+        metric(name, count, _seconds(total_time))
+
+async def _do_each(iterable, name, metric):
+    it = iterable.__aiter__()
+    while True:
+        t = instrument.clock()
+        try:
+            x = await it.__anext__()
+        except StopAsyncIteration:
+            # don't record a metric for final __anext__() call
+            return
+        except Exception:
+            # record a metric for other exceptions, than raise
+            metric(name, 1, _seconds(instrument.clock() - t))
+            raise
+        else:
+            # normal path, record metric and yield
+            metric(name, 1, _seconds(instrument.clock() - t))
+            yield x
+
+async def _do_first(iterable, name, metric):
+    it = iterable.__aiter__()
+    t = instrument.clock()
+    try:
+        x = await it.__anext__()
+    except StopAsyncIteration:
+        # don't record a metric for final __anext__() call
+        return
+    except Exception:
+        # record a metric for other exceptions, than raise
+        metric(name, 1, _seconds(instrument.clock() - t))
+        raise
+    else:
+        # normal path, record metric and yield
+        metric(name, 1, _seconds(instrument.clock() - t))
+        yield x
+
+    async for x in it:
+        yield x
+
+# decorator variants, for async generator functions
+_iter_decorator = _make_decorator(_do_all)
+_each_decorator = _make_decorator(_do_each)
+_first_decorator = _make_decorator(_do_first)
+
+def all(iterable = None, *, name = None, metric = call_default):
+    """Measure total time and item count for consuming an async iterable
+
+    :arg iterable: any async iterable
+    :arg function metric: f(name, count, total_time)
+    :arg str name: name for the metric
+    """
+    if iterable is None:
+        return _iter_decorator(name, metric)
+    else:
+        return _do_all(iterable, name, metric)
+
+
+def each(iterable = None, *, name = None, metric = call_default):
+    """Measure time elapsed to produce each item of an async iterable
+
+    :arg iterable: any async iterable
+    :arg function metric: f(name, 1, time)
+    :arg str name: name for the metric
+    """
+    if iterable is None:
+        return _each_decorator(name, metric)
+    else:
+        return _do_each(iterable, name, metric)
+
+
+def first(iterable = None, *, name = None, metric = call_default):
+    """Measure time elapsed to produce first item of an async iterable
+
+    :arg iterable: any async iterable
+    :arg function metric: f(name, 1, time)
+    :arg str name: name for the metric
+    """
+    if iterable is None:
+        return _first_decorator(name, metric)
+    else:
+        return _do_first(iterable, name, metric)
+
+@asynccontextmanager
+async def block(*, name = None, metric = call_default, count = 1):
+    """Async context manager to measure execution time of an ``async with`` block
+
+    :arg function metric: f(name, 1, time)
+    :arg str name: name for the metric
+    :arg int count: user-supplied number of items, defaults to 1
+    """
+    if instrument.track_spans:
+        span = _push_span(name)
+        t = instrument.clock()
+        try:
+            yield
+        finally:
+            _pop_span(span, metric, count, instrument.clock() - t)
+        return
+
+    t = instrument.clock()
+    try:
+        yield
+    finally:
+        metric(name, count, _seconds(instrument.clock() - t))
@@ -0,0 +1,218 @@
+"""measure queries to `DB-API <https://www.python.org/dev/peps/pep-0249/>`__ databases
+
+Wrap a connection with :func:`connect`. Cursors made from it record metrics
+named after a :func:`fingerprint` of the SQL statement most recently
+executed:
+
+* ``<prefix>.<fingerprint>.execute``: time for each ``execute()``
+* ``<prefix>.<fingerprint>.executemany``: time & number of parameter sets for each ``executemany()``
+* ``<prefix>.<fingerprint>.fetch``: time & number of rows for each ``fetchone()``,
+  ``fetchmany()`` and ``fetchall()``, as with :func:`instrument.producer`, or
+  for iterating over the cursor, as with :func:`instrument.all`
+"""
+import re
+import functools
+
+import instrument
+from . import call_default, counted_iterable, _do_all, _seconds
+
+__all__ = ['connect', 'fingerprint']
+
+_comments = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_identifier = r'((?:[\w$]+|"[^"]+"|`[^`]+`|\[[^\]]+\])(?:\s*\.\s*(?:[\w$]+|"[^"]+"|`[^`]+`|\[[^\]]+\]))*)'
+_tables = {
+    'select': re.compile(r'\bfrom\s+' + _identifier, re.I),
+    'delete': re.compile(r'\bfrom\s+' + _identifier, re.I),
+    'insert': re.compile(r'\binto\s+' + _identifier, re.I),
+    'replace': re.compile(r'\binto\s+' + _identifier, re.I),
+    'update': re.compile(r'^\s*update\s+(?:or\s+\w+\s+)?' + _identifier, re.I),
+    'create': re.compile(r'\b(?:table|index|view|trigger)\s+(?:if\s+not\s+exists\s+)?' + _identifier, re.I),
+    'drop': re.compile(r'\b(?:table|index|view|trigger)\s+(?:if\s+exists\s+)?' + _identifier, re.I),
+    'alter': re.compile(r'\btable\s+' + _identifier, re.I),
+}
+
+def fingerprint(sql, context = None):
+    """name a SQL statement by its type & main table
+
+    Results are cached, so repeated statements are only parsed once.
+
+    >>> fingerprint('SELECT * FROM users WHERE id = ?')
+    'select.users'
+
+    Statements may also be bytes, which are decoded as UTF-8, or composed
+    SQL objects, like those of :mod:`psycopg2.sql`, which are rendered with
+    their ``as_string(context)`` method if ``context`` is given, or else
+    ``str()``.
+
+    :arg str sql: SQL statement
+    :arg context: connection or cursor to render composed SQL objects with, or None
+    :return: lowercase statement type, followed by a table name if one is found
+    :rtype: str
+    """
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    elif not isinstance(sql, str):
+        as_string = getattr(sql, 'as_string', None)
+        sql = as_string(context) if as_string is not None and context is not None else str(sql)
+    return _fingerprint(sql)
+
+@functools.lru_cache(maxsize=1024)
+def _fingerprint(sql):
+    """:func:`fingerprint` of a str. For internal use only."""
+    sql = _comments.sub(' ', sql).strip()
+    words = sql.split(None, 1)
+    if not words:
+        return 'empty'
+    kind = words[0].lower()
+    if kind == 'with':
+        # common table expression; name by the main statement
+        match = re.search(r'\)\s*(select|insert|update|delete|replace)\b', sql, re.I)
+        if match is not None:
+            kind = match.group(1).lower()
+            sql = sql[match.start(1):]
+
+    regex = _tables.get(kind)
+    match = regex.search(sql) if regex is not None else None
+    if match is None:
+        return re.sub(r'\W', '_', kind)
+    table = re.sub(r'\s+|["`\[\]]', '', match.group(1)).lower()
+    return '%s.%s' % (kind, table)
+
+fingerprint.cache_info = _fingerprint.cache_info
+fingerprint.cache_clear = _fingerprint.cache_clear
+
+def connect(connection, *, metric = call_default, prefix = 'sql'):
+    """Measure queries made with a DB-API connection
+
+    :arg connection: a DB-API connection, such as from :func:`sqlite3.connect`
+    :arg function metric: f(name, count, time)
+    :arg str prefix: prefix for metric names. Defaults to ``sql``.
+    :return: a proxy for ``connection``
+    """
+    return Connection(connection, metric, prefix)
+
+class Connection(object):
+    """proxy for a DB-API connection, making measured cursors. Create with :func:`connect`."""
+
+    def __init__(self, connection, metric, prefix):
+        self._connection = connection
+        self._metric = metric
+        self._prefix = prefix
+
+    def __getattr__(self, attr):
+        return getattr(self._connection, attr)
+
+    def __setattr__(self, attr, value):
+        # our own state is private; anything else, like row_factory, is the wrapped object's
+        if attr.startswith('_'):
+            object.__setattr__(self, attr, value)
+        else:
+            setattr(self._connection, attr, value)
+
+    def __delattr__(self, attr):
+        if attr.startswith('_'):
+            object.__delattr__(self, attr)
+        else:
+            delattr(self._connection, attr)
+
+    def __enter__(self):
+        self._connection.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._connection.__exit__(*exc_info)
+
+    def cursor(self, *args, **kwargs):
+        """:return: a measured cursor"""
+        return Cursor(self._connection.cursor(*args, **kwargs), self._metric, self._prefix)
+
+    def execute(self, sql, *args):
+        """execute a statement with a new measured cursor, as :meth:`sqlite3.Connection.execute`"""
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, seq_of_parameters):
+        """execute a statement with a new measured cursor, as :meth:`sqlite3.Connection.executemany`"""
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+class Cursor(object):
+    """proxy for a DB-API cursor, measuring queries. Create with :meth:`Connection.cursor`."""
+
+    def __init__(self, cursor, metric, prefix):
+        self._cursor = cursor
+        self._metric = metric
+        self._prefix = prefix
+        self._name = prefix + '.unknown'
+
+    def __getattr__(self, attr):
+        return getattr(self._cursor, attr)
+
+    def __setattr__(self, attr, value):
+        # our own state is private; anything else, like row_factory, is the wrapped object's
+        if attr.startswith('_'):
+            object.__setattr__(self, attr, value)
+        else:
+            setattr(self._cursor, attr, value)
+
+    def __delattr__(self, attr):
+        if attr.startswith('_'):
+            object.__delattr__(self, attr)
+        else:
+            delattr(self._cursor, attr)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def execute(self, sql, *args):
+        self._name = self._prefix + '.' + fingerprint(sql, self._cursor)
+        t = instrument.clock()
+        try:
+            self._cursor.execute(sql, *args)
+        finally:
+            self._metric(self._name + '.execute', 1, _seconds(instrument.clock() - t))
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._name = self._prefix + '.' + fingerprint(sql, self._cursor)
+        if hasattr(seq_of_parameters, '__len__'):
+            # some drivers require a sequence
+            count = len(seq_of_parameters)
+        else:
+            seq_of_parameters = counted_iterable(seq_of_parameters)
+        t = instrument.clock()
+        try:
+            self._cursor.executemany(sql, seq_of_parameters)
+        finally:
+            if isinstance(seq_of_parameters, counted_iterable):
+                count = seq_of_parameters.count
+            self._metric(self._name + '.executemany', count, _seconds(instrument.clock() - t))
+        return self
+
+    def fetchone(self):
+        t = instrument.clock()
+        row = None
+        try:
+            row = self._cursor.fetchone()
+            return row
+        finally:
+            self._metric(self._name + '.fetch', int(row is not None), _seconds(instrument.clock() - t))
+
+    def _fetch(self, fetch, *args):
+        t = instrument.clock()
+        rows = ()
+        try:
+            rows = fetch(*args)
+            return rows
+        finally:
+            self._metric(self._name + '.fetch', len(rows), _seconds(instrument.clock() - t))
+
+    def fetchmany(self, *args):
+        return self._fetch(self._cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def __iter__(self):
+        return _do_all(self._cursor, self._name + '.fetch', self._metric)
@@ -0,0 +1,137 @@
+"""measure outgoing HTTP requests made with :mod:`http.client` & :mod:`urllib.request`
+
+:func:`install` patches :class:`http.client.HTTPConnection` (and so
+:class:`~http.client.HTTPSConnection` and :func:`urllib.request.urlopen`) to
+record three metrics per request, named after the host & request method:
+
+* ``<prefix>.<host>.<method>.connect``: time to open a connection, including any TLS handshake
+* ``<prefix>.<host>.<method>.first``: time from sending the request to receiving
+  the response headers, as with :func:`instrument.first`
+* ``<prefix>.<host>.<method>.all``: total time reading the response body, with
+  the number of bytes read as ``count``, as with :func:`instrument.all`.
+  Recorded when the body is fully read or the response is closed.
+
+The port is included in the host if it isn't the default for the scheme.
+"""
+import http.client
+from functools import wraps
+
+import instrument
+from . import call_default, _seconds
+
+__all__ = ['install', 'uninstall']
+
+_patched = {} # (class, attribute) -> original
+
+def _name(conn, prefix):
+    host = conn.host if conn.port == conn.default_port else '%s:%d' % (conn.host, conn.port)
+    return '.'.join((prefix, host, conn._method or 'GET'))
+
+def _patch(class_, attr, make_wrapper):
+    original = class_.__dict__[attr]
+    _patched[(class_, attr)] = original
+    setattr(class_, attr, wraps(original)(make_wrapper(original)))
+
+def install(*, metric = call_default, prefix = 'http'):
+    """Start measuring HTTP requests
+
+    :arg function metric: f(name, count, time)
+    :arg str prefix: prefix for metric names. Defaults to ``http``.
+    """
+    uninstall()
+
+    def connect(original):
+        def connect(self):
+            if getattr(self, '_instrument_connecting', False):
+                # HTTPSConnection.connect calls HTTPConnection.connect
+                return original(self)
+            self._instrument_connecting = True
+            t = instrument.clock()
+            try:
+                return original(self)
+            finally:
+                self._instrument_connecting = False
+                metric(_name(self, prefix) + '.connect', 1, _seconds(instrument.clock() - t))
+        return connect
+
+    def getresponse(original):
+        def getresponse(self):
+            name = _name(self, prefix)
+            t = instrument.clock()
+            try:
+                response = original(self)
+            finally:
+                metric(name + '.first', 1, _seconds(instrument.clock() - t))
+            response._instrument = body = _Body(name, metric)
+            if response.fp is None:
+                # no body, as for HEAD requests
+                body.closed = True
+                body.record()
+            return response
+        return getresponse
+
+    def reader(original, size):
+        def read(self, *args, **kwargs):
+            body = getattr(self, '_instrument', None)
+            if body is None:
+                return original(self, *args, **kwargs)
+
+            # only measure the outermost call, as read() may use readinto()
+            body.depth += 1
+            t = instrument.clock()
+            ret = None
+            try:
+                ret = original(self, *args, **kwargs)
+                return ret
+            finally:
+                body.depth -= 1
+                if not body.depth:
+                    body.total_time += instrument.clock() - t
+                    if ret is not None:
+                        body.count += size(ret)
+                    if body.closed:
+                        body.record()
+        return read
+
+    def closer(original):
+        def close(self):
+            try:
+                return original(self)
+            finally:
+                body = getattr(self, '_instrument', None)
+                if body is not None and not body.closed:
+                    body.closed = True
+                    if not body.depth:
+                        # otherwise, recorded once the outermost read finishes
+                        body.record()
+        return close
+
+    _patch(http.client.HTTPConnection, 'connect', connect)
+    _patch(http.client.HTTPSConnection, 'connect', connect)
+    _patch(http.client.HTTPConnection, 'getresponse', getresponse)
+    for attr in ('read', 'read1', 'readline'):
+        _patch(http.client.HTTPResponse, attr, lambda original: reader(original, len))
+    _patch(http.client.HTTPResponse, 'readinto', lambda original: reader(original, int))
+    # the body is finished when the response releases its connection
+    _patch(http.client.HTTPResponse, '_close_conn', closer)
+    _patch(http.client.HTTPResponse, 'close', closer)
+
+def uninstall():
+    """Stop measuring HTTP requests"""
+    while _patched:
+        (class_, attr), original = _patched.popitem()
+        setattr(class_, attr, original)
+
+class _Body(object):
+    """measures reading of a response body"""
+
+    def __init__(self, name, metric):
+        self.name = name
+        self.metric = metric
+        self.count = 0
+        self.total_time = 0
+        self.depth = 0
+        self.closed = False
+
+    def record(self):
+        self.metric(self.name + '.all', self.count, _seconds(self.total_time))
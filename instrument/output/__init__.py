@@ -1,4 +1,6 @@
+import re
 import sys
+import fnmatch
 
 def _do_print(name, count, elapsed, file):
     if name is not None:
@@ -35,3 +37,51 @@ def make_multi_metric(*metrics):
         for m in metrics:
             m(name, count, elapsed)
     return multi_metric
+
+def _drop_metric(name, count, elapsed):
+    pass
+
+def make_routing_metric(routes, default = None, max_names = 10000):
+    """Make a new metric function that sends each name to the metric of its first matching route
+
+    Routes are matched once per distinct name, and the result cached, so
+    recording a metric costs only a dict lookup. Unnamed metrics go to
+    ``default``. At most ``max_names`` names are cached; others are matched
+    on each call.
+
+    >>> route = make_routing_metric([('db.*', print_metric), (re.compile(r'.*\\.debug$'), None)])
+    >>> route('db.query', 1, 0.25)
+    db.query: 1 items in 0.25 seconds
+    >>> route('cache.debug', 1, 0.25)
+
+    :arg routes: (pattern, metric) pairs. A pattern is a glob string, matched as by :func:`fnmatch.fnmatchcase`, or a compiled regular expression, matched with ``match()``. A metric of None drops matching names.
+    :arg function default: metric for names that match no route, or None to drop them. Defaults to None.
+    :arg int max_names: maximum number of names to cache. Defaults to 10000.
+    :rtype: function
+    """
+    compiled = []
+    for pattern, metric in routes:
+        if isinstance(pattern, str):
+            pattern = re.compile(fnmatch.translate(pattern))
+        compiled.append((pattern, metric if metric is not None else _drop_metric))
+    default = default if default is not None else _drop_metric
+    cache = {None: default}
+
+    def resolve(name):
+        for pattern, metric in compiled:
+            if pattern.match(name):
+                break
+        else:
+            metric = default
+        if len(cache) < max_names:
+            cache[name] = metric
+        return metric
+
+    def routing_metric(name, count, elapsed):
+        """Calls the metric routed for name (closure)"""
+        try:
+            metric = cache[name]
+        except KeyError:
+            metric = resolve(name)
+        metric(name, count, elapsed)
+    return routing_metric
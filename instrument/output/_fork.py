@@ -0,0 +1,67 @@
+"""helpers for using file-based metrics in forked processes. For internal use only."""
+import os
+import atexit
+from multiprocessing import util
+
+root_pid = os.getpid() #: process that first imported instrument; forked children save data for it
+
+def register(locks, flush, reset):
+    """register fork handlers that give forked children a consistent copy of an output
+
+    Before forking, ``locks()`` are acquired and ``flush()`` is called, so
+    buffered data is written and the child's copy of each buffer is empty.
+    Afterwards, the parent releases the locks, and the child calls
+    ``reset()``, which must replace the locks (they're held in the child's
+    copy) and switch to saving data for the parent.
+
+    :arg locks: function returning the locks to hold while forking
+    :arg flush: function called with the locks held, before forking
+    :arg reset: function called in the child, after forking
+    """
+    held = []
+
+    def before():
+        held[:] = locks()
+        for lock in held:
+            lock.acquire()
+        flush()
+
+    def after_in_parent():
+        for lock in held:
+            lock.release()
+        del held[:]
+
+    def after_in_child():
+        del held[:]
+        reset()
+
+    os.register_at_fork(before=before, after_in_parent=after_in_parent, after_in_child=after_in_child)
+
+def at_child_exit(obj, func):
+    """call ``func`` when a forked child process exits
+
+    ``multiprocessing`` children exit without running :mod:`atexit` handlers,
+    so ``func`` is registered as a multiprocessing finalizer too. Call from an
+    ``after_in_child`` fork handler.
+
+    :arg obj: object that owns ``func``; must support weak references
+    :arg func: function taking no arguments
+    """
+    atexit.unregister(func)
+    atexit.register(func)
+    # multiprocessing clears finalizers after forking, then runs after-fork hooks
+    util.register_after_fork(obj, lambda obj: util.Finalize(None, func, exitpriority=0))
+
+def child_paths(path):
+    """paths saved by forked children for ``path``, made with ``'%s.%d' % (path, pid)``
+
+    :rtype: list of str
+    """
+    dirname, basename = os.path.split(path)
+    try:
+        entries = os.listdir(dirname or '.')
+    except FileNotFoundError:
+        return []
+    prefix = basename + '.'
+    return sorted(os.path.join(dirname, e) for e in entries
+                  if e.startswith(prefix) and e[len(prefix):].isdigit())
@@ -1,4 +1,8 @@
 """numpy-based metrics"""
+import os
+import json
+import functools
+import shutil
 import struct
 import tempfile
 import warnings
@@ -7,6 +11,64 @@ import atexit
 
 import numpy as np
 
+import instrument
+from .. import _seconds
+from . import _fork
+
+_local = threading.local()
+
+@functools.lru_cache()
+def _extended_struct(fmt, extra):
+    """:return: a struct for ``fmt`` followed by ``extra`` doubles"""
+    return struct.Struct(fmt + 'd' * extra)
+
+class Moments(object):
+    """mergeable running moments, minimum, maximum & total for many metrics at once
+
+    Statistics are stored in arrays indexed by metric id. Each chunk of data
+    is merged using the parallel algorithm of Chan et al., so a single pass is
+    sufficient and chunks may be any size.
+
+    :arg int size: number of metric ids
+    """
+
+    def __init__(self, size):
+        self.n = np.zeros(size, np.int64)
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+        self.min = np.full(size, np.inf)
+        self.max = np.full(size, -np.inf)
+        self.total = np.zeros(size)
+
+    def update(self, ids, values):
+        """merge a chunk of data
+
+        :arg ids: array of metric ids
+        :arg values: array of values for each id
+        """
+        size = len(self.n)
+        values = values.astype(np.float64, copy=False)
+
+        n = np.bincount(ids, minlength=size)
+        sums = np.bincount(ids, values, size)
+        self.total += sums
+        mean = np.divide(sums, n, out=np.zeros(size), where=n > 0)
+        m2 = np.bincount(ids, (values - mean[ids]) ** 2, size)
+        np.minimum.at(self.min, ids, values)
+        np.maximum.at(self.max, ids, values)
+
+        total = self.n + n
+        weight = np.divide(n, total, out=np.zeros(size), where=total > 0)
+        delta = mean - self.mean
+        self.mean += delta * weight
+        self.m2 += m2 + delta ** 2 * self.n * weight
+        self.n = total
+
+    def __getitem__(self, id_):
+        """:return: a tuple of mean, standard deviation, minimum & maximum for a metric"""
+        n = self.n[id_]
+        return self.mean[id_], np.sqrt(self.m2[id_] / n), self.min[id_], self.max[id_]
+
 class NumpyMetric(object):
     """Base class for numpy-based metrics
 
@@ -15,24 +77,61 @@ class NumpyMetric(object):
     :func:`dump`. These are the only public methods. This is an abstract base
     class; you should use one of the concrete subclases instead.
 
-    Each metric consumes one open file and 32K of memory while running.
-    Output requires enough memory to load all data points for each metric.
+    All metrics of a class share a single open file (the arena), with metric
+    names interned as integer ids. Each recording thread buffers up to
+    :attr:`buffer_size` bytes without locking; buffers are merged into the
+    arena when full and at :func:`dump`, and dropped once their thread has
+    exited. Output reads the arena in chunks of
+    :attr:`chunk_size` records, so memory use is bounded regardless of the
+    number of data points.
+
+    Forked child processes (under ``multiprocessing`` or gunicorn, for example)
+    save their data to separate files when they exit. :func:`dump` in the
+    parent merges these, reporting statistics across all processes.
+
+    If :attr:`timestamps` is set, the start time of each sample (from
+    :data:`instrument.clock`, in seconds) is also recorded, and throughput is
+    reported in items per second over consecutive windows of :attr:`window`
+    seconds. Set it before recording any data. The start time is the time
+    :func:`metric` was called, less ``elapsed``; for :func:`instrument.all`,
+    whose ``elapsed`` excludes time spent between items, it's too late.
+
+    If :attr:`spans` is set, the self time of nested measurements (see
+    :data:`instrument.track_spans`) is also recorded and reported, excluding
+    time spent in enclosed measurements. Set it before recording any data.
 
     :cvar bool dump_atexit: automatically call :func:`dump` when the interpreter exits. Defaults to True.
     """
 
     dump_atexit = True
     calc_stats = True #: should mean/stddev be calculated?
-    struct = struct.Struct('<Id')
-    dtype = np.dtype([('count', np.uint32), ('elapsed', np.float64)])
+    timestamps = False #: should start times be recorded, for throughput?
+    window = 1.0 #: seconds in each throughput window
+    spans = False #: should self time of nested spans be recorded?
+    struct = struct.Struct('<IId')
+    dtype = np.dtype([('id', np.uint32), ('count', np.uint32), ('elapsed', np.float64)])
     lock = threading.Lock()
-    instances = None #: replace with dict in each subclass
+    buffer_size = 32768 #: bytes buffered in each thread before merging
+    chunk_size = 1 << 20 #: records read from the arena at a time during output
+    names = None #: replace with dict in each subclass, mapping names to ids
+    buffers = None #: replace with dict in each subclass, mapping threads to their buffers
+    arena = None #: shared file of all recorded data, created on first use
+    spool = None #: in forked children, directory to save data in for the parent
+    sources = [] #: files being read during output
+    rotating = False #: is output from :func:`rotate`?
 
-    mktemp = lambda self: tempfile.TemporaryFile(mode = 'w+b', buffering = 32768)
+    mktemp = staticmethod(lambda: tempfile.TemporaryFile(mode = 'w+b', buffering = 32768))
 
     def __init__(self, name):
         self.name = name
-        self.temp = self.mktemp()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.names is not None:
+            # concrete subclass
+            if 'lock' not in cls.__dict__:
+                cls.lock = threading.Lock()
+            _fork.register(lambda: [cls.lock], cls._flush_for_fork, cls._after_fork_in_child)
 
     @classmethod
     def metric(cls, name, count, elapsed):
@@ -42,56 +141,382 @@ class NumpyMetric(object):
         :arg int count: number of items
         :arg float elapsed: time in seconds
         """
+        cls.metric_at(name, count, elapsed, None)
+
+    @classmethod
+    def metric_at(cls, name, count, elapsed, end):
+        """Like :func:`metric`, for a measurement that ended earlier
+
+        Used by :class:`.QueuedMetric`, so recorded start times don't include
+        time spent on its queue.
+
+        :arg str name: name of the metric
+        :arg int count: number of items
+        :arg float elapsed: time in seconds
+        :arg int end: :data:`instrument.clock` when the measurement ended, or None for now
+        """
+
+        if name is None:
+            warnings.warn("Ignoring unnamed metric", stacklevel=4)
+            return
+
+        try:
+            buf = _local.buffers[cls]
+        except (AttributeError, KeyError):
+            buf = cls._register_thread()
+
+        try:
+            id_ = cls.names[name]
+        except KeyError:
+            with cls.lock:
+                id_ = cls.names.setdefault(name, len(cls.names))
+
+        if cls.timestamps or cls.spans:
+            buf += cls._pack(id_, count, elapsed, elapsed, end)
+        else:
+            buf += cls.struct.pack(id_, count, elapsed)
+
+        if len(buf) >= cls.buffer_size:
+            with cls.lock:
+                cls._merge(buf)
+
+    @classmethod
+    def span(cls, name, count, elapsed, self_elapsed, parent = None):
+        """A metric function for nested measurements. See :data:`instrument.track_spans`.
+
+        :arg str name: name of the metric
+        :arg int count: number of items
+        :arg float elapsed: time in seconds
+        :arg float self_elapsed: time in seconds, excluding enclosed measurements
+        :arg str parent: name of the enclosing measurement, or None
+        """
+        if not cls.spans:
+            return cls.metric(name, count, elapsed)
 
         if name is None:
             warnings.warn("Ignoring unnamed metric", stacklevel=3)
             return
 
+        # as in metric()
+        try:
+            buf = _local.buffers[cls]
+        except (AttributeError, KeyError):
+            buf = cls._register_thread()
+
+        try:
+            id_ = cls.names[name]
+        except KeyError:
+            with cls.lock:
+                id_ = cls.names.setdefault(name, len(cls.names))
+
+        buf += cls._pack(id_, count, elapsed, self_elapsed)
+
+        if len(buf) >= cls.buffer_size:
+            with cls.lock:
+                cls._merge(buf)
+
+    @classmethod
+    def _extra_fields(cls):
+        """names of optional float fields recorded after those of :attr:`dtype`. For internal use only."""
+        fields = []
+        if cls.timestamps:
+            fields.append('start')
+        if cls.spans:
+            fields.append('self_elapsed')
+        return fields
+
+    @classmethod
+    def _pack(cls, id_, count, elapsed, self_elapsed, end = None):
+        """pack a record with optional fields. For internal use only."""
+        values = [id_, count, elapsed]
+        if cls.timestamps:
+            if end is None:
+                end = instrument.clock()
+            values.append(_seconds(end) - elapsed)
+        if cls.spans:
+            values.append(self_elapsed)
+        return _extended_struct(cls.struct.format, len(values) - 3).pack(*values)
+
+    @classmethod
+    def _register_thread(cls):
+        """create a buffer for the current thread. For internal use only."""
+        if not hasattr(_local, 'buffers'):
+            _local.buffers = {}
+
+        buf = _local.buffers[cls] = bytearray()
         with cls.lock:
-            # register with atexit on first call
-            if cls.dump_atexit and not cls.instances:
+            # register with atexit on first call, or again once exited threads' buffers are dropped
+            if cls.dump_atexit and not cls.buffers:
+                atexit.unregister(cls.dump)
                 atexit.register(cls.dump)
+            cls._prune_threads()
+            cls.buffers[threading.current_thread()] = buf
+        return buf
+
+    @classmethod
+    def _prune_threads(cls):
+        """merge & drop buffers of threads that have exited. Call with lock held. For internal use only."""
+        for thread in [t for t in cls.buffers if not t.is_alive()]:
+            buf = cls.buffers.pop(thread)
+            if buf:
+                cls._merge(buf)
+
+    @classmethod
+    def _merge(cls, buf):
+        """move buffered data to the arena. Call with lock held. For internal use only."""
+        if cls.arena is None:
+            if cls.spool is None:
+                cls.arena = cls.mktemp()
+            else:
+                os.makedirs(cls.spool, exist_ok=True)
+                cls.arena = open(os.path.join(cls.spool, 'arena'), 'w+b', buffering=32768)
+
+        # the owning thread may append concurrently; only remove what we've written
+        n = len(buf)
+        cls.arena.write(buf[:n])
+        del buf[:n]
+
+    @classmethod
+    def _spool_path(cls):
+        """base path of directories for data from forked children. For internal use only."""
+        return os.path.join(tempfile.gettempdir(), 'instrument-%d-%s.%s' %
+                            (_fork.root_pid, cls.__module__, cls.__qualname__))
+
+    @classmethod
+    def _open_sources(cls):
+        """open the arena & data from forked children. Call with lock held. For internal use only.
+
+        :return: list of (file, remap) pairs, where remap is an array mapping a child's ids to ours, or None
+        """
+        sources = []
+        if cls.arena is not None:
+            cls.arena.flush()
+            sources.append((cls.arena, None))
 
+        for spool in _fork.child_paths(cls._spool_path()):
             try:
-                self = cls.instances[name]
-            except KeyError:
-                self = cls.instances[name] = cls(name)
+                with open(os.path.join(spool, 'names.json')) as fh:
+                    names = json.load(fh)
+                arena = open(os.path.join(spool, 'arena'), 'rb')
+            except FileNotFoundError:
+                continue # child hasn't saved any data
+
+            remap = np.zeros(len(names), np.uint32)
+            for name, id_ in names.items():
+                remap[id_] = cls.names.setdefault(name, len(cls.names))
+            sources.append((arena, remap))
+        return sources
+
+    @classmethod
+    def _record_dtype(cls):
+        """dtype of recorded data. For internal use only."""
+        return np.dtype(cls.dtype.descr + [(f, np.float64) for f in cls._extra_fields()])
+
+    @classmethod
+    def _chunks(cls):
+        """iterate over all data in chunks of records. For internal use only."""
+        dtype = cls._record_dtype()
+        for fh, remap in cls.sources:
+            fh.seek(0)
+            while True:
+                chunk = np.fromfile(fh, dtype, count=cls.chunk_size)
+                if not len(chunk):
+                    break
+                if remap is not None:
+                    chunk['id'] = remap[chunk['id']]
+                yield chunk
+
+    @classmethod
+    def _grouped_chunks(cls):
+        """iterate over (id, records) for each name in each chunk, in recorded order. For internal use only."""
+        for chunk in cls._chunks():
+            # a stable sort makes each name's data contiguous, in recorded order
+            chunk = chunk[np.argsort(chunk['id'], kind='stable')]
+            ids, starts = np.unique(chunk['id'], return_index=True)
+            stops = np.append(starts[1:], len(chunk))
+            for id_, start, stop in zip(ids, starts, stops):
+                yield id_, chunk[start:stop]
+
+    @classmethod
+    def _calc_stats(cls):
+        """make an instance for each recorded name, with statistics from a single pass. For internal use only."""
+        size = len(cls.names)
+        counts = Moments(size)
+        elapsed = Moments(size)
+        self_elapsed = Moments(size) if cls.spans and cls.calc_stats else None
+        first = np.full(size, np.inf)
+        last = np.full(size, -np.inf)
+        for chunk in cls._chunks():
+            if cls.calc_stats:
+                counts.update(chunk['id'], chunk['count'])
+                elapsed.update(chunk['id'], chunk['elapsed'])
+                if self_elapsed is not None:
+                    self_elapsed.update(chunk['id'], chunk['self_elapsed'])
+            else:
+                counts.n += np.bincount(chunk['id'], minlength=size)
+            if cls.timestamps:
+                np.minimum.at(first, chunk['id'], chunk['start'])
+                np.maximum.at(last, chunk['id'], chunk['start'])
+        # throughput windows of all metrics are aligned to the earliest sample
+        cls.t0 = first.min() if cls.timestamps and size else None
+
+        metrics = []
+        for name, id_ in cls.names.items():
+            if not counts.n[id_]:
+                continue
+            self = cls(name)
+            self.id = id_
+            self.samples = int(counts.n[id_])
+            if cls.calc_stats:
+                self.count_mean, self.count_std, self.count_min, self.count_max = counts[id_]
+                self.elapsed_mean, self.elapsed_std, self.elapsed_min, self.elapsed_max = elapsed[id_]
+                self.count_total, self.elapsed_total = counts.total[id_], elapsed.total[id_]
+            if self_elapsed is not None:
+                self.self_mean, self.self_std, self.self_min, self.self_max = self_elapsed[id_]
+            if cls.timestamps:
+                self.first, self.last = first[id_], last[id_]
+            metrics.append(self)
+        return metrics
+
+    @classmethod
+    def _needs_scan(cls):
+        """should :func:`_scan` make a second pass over the data? For internal use only."""
+        return cls.timestamps
+
+    @classmethod
+    def _scan(cls, metrics):
+        """make a second pass over the data, if needed, grouped by metric. For internal use only."""
+        if not cls._needs_scan(): return
+
+        by_id = {}
+        for self in metrics:
+            by_id[self.id] = self
+            self._scan_start()
+
+        for id_, arr in cls._grouped_chunks():
+            by_id[id_]._scan_chunk(arr)
+
+    def _scan_start(self):
+        """subclass hook, called for each metric before the second pass"""
+        if self.timestamps:
+            self.window_first = int((self.first - self.t0) // self.window)
+            windows = int((self.last - self.t0) // self.window) - self.window_first + 1
+            self.window_items = np.zeros(windows)
+
+    def _scan_chunk(self, arr):
+        """subclass hook, called with each run of the metric's records, in recorded order"""
+        if self.timestamps:
+            # each sample's items are counted in the window it started in
+            windows = ((arr['start'] - self.t0) // self.window).astype(np.int64) - self.window_first
+            self.window_items += np.bincount(windows, arr['count'], len(self.window_items))
 
-            self.temp.write(self.struct.pack(count, elapsed))
+    @property
+    def throughput(self):
+        """items per second in each window. Requires :attr:`timestamps`."""
+        return self.window_items / self.window
 
     @classmethod
     def dump(cls):
         """Output all recorded metrics"""
         with cls.lock:
-            if not cls.instances: return
-            atexit.unregister(cls.dump)
+            cls._flush()
+
+    @classmethod
+    def rotate(cls, keep = None):
+        """Output & reset all recorded metrics, keeping output from previous rotations.
+        See :class:`.Flusher`.
+
+        :arg int keep: number of previous outputs to keep, or None to keep all
+        """
+        with cls.lock:
+            if cls.spool is not None: return
+            cls.rotating = True
+            try:
+                output = cls._flush()
+            finally:
+                cls.rotating = False
+            if output:
+                cls._rotate(keep)
 
-            cls._pre_dump()
+    @classmethod
+    def _flush(cls):
+        """output all recorded metrics & start afresh. Call with lock held. For internal use only.
+
+        :return: whether anything was output
+        """
+        for buf in cls.buffers.values():
+            if buf:
+                cls._merge(buf)
+        cls._prune_threads()
 
-            for self in cls.instances.values():
-                self._dump()
+        if cls.spool is not None:
+            cls._save_spool()
+            return False
 
-            cls._post_dump()
+        cls.sources = cls._open_sources()
+        try:
+            metrics = cls._calc_stats()
+            if metrics:
+                cls._pre_dump()
+                cls._scan(metrics)
+
+                for self in metrics:
+                    self._dump()
+
+                cls._post_dump()
+        finally:
+            for fh, remap in cls.sources:
+                if fh is not cls.arena:
+                    fh.close()
+            cls.sources = []
+
+        # start afresh; data recorded after this is output by a later dump.
+        # If output failed, everything is kept for a later dump.
+        for spool in _fork.child_paths(cls._spool_path()):
+            shutil.rmtree(spool, ignore_errors=True)
+        if cls.arena is not None:
+            cls.arena.seek(0)
+            cls.arena.truncate()
+        return bool(metrics)
+
+    @classmethod
+    def _save_spool(cls):
+        """in a forked child, save data for the parent. Call with lock held. For internal use only."""
+        if cls.arena is None: return
+        cls.arena.flush()
+        tmp = os.path.join(cls.spool, 'names.tmp')
+        with open(tmp, 'w') as fh:
+            json.dump(cls.names, fh)
+        os.replace(tmp, os.path.join(cls.spool, 'names.json'))
+
+    @classmethod
+    def _flush_for_fork(cls):
+        """fork handler. Call with lock held. For internal use only."""
+        if cls.arena is not None:
+            cls.arena.flush()
+        if cls.dump_atexit and cls.spool is None:
+            # so the parent merges children's data, even if it doesn't record any
+            atexit.unregister(cls.dump)
+            atexit.register(cls.dump)
+
+    @classmethod
+    def _after_fork_in_child(cls):
+        """fork handler. Switches to saving data for the parent. For internal use only."""
+        cls.lock = threading.Lock()
+        if cls.arena is not None:
+            cls.arena.close() # flushed before fork, so nothing is written
+            cls.arena = None
+        for buf in cls.buffers.values():
+            del buf[:] # the parent's data
+        cls.spool = "%s.%d" % (cls._spool_path(), os.getpid())
+        _fork.at_child_exit(cls, cls.dump)
 
     def _dump(self):
         """dump data for an individual metric. For internal use only."""
 
         try:
-            self.temp.seek(0) # seek to beginning
-            arr = np.fromfile(self.temp, self.dtype)
-            self.count_arr = arr['count']
-            self.elapsed_arr = arr['elapsed']
-
-            if self.calc_stats:
-                # calculate mean & standard deviation
-                self.count_mean = np.mean(self.count_arr)
-                self.count_std = np.std(self.count_arr)
-                self.elapsed_mean = np.mean(self.elapsed_arr)
-                self.elapsed_std = np.std(self.elapsed_arr)
-
             self._output()
         finally:
-            self.temp.close()
             self._cleanup()
 
     @classmethod
@@ -104,6 +529,11 @@ class NumpyMetric(object):
         """subclass hook, called after dumping metrics"""
         pass
 
+    @classmethod
+    def _rotate(cls, keep):
+        """subclass hook, called after output by :func:`rotate`, to move it aside"""
+        pass
+
     def _output(self):
         """subclass hook, called to output a single metric"""
         pass
@@ -111,4 +541,3 @@ class NumpyMetric(object):
     def _cleanup(self):
         """subclass hook, called to clean up after outputting a single metric"""
         pass
-
@@ -0,0 +1,253 @@
+"""write metrics to a compact binary log
+
+A log is a 16 byte header followed by fixed-width 16 byte records: a metric
+id (little-endian uint32), item count (uint32) and elapsed time in seconds
+(float64). Metric names are interned: the first event for each name is
+preceded by a name record, with id ``0xFFFFFFFF`` and count set to the length
+of the UTF-8 encoded name, followed by the name padded with NULs to a whole
+number of records. Names are assigned ids from 0 in order of appearance.
+
+Writing requires only the standard library; :class:`BinaryLog` requires numpy.
+"""
+
+import warnings
+import os
+import threading
+import atexit
+import weakref
+import struct
+import csv
+
+from . import _fork, flush
+
+__all__ = ['BinaryFileMetric', 'BinaryLog']
+
+HEADER = b'instrument-log\x00\x01' #: magic & format version
+RECORD = struct.Struct('<IId')
+NAME = 0xFFFFFFFF #: id of name records
+
+def _name_record(name):
+    """:return: bytes defining a metric name"""
+    encoded = name.encode('utf-8')
+    padding = -len(encoded) % RECORD.size
+    return RECORD.pack(NAME, len(encoded), 0.0) + encoded + b'\x00' * padding
+
+def _events(fname):
+    """iterate over the events in a log, without numpy
+
+    :return: iterator of ``(name, count, elapsed)``
+    """
+    with open(fname, 'rb') as fh:
+        if fh.read(len(HEADER)) != HEADER:
+            raise ValueError("%s is not an instrument binary log" % fname)
+        names = []
+        while True:
+            rec = fh.read(RECORD.size)
+            if len(rec) < RECORD.size:
+                return # end of file, or a partially written record
+            id_, count, elapsed = RECORD.unpack(rec)
+            if id_ == NAME:
+                encoded = fh.read(count + -count % RECORD.size)[:count]
+                names.append(encoded.decode('utf-8'))
+            else:
+                yield names[id_], count, elapsed
+
+class BinaryFileMetric(object):
+    """Write metrics to a binary log file
+
+    A faster, smaller alternative to :class:`.CSVFileMetric`: each event is
+    written as a single packed record, with metric names interned. Read
+    the log with :class:`BinaryLog`.
+
+    Forked child processes write to a separate file, named after ``outfile``
+    and the child's process id. :func:`dump` in the parent appends these to
+    its own file.
+
+    :ivar outfile: file to save to. Defaults to ``./instrument.bin``.
+    :ivar dump_atexit: automatically call :func:`dump` when the interpreter exits. Defaults to True.
+    """
+
+    instances = weakref.WeakSet() #: for fork handlers
+
+    def __init__(self, outfile = "instrument.bin", dump_atexit = True):
+        self.outfile = os.path.abspath(outfile)
+
+        dirname = os.path.dirname(self.outfile)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        self.dump_atexit = dump_atexit
+        if dump_atexit:
+            atexit.register(self.dump)
+
+        self.lock = threading.Lock()
+        self._open(self.outfile)
+        self.child = False
+        self.instances.add(self)
+
+    def _open(self, fname):
+        """start a new log. For internal use only."""
+        self.fh = open(fname, 'wb', buffering=32768)
+        self.fh.write(HEADER)
+        self.names = {}
+
+    def _write(self, name, count, elapsed):
+        """write an event. Call with lock held. For internal use only."""
+        try:
+            id_ = self.names[name]
+        except KeyError:
+            id_ = self.names[name] = len(self.names)
+            self.fh.write(_name_record(name))
+        self.fh.write(RECORD.pack(id_, count, elapsed))
+
+    def metric(self, name, count, elapsed):
+        """A metric function that writes a binary log
+
+        :arg str name: name of the metric
+        :arg int count: number of items
+        :arg float elapsed: time in seconds
+        """
+        if name is None:
+            warnings.warn("Ignoring unnamed metric", stacklevel=3)
+            return
+
+        with self.lock:
+            self._write(name, count, elapsed)
+
+    def dump(self):
+        """Output all recorded metrics"""
+        with self.lock:
+            atexit.unregister(self.dump)
+            if self.fh.closed: return
+
+            if not self.child:
+                self._merge_children()
+
+            self.fh.close()
+
+    def rotate(self, keep = None):
+        """Move data recorded so far to a timestamped file & start afresh.
+        See :class:`.Flusher`.
+
+        :arg int keep: number of previous files to keep, or None to keep all
+        """
+        with self.lock:
+            if self.fh.closed or self.child or self.fh.tell() <= len(HEADER): return
+
+            self._merge_children()
+            self.fh.close()
+
+            os.replace(self.outfile, flush.rotated_path(self.outfile))
+            self._open(self.outfile)
+            flush.prune(self.outfile, keep)
+
+    def _merge_children(self):
+        """append logs written by forked children. Call with lock held. For internal use only."""
+        for fname in _fork.child_paths(self.outfile):
+            for event in _events(fname):
+                self._write(*event)
+            os.remove(fname)
+
+    @classmethod
+    def _flush_for_fork(cls):
+        """fork handler. Call with locks held. For internal use only."""
+        for self in cls.instances:
+            if not self.fh.closed:
+                self.fh.flush()
+
+    @classmethod
+    def _after_fork_in_child(cls):
+        """fork handler. Switches to saving data for the parent. For internal use only."""
+        for self in cls.instances:
+            self.lock = threading.Lock()
+            if self.fh.closed:
+                continue
+            self.fh.close() # flushed before fork, so nothing is written
+            self._open("%s.%d" % (self.outfile, os.getpid()))
+            self.child = True
+            _fork.at_child_exit(self, self.dump)
+
+_fork.register(lambda: [self.lock for self in BinaryFileMetric.instances],
+               BinaryFileMetric._flush_for_fork, BinaryFileMetric._after_fork_in_child)
+
+class BinaryLog(object):
+    """Read a binary log written by :class:`BinaryFileMetric`
+
+    The file is memory-mapped; events are read as numpy structured arrays with
+    fields ``id``, ``count`` and ``elapsed``, without copying.
+
+    :arg str fname: file to read
+    :ivar list names: metric names, indexed by id
+    :cvar int chunk_size: maximum number of records in each chunk. Defaults to 1M.
+    """
+
+    chunk_size = 1 << 20
+
+    def __init__(self, fname):
+        import numpy as np
+        self.fname = fname
+        self.dtype = np.dtype([('id', '<u4'), ('count', '<u4'), ('elapsed', '<f8')])
+
+        with open(fname, 'rb') as fh:
+            if fh.read(len(HEADER)) != HEADER:
+                raise ValueError("%s is not an instrument binary log" % fname)
+
+        # ignore a partially written record at the end
+        size = (os.path.getsize(fname) - len(HEADER)) // RECORD.size
+        if size:
+            self.records = np.memmap(fname, self.dtype, 'r', len(HEADER), (size,))
+        else:
+            self.records = np.empty(0, self.dtype) # can't map an empty file
+
+        self.names = []
+        self.segments = [] # (start, stop) of runs of event records
+        start = 0
+        for offset in range(0, size, self.chunk_size):
+            ids = self.records['id'][offset:offset + self.chunk_size]
+            # name bytes are UTF-8, which never contains 0xFF
+            for i in np.flatnonzero(ids == NAME) + offset:
+                n = int(self.records['count'][i])
+                stop = i + 1 + (n + RECORD.size - 1) // RECORD.size
+                self.names.append(self.records[i + 1:stop].tobytes()[:n].decode('utf-8'))
+                if i > start:
+                    self.segments.append((start, i))
+                start = stop
+        if size > start:
+            self.segments.append((start, size))
+
+    def __len__(self):
+        """number of events"""
+        return sum(stop - start for start, stop in self.segments)
+
+    def chunks(self):
+        """:return: iterator of structured arrays of events, each a view of at most :attr:`chunk_size` records"""
+        for start, stop in self.segments:
+            for offset in range(start, stop, self.chunk_size):
+                yield self.records[offset:min(offset + self.chunk_size, stop)]
+
+    def read(self):
+        """:return: a structured array of all events. This is a copy, unless events are contiguous."""
+        import numpy as np
+        if len(self.segments) == 1:
+            start, stop = self.segments[0]
+            return self.records[start:stop]
+        return np.concatenate([self.records[start:stop] for start, stop in self.segments]
+                              or [self.records[:0]])
+
+    def to_csv(self, outfile):
+        """Convert to CSV, in the format of :class:`.CSVFileMetric`
+
+        :arg str outfile: file to write
+        """
+        import numpy as np
+        names = np.array(self.names, dtype=object)
+        with open(outfile, 'w', newline='', buffering=32768) as fh:
+            writer = csv.writer(fh)
+            for chunk in self.chunks():
+                writer.writerows(zip(names[chunk['id']],
+                                     chunk['count'].tolist(),
+                                     map("%f".__mod__, chunk['elapsed'].tolist())))
+
+    def close(self):
+        """Unmap the file"""
+        self.records = self.records[:0].copy()
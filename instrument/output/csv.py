@@ -5,11 +5,15 @@ import os.path
 import shutil
 import threading
 import atexit
+import weakref
 import csv
+from collections import OrderedDict
+
+from . import _fork, flush
 
 __all__ = ['CSVDirMetric', 'CSVFileMetric']
 
-open_fh = lambda fname: open(fname, 'w', newline='', buffering=32768)
+open_fh = lambda fname, mode='w': open(fname, mode, newline='', buffering=32768)
 
 class CSVDirMetric(object):
     """Write metrics to multiple CSV files
@@ -18,21 +22,63 @@ class CSVDirMetric(object):
     classmethod :func:`metric` to a measurement function. Output using
     :func:`dump`.
 
-    Each metric consumes one open file and 32K of memory while running.
+    At most :attr:`max_open` files are kept open, each with 32K of buffer;
+    the least recently used file is closed when the limit is reached, and
+    reopened for appending when its metric is next recorded.
+
+    Forked child processes write to a separate directory, named after
+    ``outdir`` and the child's process id. :func:`dump` in the parent appends
+    these to its own files.
 
     :cvar bool dump_atexit: automatically call :func:`dump` when the interpreter exits. Defaults to True.
     :cvar str outdir: directory to save CSV files in. Defaults to ``./instrument_csv``.
+    :cvar int max_open: maximum number of open files, at least 1. Defaults to 256.
     """
     outdir = os.path.abspath("instrument_csv")
     dump_atexit = True
+    max_open = 256
 
     lock = threading.Lock()
     instances = {}
+    open_files = OrderedDict() #: instances with open files, least recently used first
+    started = False
+    spool = None #: in forked children, directory to save data in for the parent
 
     def __init__(self, name):
         self.name = name
-        self.fh = open_fh(os.path.join(self.outdir, ".".join((self.name, 'csv'))))
+        dirname = self.spool if self.spool is not None else self.outdir
+        self.fname = os.path.join(dirname, ".".join((self.name, 'csv')))
+        self.fh = self.writer = None
+        self.mode = 'w'
+
+    def open(self):
+        """open file, truncating it the first time. For internal use only."""
+        self.fh = open_fh(self.fname, self.mode)
         self.writer = csv.writer(self.fh)
+        self.mode = 'a'
+
+    def close(self):
+        """close file. For internal use only."""
+        self.fh.close()
+        self.fh = self.writer = None
+
+    @classmethod
+    def _open(cls, name):
+        """get an instance with an open file. Call with lock held. For internal use only."""
+        if cls.max_open < 1:
+            raise ValueError("max_open must be at least 1, not %r" % cls.max_open)
+
+        try:
+            self = cls.instances[name]
+        except KeyError:
+            self = cls.instances[name] = cls(name)
+
+        if len(cls.open_files) >= cls.max_open:
+            _, lru = cls.open_files.popitem(last=False)
+            lru.close() # flushes, so data is written in order
+        self.open()
+        cls.open_files[name] = self
+        return self
 
     @classmethod
     def metric(cls, name, count, elapsed):
@@ -48,17 +94,22 @@ class CSVDirMetric(object):
             return
 
         with cls.lock:
-            if not cls.instances:
+            if not cls.started:
                 # first call
-                shutil.rmtree(cls.outdir, ignore_errors=True)
-                os.makedirs(cls.outdir)
+                if cls.spool is not None:
+                    os.makedirs(cls.spool)
+                else:
+                    shutil.rmtree(cls.outdir, ignore_errors=True)
+                    os.makedirs(cls.outdir)
 
-                if cls.dump_atexit: atexit.register(cls.dump)
+                    if cls.dump_atexit: atexit.register(cls.dump)
+                cls.started = True
 
             try:
-                self = cls.instances[name]
+                self = cls.open_files[name]
+                cls.open_files.move_to_end(name)
             except KeyError:
-                self = cls.instances[name] = cls(name)
+                self = cls._open(name)
 
             self.writer.writerow((count, "%f"%elapsed))
 
@@ -66,11 +117,69 @@ class CSVDirMetric(object):
     def dump(cls):
         """Output all recorded metrics"""
         with cls.lock:
-            if not cls.instances: return
             atexit.unregister(cls.dump)
 
-            for self in cls.instances.values():
-                self.fh.close()
+            for self in cls.open_files.values():
+                self.close()
+            cls.open_files.clear()
+
+            if cls.spool is None:
+                cls._merge_children()
+
+    @classmethod
+    def rotate(cls, keep = None):
+        """Move files recorded so far to a timestamped directory & start afresh.
+        See :class:`.Flusher`.
+
+        :arg int keep: number of previous directories to keep, or None to keep all
+        """
+        with cls.lock:
+            if not cls.open_files or cls.spool is not None: return
+
+            for self in cls.open_files.values():
+                self.close()
+            cls.open_files.clear()
+            cls.instances.clear()
+            cls._merge_children()
+
+            os.replace(cls.outdir, flush.rotated_path(cls.outdir))
+            os.makedirs(cls.outdir)
+            flush.prune(cls.outdir, keep)
+
+    @classmethod
+    def _merge_children(cls):
+        """append files written by forked children. Call with lock held. For internal use only."""
+        for spool in _fork.child_paths(cls.outdir):
+            os.makedirs(cls.outdir, exist_ok=True)
+            for fname in sorted(os.listdir(spool)):
+                with open(os.path.join(spool, fname), 'rb') as src, \
+                        open(os.path.join(cls.outdir, fname), 'ab') as dst:
+                    shutil.copyfileobj(src, dst)
+            shutil.rmtree(spool)
+
+    @classmethod
+    def _flush_for_fork(cls):
+        """fork handler. Call with lock held. For internal use only."""
+        for self in cls.open_files.values():
+            self.fh.flush()
+        if cls.dump_atexit and cls.spool is None:
+            # so the parent merges children's data, even if it doesn't record any
+            atexit.unregister(cls.dump)
+            atexit.register(cls.dump)
+
+    @classmethod
+    def _after_fork_in_child(cls):
+        """fork handler. Switches to saving data for the parent. For internal use only."""
+        cls.lock = threading.Lock()
+        for self in cls.open_files.values():
+            self.fh.close() # flushed before fork, so nothing is written
+        cls.instances = {}
+        cls.open_files = OrderedDict()
+        cls.started = False
+        cls.spool = "%s.%d" % (cls.outdir, os.getpid())
+        _fork.at_child_exit(cls, cls.dump)
+
+_fork.register(lambda: [CSVDirMetric.lock], CSVDirMetric._flush_for_fork, CSVDirMetric._after_fork_in_child)
 
 class CSVFileMetric(object):
     """Write metrics to a single CSV file
@@ -78,10 +187,16 @@ class CSVFileMetric(object):
     Pass the method :func:`metric` to a measurement function. Output using
     :func:`dump`.
 
+    Forked child processes write to a separate file, named after ``outfile``
+    and the child's process id. :func:`dump` in the parent appends these to
+    its own file.
+
     :ivar outfile: file to save to. Defaults to ``./instrument.csv``.
     :ivar dump_atexit: automatically call :func:`dump` when the interpreter exits. Defaults to True.
     """
 
+    instances = weakref.WeakSet() #: for fork handlers
+
     def __init__(self, outfile="instrument.csv", dump_atexit = True):
         self.outfile = os.path.abspath(outfile)
         if os.path.exists(self.outfile):
@@ -98,6 +213,8 @@ class CSVFileMetric(object):
         self.lock = threading.Lock()
         self.fh = open_fh(self.outfile)
         self.writer = csv.writer(self.fh)
+        self.child = False
+        self.instances.add(self)
 
     def metric(self, name, count, elapsed):
         """A metric function that writes a single CSV file
@@ -119,3 +236,53 @@ class CSVFileMetric(object):
         with self.lock:
             atexit.unregister(self.dump)
             self.fh.close()
+
+            if not self.child:
+                self._merge_children()
+
+    def rotate(self, keep = None):
+        """Move data recorded so far to a timestamped file & start afresh.
+        See :class:`.Flusher`.
+
+        :arg int keep: number of previous files to keep, or None to keep all
+        """
+        with self.lock:
+            if self.fh.closed or self.child or not self.fh.tell(): return
+
+            self.fh.close()
+            self._merge_children()
+
+            os.replace(self.outfile, flush.rotated_path(self.outfile))
+            self.fh = open_fh(self.outfile)
+            self.writer = csv.writer(self.fh)
+            flush.prune(self.outfile, keep)
+
+    def _merge_children(self):
+        """append files written by forked children. Call with lock held. For internal use only."""
+        for fname in _fork.child_paths(self.outfile):
+            with open(fname, 'rb') as src, open(self.outfile, 'ab') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(fname)
+
+    @classmethod
+    def _flush_for_fork(cls):
+        """fork handler. Call with locks held. For internal use only."""
+        for self in cls.instances:
+            if not self.fh.closed:
+                self.fh.flush()
+
+    @classmethod
+    def _after_fork_in_child(cls):
+        """fork handler. Switches to saving data for the parent. For internal use only."""
+        for self in cls.instances:
+            self.lock = threading.Lock()
+            if self.fh.closed:
+                continue
+            self.fh.close() # flushed before fork, so nothing is written
+            self.fh = open_fh("%s.%d" % (self.outfile, os.getpid()))
+            self.writer = csv.writer(self.fh)
+            self.child = True
+            _fork.at_child_exit(self, self.dump)
+
+_fork.register(lambda: [self.lock for self in CSVFileMetric.instances],
+               CSVFileMetric._flush_for_fork, CSVFileMetric._after_fork_in_child)
@@ -0,0 +1,91 @@
+"""periodically flush & rotate output of long-running processes"""
+import os
+import re
+import shutil
+import datetime
+import logging
+import threading
+import atexit
+
+__all__ = ['Flusher']
+
+logger = logging.getLogger(__name__)
+
+def rotated_path(path):
+    """:return: a new path for output rotated from ``path``, with the current UTC time inserted before its extension"""
+    root, ext = os.path.splitext(path)
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%S.%fZ')
+    return '%s-%s%s' % (root, stamp, ext)
+
+def rotated_paths(path):
+    """:return: sorted list of paths rotated from ``path``, oldest first"""
+    root, ext = os.path.splitext(path)
+    dirname, basename = os.path.split(root)
+    pattern = re.compile(re.escape(basename) + r'-\d{8}T\d{6}\.\d{6}Z' + re.escape(ext) + '$')
+    try:
+        entries = os.listdir(dirname or '.')
+    except FileNotFoundError:
+        return []
+    return sorted(os.path.join(dirname, e) for e in entries if pattern.match(e))
+
+def prune(path, keep):
+    """remove all but the newest ``keep`` outputs rotated from ``path``
+
+    :arg int keep: number to keep, or None to keep all
+    """
+    if keep is None: return
+    old = rotated_paths(path)
+    for p in old[:max(len(old) - keep, 0)]:
+        if os.path.isdir(p):
+            shutil.rmtree(p, ignore_errors=True)
+        else:
+            os.remove(p)
+
+class Flusher(object):
+    """Periodically output & reset metrics in a background thread
+
+    Every ``interval`` seconds, calls the ``rotate()`` method of each
+    target. :class:`.TableMetric` prints a table, while file-based
+    outputs move the data recorded so far to a file or directory named
+    with the current time, and start afresh. This bounds disk & memory use,
+    and shows results while the process is running. Data recorded since the
+    last rotation is output as usual by ``dump()``.
+
+    :arg targets: metrics to rotate: :class:`.NumpyMetric <._numpy.NumpyMetric>` subclasses, :class:`.CSVDirMetric`, or instances of :class:`.CSVFileMetric` & :class:`.BinaryFileMetric`
+    :ivar float interval: seconds between rotations. Defaults to 60.
+    :ivar int keep: number of rotated outputs to keep for each target, or None to keep all. Defaults to None.
+    """
+
+    def __init__(self, targets, interval = 60.0, keep = None):
+        self.targets = list(targets)
+        self.interval = interval
+        self.keep = keep
+
+        self.wakeup = threading.Event()
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name="instrument-flusher", daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        """background thread. For internal use only."""
+        while True:
+            self.wakeup.wait(self.interval)
+            if self.stopped: return
+            self.rotate()
+
+    def rotate(self):
+        """Rotate all targets now"""
+        for target in self.targets:
+            try:
+                target.rotate(self.keep)
+            except Exception:
+                # keep rotating the others, & try again next time
+                logger.exception("Error rotating %r", target)
+
+    def stop(self):
+        """Stop the background thread"""
+        atexit.unregister(self.stop)
+        self.stopped = True
+        self.wakeup.set()
+        self.thread.join()
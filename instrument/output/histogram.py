@@ -0,0 +1,173 @@
+"""print tables of latency percentiles from log-bucketed histograms"""
+import sys
+import math
+import warnings
+import threading
+import atexit
+from array import array
+
+import prettytable
+
+__all__ = ['Histogram', 'HistogramMetric']
+
+class Histogram(object):
+    """Fixed-memory histogram with logarithmic buckets
+
+    Values are counted in buckets whose bounds grow geometrically, so
+    percentiles are reported with a relative error of at most ``precision``.
+    Values outside of ``lowest`` and ``highest`` are clamped to the first and
+    last buckets. The exact minimum & maximum are kept separately.
+
+    :arg float lowest: smallest value to distinguish from zero
+    :arg float highest: largest value to distinguish
+    :arg float precision: relative error of reported values
+    """
+
+    def __init__(self, lowest=1e-9, highest=1e5, precision=0.01):
+        self.lowest = lowest
+        self.highest = highest
+        self.precision = precision
+        # bucket i holds (lowest * base**(i-1), lowest * base**i]; bucket 0 holds [0, lowest]
+        self.base = (1 + precision) ** 2
+        self.log_base = math.log(self.base)
+        self.nbuckets = self._index(highest) + 1
+        self.buckets = array('Q', [0]) * self.nbuckets
+        self.n = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _index(self, x):
+        if x <= self.lowest:
+            return 0
+        return math.ceil(math.log(x / self.lowest) / self.log_base)
+
+    def add(self, x):
+        """count a value"""
+        self.buckets[min(self._index(x), self.nbuckets - 1)] += 1
+        self.n += 1
+        self.total += x
+        if x < self.min: self.min = x
+        if x > self.max: self.max = x
+
+    def merge(self, other):
+        """add counts from another histogram with the same parameters"""
+        if (other.lowest, other.highest, other.precision) != (self.lowest, self.highest, self.precision):
+            raise ValueError("Can't merge histograms with different parameters")
+
+        for i, c in enumerate(other.buckets):
+            if c:
+                self.buckets[i] += c
+        self.n += other.n
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        """estimate a percentile
+
+        :arg float q: percentile, between 0 and 100
+        :rtype: float
+        """
+        if not self.n:
+            return math.nan
+
+        rank = max(1, math.ceil(q / 100 * self.n))
+        # extremes are known exactly
+        if rank == 1:
+            return self.min
+        if rank == self.n:
+            return self.max
+
+        seen = 0
+        for i, c in enumerate(self.buckets):
+            seen += c
+            if seen >= rank:
+                break
+
+        if i == self.nbuckets - 1:
+            return self.max # values above highest are clamped
+
+        # geometric midpoint of the bucket, within the observed range
+        value = self.lowest * self.base ** (i - 0.5) if i else 0.0
+        return min(max(value, self.min), self.max)
+
+class HistogramMetric(object):
+    """Print tables of percentiles of elapsed time & time per item
+
+    Do not create instances of this class directly. Simply pass the
+    classmethod :func:`metric` to a measurement function. Output using
+    :func:`dump`.
+
+    Each metric consumes two :class:`Histogram`, of about 13K each with
+    default settings, regardless of the number of values recorded.
+
+    :cvar bool dump_atexit: automatically call :func:`dump` when the interpreter exits. Defaults to True.
+    :cvar outfile: output file. Defaults to ``sys.stderr``.
+    :cvar percentiles: percentiles to output. Defaults to 50, 90, 99 & 99.9.
+    """
+    dump_atexit = True
+    outfile = sys.stderr
+    percentiles = (50, 90, 99, 99.9)
+    histogram_args = {} #: keyword arguments for creating each :class:`Histogram`
+
+    lock = threading.Lock()
+    instances = {}
+
+    def __init__(self, name):
+        self.name = name
+        self.elapsed = Histogram(**self.histogram_args)
+        self.per_item = Histogram(**self.histogram_args)
+
+    @classmethod
+    def metric(cls, name, count, elapsed):
+        """A metric function that counts values in histograms
+
+        :arg str name: name of the metric
+        :arg int count: number of items
+        :arg float elapsed: time in seconds
+        """
+
+        if name is None:
+            warnings.warn("Ignoring unnamed metric", stacklevel=3)
+            return
+
+        with cls.lock:
+            # register with atexit on first call
+            if cls.dump_atexit and not cls.instances:
+                atexit.register(cls.dump)
+
+            try:
+                self = cls.instances[name]
+            except KeyError:
+                self = cls.instances[name] = cls(name)
+
+            self.elapsed.add(elapsed)
+            if count:
+                self.per_item.add(elapsed / count)
+
+    @classmethod
+    def dump(cls):
+        """Output all recorded metrics"""
+        with cls.lock:
+            if not cls.instances: return
+            atexit.unregister(cls.dump)
+
+            for title, which in (('Elapsed', 'elapsed'), ('Per Item', 'per_item')):
+                table = prettytable.PrettyTable(['Name', 'Samples'] +
+                                                ['p%s' % q for q in cls.percentiles] + ['Max'])
+                table.set_style(prettytable.PLAIN_COLUMNS)
+                table.sortby = 'Name'
+                table.align['Name'] = 'l'
+                table.float_format = '.6'
+
+                for self in cls.instances.values():
+                    hist = getattr(self, which)
+                    if not hist.n: continue
+                    table.add_row([self.name, hist.n] +
+                                  [hist.percentile(q) for q in cls.percentiles] + [hist.max])
+
+                print("%s (seconds)" % title, file=cls.outfile)
+                print(table, file=cls.outfile)
+
+            cls.instances.clear()
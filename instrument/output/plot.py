@@ -1,68 +1,188 @@
 """plot metrics with matplotlib"""
 
+import os
 import os.path
 import shutil
+import multiprocessing
 
 import numpy as np
 import matplotlib
 matplotlib.use('Agg')
-import matplotlib.mlab as mlab
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.ticker import FuncFormatter
 
 from ._numpy import NumpyMetric
+from . import flush
 
 __all__ = ['PlotMetric']
 
 class PlotMetric(NumpyMetric):
     """Plot graphs of metrics. See :class:`NumpyMetric <._numpy.NumpyMetric>` for usage.
 
+    Count vs. elapsed is drawn as a scatter plot of every sample, or if there
+    are more than :attr:`max_points`, as a 2-D histogram of their density, which
+    is accumulated chunk by chunk.
+
+    Plots are rendered in parallel by a pool of :attr:`processes` processes,
+    using matplotlib's object-oriented API. Workers are started with
+    ``spawn``, so they don't inherit the state of other outputs; as for any
+    use of :mod:`multiprocessing`, your main module must be safely importable
+    (guard scripts with ``if __name__ == '__main__':``), or set
+    :attr:`processes` to 1.
+
     :cvar outdir: directory to save plots in. Defaults to ``./instrument_plots``.
     """
 
-    instances = {}
+    names = {}
+    buffers = {}
     outdir = os.path.abspath("instrument_plots")
+    bins = 25 #: number of histogram bins
+    max_points = 10000 #: maximum number of points in a scatter plot, above which density is plotted
+    density_bins = 100 #: number of bins on each axis of a density plot
+    processes = None #: number of processes to render plots in, or None for the number of CPUs
+    pending = None #: plots to render, during output
 
     @classmethod
     def _pre_dump(cls):
         """Output all recorded stats"""
         shutil.rmtree(cls.outdir, ignore_errors=True)
         os.makedirs(cls.outdir)
+        cls.pending = []
         super(PlotMetric, cls)._pre_dump()
 
-    def _cleanup(self):
-        plt.clf()
-        plt.close()
-        super(PlotMetric, self)._cleanup()
-
-    def _output(self):
-        plt.figure(1, figsize = (8, 18))
-        plt.subplot(3, 1, 1)
-        self._histogram('count', self.count_mean, self.count_std, self.count_arr)
-        plt.subplot(3, 1, 2)
-        self._histogram('elapsed', self.elapsed_mean, self.elapsed_std, self.elapsed_arr)
-        plt.subplot(3, 1, 3)
-        self._scatter()
-        plt.savefig(os.path.join(self.outdir, ".".join((self.name, 'png'))),
-                    bbox_inches="tight")
+    @classmethod
+    def _post_dump(cls):
+        try:
+            cls._render_all(cls.pending)
+        finally:
+            cls.pending = None
+        super(PlotMetric, cls)._post_dump()
 
-        super(PlotMetric, self)._output()
+    @classmethod
+    def _render_all(cls, plots):
+        """render plots, in a pool if worthwhile. For internal use only."""
+        processes = min(cls.processes or os.cpu_count() or 1, len(plots))
+        # daemonic processes, like pool workers, can't have children
+        if processes > 1 and not multiprocessing.current_process().daemon:
+            # plots are pickled to the workers, so spawned processes suffice,
+            # & unlike forked ones, they don't run other outputs' fork handlers
+            with multiprocessing.get_context('spawn').Pool(processes) as pool:
+                for _ in pool.imap_unordered(_render, plots):
+                    pass
+        else:
+            for plot in plots:
+                _render(plot)
 
-    def _histogram(self, which, mu, sigma, data):
-        """plot a histogram. For internal use only"""
+    @classmethod
+    def _rotate(cls, keep):
+        """move plots to a timestamped directory"""
+        os.replace(cls.outdir, flush.rotated_path(cls.outdir))
+        flush.prune(cls.outdir, keep)
+        super(PlotMetric, cls)._rotate(keep)
 
-        weights = np.ones_like(data)/len(data) # make bar heights sum to 100%
-        n, bins, patches = plt.hist(data, bins=25, weights=weights, facecolor='blue', alpha=0.5)
+    @classmethod
+    def _needs_scan(cls):
+        return True
+
+    def _scan_start(self):
+        """prepare histograms & points for the second pass"""
+        # bin edges from the whole population, so chunks may be summed
+        self.count_bins = np.histogram_bin_edges([self.count_min, self.count_max], self.bins)
+        self.elapsed_bins = np.histogram_bin_edges([self.elapsed_min, self.elapsed_max], self.bins)
+        self.count_hist = np.zeros(self.bins)
+        self.elapsed_hist = np.zeros(self.bins)
+        if self.samples > self.max_points:
+            self.points = None
+            self.density_edges = (
+                np.histogram_bin_edges([self.count_min, self.count_max], self.density_bins),
+                np.histogram_bin_edges([self.elapsed_min, self.elapsed_max], self.density_bins))
+            self.density = np.zeros((self.density_bins, self.density_bins))
+        else:
+            self.points = []
+            self.density = None
+        super(PlotMetric, self)._scan_start()
+
+    def _scan_chunk(self, arr):
+        """accumulate histograms & points or their density"""
+        self.count_hist += np.histogram(arr['count'], self.count_bins)[0]
+        self.elapsed_hist += np.histogram(arr['elapsed'], self.elapsed_bins)[0]
+        if self.points is not None:
+            self.points.append(arr[['count', 'elapsed']].copy())
+        else:
+            self.density += np.histogram2d(arr['count'], arr['elapsed'], self.density_edges)[0]
+        super(PlotMetric, self)._scan_chunk(arr)
 
-        plt.title(r'%s %s: $\mu=%.2f$, $\sigma=%.2f$' % (self.name, which.capitalize(), mu, sigma))
-        plt.xlabel('Items' if which == 'count' else 'Seconds')
-        plt.ylabel('Frequency')
-        plt.gca().yaxis.set_major_formatter(FuncFormatter(lambda y, position: "{:.1f}%".format(y*100)))
+    def _output(self):
+        # everything needed to render, so it may be sent to another process
+        plot = {
+            'name': self.name,
+            'path': os.path.join(self.outdir, ".".join((self.name, 'png'))),
+            'samples': self.samples,
+            'count': (self.count_mean, self.count_std, self.count_bins, self.count_hist),
+            'elapsed': (self.elapsed_mean, self.elapsed_std, self.elapsed_bins, self.elapsed_hist),
+        }
+        if self.points is not None:
+            plot['points'] = np.concatenate(self.points)
+        else:
+            plot['density'] = self.density_edges + (self.density,)
+        if self.timestamps:
+            starts = (self.window_first + np.arange(len(self.window_items))) * self.window
+            plot['throughput'] = (starts, self.throughput)
+        self.pending.append(plot)
 
-    def _scatter(self):
-        """plot a scatter plot of count vs. elapsed. For internal use only"""
+        super(PlotMetric, self)._output()
 
-        plt.scatter(self.count_arr, self.elapsed_arr)
-        plt.title('{}: Count vs. Elapsed'.format(self.name))
-        plt.xlabel('Items')
-        plt.ylabel('Seconds')
+def _render(plot):
+    """render a metric's plots to a file. For internal use only."""
+    rows = 4 if 'throughput' in plot else 3
+    fig = Figure(figsize = (8, 6 * rows))
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(rows, 1, squeeze=False)[:, 0]
+
+    _histogram(axes[0], plot, 'count')
+    _histogram(axes[1], plot, 'elapsed')
+    if 'points' in plot:
+        _scatter(axes[2], plot)
+    else:
+        _density(fig, axes[2], plot)
+    if 'throughput' in plot:
+        _throughput(axes[3], plot)
+    fig.savefig(plot['path'], bbox_inches="tight")
+
+def _histogram(ax, plot, which):
+    """plot a histogram from precomputed bins. For internal use only"""
+    mu, sigma, bins, hist = plot[which]
+
+    weights = hist/plot['samples'] # make bar heights sum to 100%
+    ax.hist(bins[:-1], bins=bins, weights=weights, facecolor='blue', alpha=0.5)
+
+    ax.set_title(r'%s %s: $\mu=%.2f$, $\sigma=%.2f$' % (plot['name'], which.capitalize(), mu, sigma))
+    ax.set_xlabel('Items' if which == 'count' else 'Seconds')
+    ax.set_ylabel('Frequency')
+    ax.yaxis.set_major_formatter(FuncFormatter(lambda y, position: "{:.1f}%".format(y*100)))
+
+def _scatter(ax, plot):
+    """plot a scatter plot of count vs. elapsed. For internal use only"""
+    points = plot['points']
+    ax.scatter(points['count'], points['elapsed'])
+    ax.set_title('{}: Count vs. Elapsed'.format(plot['name']))
+    ax.set_xlabel('Items')
+    ax.set_ylabel('Seconds')
+
+def _density(fig, ax, plot):
+    """plot a 2-D histogram of count vs. elapsed. For internal use only"""
+    count_edges, elapsed_edges, density = plot['density']
+    mesh = ax.pcolormesh(count_edges, elapsed_edges, np.ma.masked_equal(density.T, 0), cmap='Blues')
+    fig.colorbar(mesh, ax=ax, label='Samples')
+    ax.set_title('{}: Count vs. Elapsed'.format(plot['name']))
+    ax.set_xlabel('Items')
+    ax.set_ylabel('Seconds')
+
+def _throughput(ax, plot):
+    """plot throughput over time. For internal use only"""
+    starts, throughput = plot['throughput']
+    ax.step(starts, throughput, where='post')
+    ax.set_title('{}: Throughput'.format(plot['name']))
+    ax.set_xlabel('Seconds')
+    ax.set_ylabel('Items per second')
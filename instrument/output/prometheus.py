@@ -0,0 +1,179 @@
+"""serve metrics to `Prometheus <https://prometheus.io/>`__"""
+import bisect
+import threading
+import warnings
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+__all__ = ['PrometheusMetric']
+
+class PrometheusMetric(object):
+    """Aggregate metrics in-process, for scraping by Prometheus
+
+    Pass the method :func:`metric` to a measurement function. For each name,
+    the total ``count`` of items is kept in a counter and ``elapsed`` is
+    counted in a histogram, whose ``_count`` is the number of calls. Metric
+    names are reported as a ``name`` label::
+
+        instrument_items_total{name="bogomips"} 5
+        instrument_elapsed_seconds_bucket{name="bogomips",le="0.005"} 0
+        ...
+
+    Each thread updates its own shard of the counters, so recording takes no
+    shared lock. Shards are summed by :func:`collect` when scraped, and those
+    of threads that have exited are folded into a running total & dropped.
+
+    If ``port`` is given, :func:`start` serves the text exposition format in a
+    background thread.
+
+    :ivar str namespace: prefix for the names of exported metrics. Defaults to ``instrument``.
+    :ivar buckets: upper bounds of histogram buckets, in seconds. Defaults to those of the Prometheus clients.
+    :arg int port: port to serve on, or None to not start a server. Defaults to None.
+    :arg str addr: address to serve on. Defaults to ``127.0.0.1``.
+    """
+
+    default_buckets = (.005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, port = None, addr = '127.0.0.1', namespace = 'instrument', buckets = default_buckets):
+        self.namespace = namespace
+        self.buckets = tuple(sorted(buckets))
+
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.shards = {} # thread -> dict of name -> [items, sum, bucket counts..., +Inf count]
+        self.base = {} # as a shard, totals of threads that have exited
+        self.server = self.thread = None
+
+        if port is not None:
+            self.start(port, addr)
+
+    def _shard(self):
+        """create the calling thread's shard. For internal use only."""
+        shard = self.local.shard = {}
+        with self.lock:
+            self.shards[threading.current_thread()] = shard
+        return shard
+
+    def metric(self, name, count, elapsed):
+        """A metric function that updates counters for Prometheus
+
+        :arg str name: name of the metric
+        :arg int count: number of items
+        :arg float elapsed: time in seconds
+        """
+        if name is None:
+            warnings.warn("Ignoring unnamed metric", stacklevel=3)
+            return
+
+        try:
+            shard = self.local.shard
+        except AttributeError:
+            shard = self._shard()
+
+        try:
+            values = shard[name]
+        except KeyError:
+            values = shard[name] = [0, 0.0] + [0] * (len(self.buckets) + 1)
+
+        # only this thread writes to its shard
+        values[0] += count
+        values[1] += elapsed
+        values[2 + bisect.bisect_left(self.buckets, elapsed)] += 1
+
+    def totals(self):
+        """sum the shards of all threads
+
+        :return: name -> [items, sum of elapsed, non-cumulative bucket counts...]
+        :rtype: dict
+        """
+        with self.lock:
+            # exited threads no longer write to their shards
+            for thread in [t for t in self.shards if not t.is_alive()]:
+                _add(self.base, self.shards.pop(thread))
+            totals = {}
+            _add(totals, self.base)
+            shards = list(self.shards.values())
+
+        for shard in shards:
+            _add(totals, shard.copy())
+        return totals
+
+    def collect(self):
+        """:return: all metrics in the Prometheus text exposition format
+        :rtype: str
+        """
+        items = '%s_items_total' % self.namespace
+        elapsed = '%s_elapsed_seconds' % self.namespace
+        counters = ['# HELP %s Number of items measured.' % items, '# TYPE %s counter' % items]
+        histograms = ['# HELP %s Elapsed time of measurements.' % elapsed, '# TYPE %s histogram' % elapsed]
+
+        bounds = [_format(b) for b in self.buckets] + ['+Inf']
+        for name, values in sorted(self.totals().items()):
+            label = 'name="%s"' % _escape(name)
+            counters.append('%s{%s} %d' % (items, label, values[0]))
+
+            cumulative = 0
+            for bound, n in zip(bounds, values[2:]):
+                cumulative += n
+                histograms.append('%s_bucket{%s,le="%s"} %d' % (elapsed, label, bound, cumulative))
+            histograms.append('%s_sum{%s} %s' % (elapsed, label, _format(values[1])))
+            histograms.append('%s_count{%s} %d' % (elapsed, label, cumulative))
+
+        return '\n'.join(counters + histograms) + '\n'
+
+    def start(self, port = 0, addr = '127.0.0.1'):
+        """Serve metrics over HTTP in a background thread
+
+        :arg int port: port to serve on. Defaults to 0, for any free port; see ``server.server_port``.
+        :arg str addr: address to serve on. Defaults to ``127.0.0.1``.
+        """
+        if self.server is not None:
+            raise RuntimeError("Already serving")
+
+        self.server = ThreadingHTTPServer((addr, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.collect = self.collect
+        self.thread = threading.Thread(target=self.server.serve_forever, name="instrument-prometheus", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop serving metrics"""
+        if self.server is None: return
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.server = self.thread = None
+
+class _Handler(BaseHTTPRequestHandler):
+    """serves :meth:`PrometheusMetric.collect`. For internal use only."""
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = self.server.collect().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def _add(totals, shard):
+    """add a shard's values to totals, in place. For internal use only."""
+    for name, values in shard.items():
+        try:
+            total = totals[name]
+        except KeyError:
+            totals[name] = list(values)
+        else:
+            for i, v in enumerate(values):
+                total[i] += v
+
+def _escape(s):
+    return s.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+def _format(x):
+    return repr(float(x))
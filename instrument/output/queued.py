@@ -0,0 +1,132 @@
+"""dispatch metrics to slow outputs from a background thread"""
+import sys
+import queue
+import atexit
+import threading
+import traceback
+
+import instrument
+
+__all__ = ['QueuedMetric']
+
+class QueuedMetric(object):
+    """Call metrics from a background thread, so slow outputs don't delay measured code
+
+    Pass the method :func:`metric` to a measurement function. It puts each
+    event on a bounded queue and returns. A background thread takes events
+    off the queue in batches of up to ``batch_size`` and calls ``metrics``
+    with them. If the queue is full, events are dropped & counted in
+    ``dropped``, or if ``block`` is true, the caller waits for space.
+
+    Each event is stamped with :data:`instrument.clock` when it's queued.
+    Outputs which record start times, like :class:`NumpyMetric
+    <instrument.output._numpy.NumpyMetric>`, are passed that through their
+    ``metric_at`` method, so the time spent queued isn't included.
+
+    :arg functions metrics: metric functions to call from the background thread
+    :ivar int maxsize: maximum number of queued events. Defaults to 10000.
+    :ivar bool block: wait for space when the queue is full, rather than dropping events. Defaults to False.
+    :ivar int batch_size: maximum number of events to take off the queue at once. Defaults to 1000.
+    :ivar dump_atexit: automatically call :func:`dump` when the interpreter exits. Defaults to True.
+    """
+
+    def __init__(self, *metrics, maxsize = 10000, block = False, batch_size = 1000, dump_atexit = True):
+        self.metrics = metrics
+        # outputs that accept the time an event ended, as in _pop_span()
+        self.metrics_at = [getattr(getattr(m, '__self__', m), 'metric_at', None) for m in metrics]
+        self.block = block
+        self.batch_size = batch_size
+
+        self.queue = queue.Queue(maxsize)
+        self.lock = threading.Lock()
+        self.dropped = 0 #: number of events dropped because the queue was full
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name="instrument-queued", daemon=True)
+        self.thread.start()
+
+        self.dump_atexit = dump_atexit
+        if dump_atexit:
+            atexit.register(self.dump)
+
+    def metric(self, name, count, elapsed):
+        """A metric function that queues events for the background thread
+
+        :arg str name: name of the metric
+        :arg int count: number of items
+        :arg float elapsed: time in seconds
+        """
+        if self.stopped:
+            self._call(name, count, elapsed, None)
+            return
+
+        try:
+            self.queue.put((name, count, elapsed, instrument.clock()), self.block)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    def _call(self, name, count, elapsed, end):
+        for m, metric_at in zip(self.metrics, self.metrics_at):
+            try:
+                if metric_at is not None:
+                    metric_at(name, count, elapsed, end)
+                else:
+                    m(name, count, elapsed)
+            except Exception:
+                # keep the background thread alive
+                traceback.print_exc(file=sys.stderr)
+
+    def _run(self):
+        """background thread. For internal use only."""
+        first = True
+        while True:
+            batch = [self.queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            for event in batch:
+                if event is None:
+                    return
+                elif isinstance(event, threading.Event):
+                    event.set()
+                else:
+                    self._call(*event)
+
+            if first and self.dump_atexit and not self.stopped:
+                # outputs like TableMetric register their own dump on first
+                # use; ours must run before theirs, and atexit is LIFO
+                atexit.unregister(self.dump)
+                atexit.register(self.dump)
+            first = False
+
+    def flush(self):
+        """Wait until events queued so far have been passed to the metrics"""
+        if self.stopped: return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+
+    def dump(self):
+        """Pass all queued events to the metrics & stop the background thread
+
+        Events recorded afterwards are passed to the metrics directly.
+        """
+        atexit.unregister(self.dump)
+        if self.stopped: return
+        self.stopped = True
+        self.queue.put(None)
+        self.thread.join()
+
+        # events queued by threads that raced with stopping
+        while True:
+            try:
+                event = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(event, threading.Event):
+                event.set()
+            elif event is not None:
+                self._call(*event)
@@ -0,0 +1,162 @@
+"""print periodic tables of running statistics, in constant memory"""
+import sys
+import math
+import warnings
+import threading
+import atexit
+
+import prettytable
+
+__all__ = ['RunningStats', 'RunningMetric']
+
+class RunningStats(object):
+    """Running mean, standard deviation, minimum, maximum & total of a series
+
+    Uses Welford's algorithm, so memory use is constant regardless of the
+    number of values.
+    """
+    __slots__ = ['n', 'mean', 'm2', 'min', 'max', 'total']
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.total = 0
+
+    def add(self, x):
+        """add a value to the series"""
+        self.n += 1
+        self.total += x
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        if x < self.min: self.min = x
+        if x > self.max: self.max = x
+
+    @property
+    def std(self):
+        """population standard deviation"""
+        return math.sqrt(self.m2 / self.n) if self.n else 0.0
+
+class RunningMetric(object):
+    """Print tables of running statistics periodically
+
+    Pass the method :func:`metric` to a measurement function. A background
+    thread prints statistics every ``interval`` seconds, and :func:`dump`
+    prints them a final time. Output uses the same layout as
+    :class:`.TableMetric`, with the minimum & maximum of counts and elapsed
+    times by default.
+
+    Each metric name consumes constant memory, making this a low-budget
+    alternative to statsd for long-running services.
+
+    :ivar outfile: output file. Defaults to ``sys.stderr``.
+    :ivar float interval: seconds between reports, or None to only report on :func:`dump`. Defaults to 60.
+    :ivar dump_atexit: automatically call :func:`dump` when the interpreter exits. Defaults to True.
+    :ivar columns: sequence of statistics to output: ``count_`` or ``elapsed_`` followed by ``mean``, ``std``, ``min``, ``max`` or ``total``, or ``samples``. Defaults to :attr:`default_columns`.
+    """
+
+    default_columns = ('count_mean', 'count_std', 'count_min', 'count_max',
+                       'elapsed_mean', 'elapsed_std', 'elapsed_min', 'elapsed_max')
+
+    _headings = {'samples': 'Samples', 'std': 'Stddev'}
+
+    def __init__(self, outfile=sys.stderr, interval=60, dump_atexit=True, columns=default_columns):
+        for column in columns:
+            self._check_column(column)
+        self.outfile = outfile
+        self.interval = interval
+        self.columns = list(columns)
+        self.dump_atexit = dump_atexit
+        if dump_atexit:
+            atexit.register(self.dump)
+
+        self.lock = threading.Lock()
+        self.stats = {} #: name -> (count, elapsed) :class:`RunningStats`
+
+        self.wakeup = threading.Event()
+        self.stopped = False
+        if interval is not None:
+            self.thread = threading.Thread(target=self._run, name="instrument-running", daemon=True)
+            self.thread.start()
+        else:
+            self.thread = None
+
+    @classmethod
+    def _check_column(cls, column):
+        """raise ValueError if a statistic can't be output. For internal use only."""
+        if column == 'samples':
+            return
+        kind, _, stat = column.partition('_')
+        if kind in ('count', 'elapsed') and stat in ('mean', 'std', 'min', 'max', 'total'):
+            return
+        raise ValueError("Unknown column %r" % column)
+
+    @classmethod
+    def _heading(cls, column):
+        """:return: column heading for a statistic. For internal use only."""
+        return ' '.join(cls._headings.get(word, word.capitalize()) for word in column.split('_'))
+
+    def metric(self, name, count, elapsed):
+        """A metric function that keeps running statistics
+
+        :arg str name: name of the metric
+        :arg int count: number of items
+        :arg float elapsed: time in seconds
+        """
+
+        if name is None:
+            warnings.warn("Ignoring unnamed metric", stacklevel=3)
+            return
+
+        with self.lock:
+            try:
+                counts, times = self.stats[name]
+            except KeyError:
+                counts, times = self.stats[name] = RunningStats(), RunningStats()
+
+            counts.add(count)
+            times.add(elapsed)
+
+    def _run(self):
+        """background thread. For internal use only."""
+        while True:
+            self.wakeup.wait(self.interval)
+            if self.stopped: return
+            with self.lock:
+                if self.stats:
+                    self._report()
+
+    def _report(self):
+        """print a table of statistics. Call with lock held. For internal use only."""
+        table = prettytable.PrettyTable(['Name'] + [self._heading(c) for c in self.columns])
+        table.set_style(prettytable.PLAIN_COLUMNS)
+        table.sortby = 'Name'
+        table.align['Name'] = 'l'
+        table.float_format = '.2'
+
+        for name, (counts, times) in self.stats.items():
+            row = [name]
+            for column in self.columns:
+                if column == 'samples':
+                    row.append(counts.n)
+                else:
+                    kind, _, stat = column.partition('_')
+                    row.append(float(getattr(counts if kind == 'count' else times, stat)))
+            table.add_row(row)
+
+        print(table, file=self.outfile)
+
+    def dump(self):
+        """Stop the background thread & output all recorded metrics"""
+        atexit.unregister(self.dump)
+        if self.thread is not None:
+            self.stopped = True
+            self.wakeup.set()
+            self.thread.join()
+            self.thread = None
+        with self.lock:
+            if self.stats:
+                self._report()
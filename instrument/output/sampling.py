@@ -0,0 +1,149 @@
+"""sample metrics to reduce overhead"""
+import abc
+import random
+import threading
+import atexit
+
+__all__ = ['SampledMetric', 'EveryNthMetric', 'RandomMetric', 'ReservoirMetric']
+
+class SampledMetric(abc.ABC):
+    """Base class for metric functions that pass a sample of events to another metric
+
+    Instances are metric functions. The ``count`` of sampled events is
+    multiplied by the inverse of the sampling rate, so that totals are
+    unbiased; ``elapsed`` is passed unchanged, as with statsd sample rates.
+
+    :func:`instrument.each` checks :meth:`sample` *before* measuring each item,
+    and skips reading the clock entirely for unsampled items. As it can't know
+    whether another item exists until it has asked, it calls :meth:`unsample`
+    once the iterable is exhausted, to take back the last decision.
+
+    Subclasses must implement :meth:`sample`.
+
+    :arg function metric: metric function to pass sampled events to
+    """
+
+    weight = 1 #: multiplier for ``count``
+
+    def __init__(self, metric):
+        self.wrapped = metric
+
+    def __call__(self, name, count, elapsed):
+        if self.sample(name):
+            self.record(name, count, elapsed)
+
+    @abc.abstractmethod
+    def sample(self, name):
+        """decide whether to record the next event
+
+        :arg str name: name of the metric
+        :rtype: bool
+        """
+
+    def unsample(self, name):
+        """take back the last call of :meth:`sample`, for an event that didn't happen
+
+        :arg str name: name of the metric
+        """
+        pass
+
+    def record(self, name, count, elapsed):
+        """record an event that has been sampled"""
+        self.wrapped(name, count * self.weight, elapsed)
+
+class EveryNthMetric(SampledMetric):
+    """Sample every ``n``'th event, across all metric names
+
+    :arg function metric: metric function to pass sampled events to
+    :arg int n: sampling interval
+    """
+
+    def __init__(self, metric, n):
+        super(EveryNthMetric, self).__init__(metric)
+        self.weight = n
+        self.lock = threading.Lock()
+        self.events = 0
+
+    def sample(self, name):
+        with self.lock:
+            i = self.events
+            self.events += 1
+        return not i % self.weight
+
+    def unsample(self, name):
+        with self.lock:
+            self.events -= 1
+
+class RandomMetric(SampledMetric):
+    """Sample events at random, with probability ``p``
+
+    Counts are multiplied by ``1/p``, rounded to an integer; choose ``p`` as
+    the reciprocal of an integer to weight exactly.
+
+    :arg function metric: metric function to pass sampled events to
+    :arg float p: sampling probability
+    """
+
+    def __init__(self, metric, p):
+        super(RandomMetric, self).__init__(metric)
+        self.p = p
+        self.weight = 1 / p
+
+    def sample(self, name):
+        return random.random() < self.p
+
+    def record(self, name, count, elapsed):
+        self.wrapped(name, round(count * self.weight), elapsed)
+
+class ReservoirMetric(SampledMetric):
+    """Keep a uniform random sample of up to ``size`` events per metric name
+
+    Events are passed to the wrapped metric on :func:`dump`, with counts
+    multiplied by the number of events seen per event kept. Memory use is
+    bounded by ``size`` for each name.
+
+    :arg function metric: metric function to pass sampled events to
+    :arg int size: number of events to keep per name
+    :ivar dump_atexit: automatically call :func:`dump` when the interpreter exits. Defaults to True.
+    """
+
+    def __init__(self, metric, size, dump_atexit = True):
+        super(ReservoirMetric, self).__init__(metric)
+        self.size = size
+        self.lock = threading.Lock()
+        self.seen = {}
+        self.reservoirs = {}
+
+        self.dump_atexit = dump_atexit
+        if dump_atexit:
+            atexit.register(self.dump)
+
+    def sample(self, name):
+        # Algorithm R: keep the i'th event with probability size/i
+        with self.lock:
+            i = self.seen[name] = self.seen.get(name, 0) + 1
+        return i <= self.size or random.random() * i < self.size
+
+    def unsample(self, name):
+        with self.lock:
+            self.seen[name] -= 1
+
+    def record(self, name, count, elapsed):
+        with self.lock:
+            reservoir = self.reservoirs.setdefault(name, [])
+            if len(reservoir) < self.size:
+                reservoir.append((count, elapsed))
+            else:
+                reservoir[random.randrange(self.size)] = (count, elapsed)
+
+    def dump(self):
+        """Pass sampled events to the wrapped metric & start afresh"""
+        with self.lock:
+            atexit.unregister(self.dump)
+            reservoirs, self.reservoirs = self.reservoirs, {}
+            seen, self.seen = self.seen, {}
+
+        for name, reservoir in reservoirs.items():
+            weight = seen[name] / len(reservoir)
+            for count, elapsed in reservoir:
+                self.wrapped(name, round(count * weight), elapsed)
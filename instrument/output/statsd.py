@@ -1,12 +1,113 @@
 """save metrics to `statsd <http://codeascraft.com/2011/02/15/measure-anything-measure-everything/>`__"""
+import threading
+import atexit
+import warnings
+from collections import defaultdict, Counter
 
 try:
     from statsd.defaults.django import statsd
 except Exception: # many possible errors, incl. ImportError & ImproperlyConfigured
     from statsd.defaults.env import statsd
 
-def statsd_metric(name, count, elapsed):
-    """Metric that records to statsd & graphite"""
-    with statsd.pipeline() as pipe:
+__all__ = ['statsd_metric', 'BufferedStatsdMetric']
+
+def _send(client, name, count, elapsed):
+    with client.pipeline() as pipe:
         pipe.incr(name, count)
         pipe.timing(name, int(round(1000 * elapsed)))  # milliseconds
+
+def statsd_metric(name, count, elapsed):
+    """Metric that records to statsd & graphite"""
+    _send(statsd, name, count, elapsed)
+
+class BufferedStatsdMetric(object):
+    """Record to statsd & graphite, aggregating in-process
+
+    Pass the method :func:`metric` to a measurement function. Counts are
+    summed per name, and timings are counted per name & millisecond value, so
+    memory grows with the number of distinct values, not of events. A
+    background thread sends them every ``interval`` seconds, or sooner once
+    ``max_pending`` events are buffered. Stats are packed into as few
+    datagrams as possible. After :func:`dump`, metrics are sent immediately.
+
+    :ivar client: a ``statsd.StatsClient``. Defaults to one configured from django settings or the environment.
+    :ivar float interval: seconds between flushes. Defaults to 1.
+    :ivar int max_pending: number of buffered events that triggers an early flush. Defaults to 10000.
+    :ivar dump_atexit: automatically call :func:`dump` when the interpreter exits. Defaults to True.
+    """
+
+    def __init__(self, client = statsd, interval = 1.0, max_pending = 10000, dump_atexit = True):
+        self.client = client
+        self.interval = interval
+        self.max_pending = max_pending
+
+        self.lock = threading.Lock()
+        self.counts = defaultdict(int)
+        self.timings = defaultdict(Counter) # name -> milliseconds -> number of events
+        self.pending = 0
+
+        self.wakeup = threading.Event()
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name="instrument-statsd", daemon=True)
+        self.thread.start()
+
+        self.dump_atexit = dump_atexit
+        if dump_atexit:
+            atexit.register(self.dump)
+
+    def metric(self, name, count, elapsed):
+        """A metric function that buffers for statsd
+
+        :arg str name: name of the metric
+        :arg int count: number of items
+        :arg float elapsed: time in seconds
+        """
+        if name is None:
+            warnings.warn("Ignoring unnamed metric", stacklevel=3)
+            return
+
+        if self.stopped:
+            # no background thread to send buffered stats
+            _send(self.client, name, count, elapsed)
+            return
+
+        with self.lock:
+            self.counts[name] += count
+            self.timings[name][int(round(1000 * elapsed))] += 1  # milliseconds
+            self.pending += 1
+            full = self.pending >= self.max_pending
+
+        if full:
+            self.wakeup.set()
+
+    def _run(self):
+        """background thread. For internal use only."""
+        while not self.stopped:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Send buffered stats now"""
+        with self.lock:
+            if not self.pending: return
+            counts, self.counts = self.counts, defaultdict(int)
+            timings, self.timings = self.timings, defaultdict(Counter)
+            self.pending = 0
+
+        with self.client.pipeline() as pipe:
+            for name, count in counts.items():
+                pipe.incr(name, count)
+            for name, values in timings.items():
+                # statsd needs each event to calculate its stats
+                for ms, n in values.items():
+                    for _ in range(n):
+                        pipe.timing(name, ms)
+
+    def dump(self):
+        """Send buffered stats & stop the background thread"""
+        atexit.unregister(self.dump)
+        self.stopped = True
+        self.wakeup.set()
+        self.thread.join()
+        self.flush()
@@ -1,6 +1,8 @@
 """print pretty tables of statistics"""
 import prettytable
+import numpy as np
 import sys
+import time
 
 from ._numpy import NumpyMetric
 
@@ -9,14 +11,102 @@ __all__ = ['TableMetric']
 class TableMetric(NumpyMetric):
     """Print a table of statistics. See :class:`NumpyMetric <._numpy.NumpyMetric>` for usage.
 
+    If :attr:`timestamps <._numpy.NumpyMetric.timestamps>` is set, the table
+    includes the mean, minimum and maximum throughput in items per second over
+    each :attr:`window <._numpy.NumpyMetric.window>`. If :attr:`spans
+    <._numpy.NumpyMetric.spans>` is set, it includes the mean and standard
+    deviation of self time.
+
+    Set :attr:`columns` to choose other statistics. Each is one of:
+
+    * ``samples``: number of recorded samples
+    * ``count_<stat>``, ``elapsed_<stat>``: where stat is ``mean``, ``std``,
+      ``min``, ``max`` or ``total``
+    * ``self_<stat>``: for self time, where stat is ``mean``, ``std``, ``min``
+      or ``max``. Requires :attr:`spans <._numpy.NumpyMetric.spans>`.
+    * ``rate``: total items per total elapsed second
+    * ``throughput_mean``, ``throughput_min``, ``throughput_max``: over windows.
+      Requires :attr:`timestamps <._numpy.NumpyMetric.timestamps>`.
+    * ``p<q>``: the q-th percentile of elapsed time, such as ``p99`` or ``p99.9``
+
+    All statistics are calculated in a single pass over the data in chunks,
+    except percentiles: these require a second pass, and hold all elapsed
+    times in memory to be calculated exactly, with a single
+    :func:`numpy.percentile` call for each metric. For percentiles in
+    bounded memory, use :class:`.HistogramMetric`.
+
     :cvar outfile: output file. Defaults to ``sys.stderr``.
     """
-    instances = {}
+    names = {}
+    buffers = {}
     outfile = sys.stderr
+    columns = None #: sequence of statistics to output, or None for the default
+
+    _headings = {'samples': 'Samples', 'std': 'Stddev', 'rate': 'Items/Second'}
+
+    @classmethod
+    def _columns(cls):
+        """statistics to output. For internal use only."""
+        if cls.columns is not None:
+            return list(cls.columns)
+
+        columns = ['count_mean', 'count_std', 'elapsed_mean', 'elapsed_std']
+        if cls.spans:
+            columns += ['self_mean', 'self_std']
+        if cls.timestamps:
+            columns += ['throughput_mean', 'throughput_min', 'throughput_max']
+        return columns
+
+    @classmethod
+    def _heading(cls, column):
+        """:return: column heading for a statistic. For internal use only."""
+        if column in cls._headings:
+            return cls._headings[column]
+        if cls._percentile(column) is not None:
+            return column
+        return ' '.join(cls._headings.get(word, word.capitalize()) for word in column.split('_'))
+
+    @staticmethod
+    def _percentile(column):
+        """:return: q, if a column is a percentile, otherwise None. For internal use only."""
+        if column.startswith('p'):
+            try:
+                return float(column[1:])
+            except ValueError:
+                pass
+        return None
+
+    @classmethod
+    def _check_column(cls, column):
+        """raise ValueError if a statistic can't be output. For internal use only."""
+        if column in ('samples', 'rate') or cls._percentile(column) is not None:
+            return
+        kind, _, stat = column.partition('_')
+        if kind == 'throughput' and stat in ('mean', 'min', 'max'):
+            if cls.timestamps: return
+            raise ValueError("Column %r requires timestamps" % column)
+        if kind == 'self' and stat in ('mean', 'std', 'min', 'max'):
+            if cls.spans: return
+            raise ValueError("Column %r requires spans" % column)
+        if kind in ('count', 'elapsed') and stat in ('mean', 'std', 'min', 'max', 'total'):
+            return
+        raise ValueError("Unknown column %r" % column)
+
+    @classmethod
+    def _percentiles(cls):
+        """:return: percentiles to output. For internal use only."""
+        qs = (cls._percentile(c) for c in cls._columns())
+        return [q for q in qs if q is not None]
+
+    @classmethod
+    def _needs_scan(cls):
+        return super(TableMetric, cls)._needs_scan() or bool(cls._percentiles())
 
     @classmethod
     def _pre_dump(cls):
-        cls.table = prettytable.PrettyTable(['Name', 'Count Mean', 'Count Stddev', 'Elapsed Mean', 'Elapsed Stddev'])
+        for column in cls._columns():
+            cls._check_column(column)
+        cls.table = prettytable.PrettyTable(['Name'] + [cls._heading(c) for c in cls._columns()])
         cls.table.set_style(prettytable.PLAIN_COLUMNS)
         cls.table.sortby = 'Name'
         cls.table.align['Name'] = 'l'
@@ -25,11 +115,45 @@ class TableMetric(NumpyMetric):
 
     @classmethod
     def _post_dump(cls):
+        if cls.rotating:
+            print(time.strftime("Metrics at %Y-%m-%d %H:%M:%S"), file=cls.outfile)
         print(cls.table, file=cls.outfile)
         super(TableMetric, cls)._post_dump()
 
+    def _scan_start(self):
+        super(TableMetric, self)._scan_start()
+        self.elapsed_parts = [] if self._percentiles() else None
+
+    def _scan_chunk(self, arr):
+        super(TableMetric, self)._scan_chunk(arr)
+        if self.elapsed_parts is not None:
+            # copy, so the rest of the chunk may be freed
+            self.elapsed_parts.append(arr['elapsed'].copy())
+
     def _output(self):
+        columns = self._columns()
+        qs = self._percentiles()
+        if qs:
+            # one call shares a single partition of the data
+            percentiles = dict(zip(qs, np.percentile(np.concatenate(self.elapsed_parts), qs)))
+            self.elapsed_parts = None
+        if self.timestamps:
+            throughput = self.throughput
+
         # write to prettytable
-        self.table.add_row([self.name, self.count_mean, self.count_std, self.elapsed_mean, self.elapsed_std])
+        row = [self.name]
+        for column in columns:
+            q = self._percentile(column)
+            if q is not None:
+                row.append(percentiles[q])
+            elif column == 'samples':
+                row.append(self.samples)
+            elif column == 'rate':
+                row.append(self.count_total / self.elapsed_total if self.elapsed_total else np.nan)
+            elif column.startswith('throughput_'):
+                row.append(getattr(throughput, column[len('throughput_'):])())
+            else:
+                row.append(getattr(self, column))
+        self.table.add_row(row)
         super(TableMetric, self)._output()
 
@@ -0,0 +1,136 @@
+"""WSGI middleware to measure requests
+
+:class:`Middleware` wraps a WSGI application, recording three metrics for
+each request, named after its method & normalized route (see
+:func:`normalize_path`):
+
+* ``<prefix>.<method>.<route>.app``: time to call the application, as with
+  :func:`instrument.function`
+* ``<prefix>.<method>.<route>.first``: time to produce the first chunk of the
+  response body, as with :func:`instrument.first`
+* ``<prefix>.<method>.<route>.all``: total time & number of chunks of the
+  response body, as with :func:`instrument.all`
+"""
+import re
+import threading
+import functools
+
+import instrument
+from . import call_default, _do_all, _do_first, _seconds
+
+__all__ = ['Middleware', 'normalize_path']
+
+_placeholders = [
+    (re.compile(r'^\d+$'), '{id}'),
+    (re.compile(r'^[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}$'), '{uuid}'),
+    (re.compile(r'^(?=.*\d)[0-9a-fA-F]{16,}$'), '{hex}'),
+]
+
+_methods = frozenset(['GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'CONNECT', 'OPTIONS', 'TRACE', 'PATCH'])
+
+@functools.lru_cache(maxsize=4096)
+def normalize_path(path):
+    """convert a URL path to a route for use in metric names
+
+    Path segments that look like identifiers (integers, UUIDs and long hex
+    strings) are replaced with placeholders, and segments are joined with
+    dots. Results are cached.
+
+    >>> normalize_path('/users/42/posts/')
+    'users.{id}.posts'
+
+    :arg str path: URL path, such as ``PATH_INFO``
+    :rtype: str
+    """
+    segments = []
+    for segment in path.split('/'):
+        if not segment: continue
+        for regex, placeholder in _placeholders:
+            if regex.match(segment):
+                segment = placeholder
+                break
+        else:
+            segment = segment.replace('.', '_')
+        segments.append(segment)
+    return '.'.join(segments) or 'index'
+
+class Middleware(object):
+    """WSGI middleware that measures requests to an application
+
+    At most ``max_routes`` distinct routes are named; requests to others are
+    recorded as route ``other``, so unexpected URLs don't explode the number of
+    metrics. Likewise, non-standard request methods are recorded as ``OTHER``.
+
+    :arg app: the WSGI application
+    :arg function metric: f(name, count, time)
+    :arg str prefix: prefix for metric names. Defaults to ``wsgi``.
+    :arg function normalize: f(path) -> route, converting ``PATH_INFO`` to a route. Defaults to :func:`normalize_path`.
+    :arg int max_routes: maximum number of distinct routes. Defaults to 1000.
+    """
+
+    def __init__(self, app, *, metric = call_default, prefix = 'wsgi', normalize = normalize_path, max_routes = 1000):
+        self.app = app
+        self.metric = metric
+        self.prefix = prefix
+        self.normalize = normalize
+        self.max_routes = max_routes
+
+        self.lock = threading.Lock()
+        self.names = {} # (method, route) -> name
+
+    def name(self, environ):
+        """:return: base metric name for a request"""
+        method = environ.get('REQUEST_METHOD', 'GET')
+        if method not in _methods:
+            method = 'OTHER'
+        key = (method, self.normalize(environ.get('PATH_INFO', '')))
+        try:
+            return self.names[key]
+        except KeyError:
+            with self.lock:
+                if key not in self.names and len(self.names) >= self.max_routes:
+                    key = (key[0], 'other')
+                return self.names.setdefault(key, '.'.join((self.prefix,) + key))
+
+    def __call__(self, environ, start_response):
+        name = self.name(environ)
+        t = instrument.clock()
+        try:
+            body = self.app(environ, start_response)
+        finally:
+            self.metric(name + '.app', 1, _seconds(instrument.clock() - t))
+        return _Body(body, name, self.metric)
+
+class _Body(object):
+    """measures iteration of a response body as :func:`instrument.first` &
+    :func:`instrument.all` do, passing through ``close()``"""
+
+    def __init__(self, body, name, metric):
+        self.body = body
+        self.name = name
+        self.metric = metric
+        self.it = None
+        self.closed = False
+
+    def __iter__(self):
+        if self.it is None:
+            self.it = _do_all(_do_first(self.body, self.name + '.first', self.metric),
+                              self.name + '.all', self.metric)
+        return self.it
+
+    def close(self):
+        if self.closed: return
+        self.closed = True
+        try:
+            if self.it is not None:
+                # records the metric, if the body wasn't exhausted
+                self.it.close()
+        finally:
+            try:
+                close = getattr(self.body, 'close', None)
+                if close is not None:
+                    close()
+            finally:
+                if self.it is None:
+                    # never iterated, as for HEAD
+                    self.metric(self.name + '.all', 0, 0.0)
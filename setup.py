@@ -8,6 +8,7 @@ setup(name='instrument',
       author_email='pete@wearpants.org',
       url='http://github.com/wearpants/instrument',
       packages=find_packages(exclude=['tests', 'doc']),
+      python_requires='>=3.7',
       extras_require={
         'statsd': ['statsd'],
         'table': ['numpy', 'prettytable'],
@@ -0,0 +1,101 @@
+import time
+import asyncio
+import inspect
+import unittest
+
+import instrument
+import instrument.aio
+
+async def slow(seconds):
+    time.sleep(seconds) # fakesleep advances the clock
+    await asyncio.sleep(0)
+
+async def amath_is_hard(N):
+    x = 0
+    while x < N:
+        await slow(1)
+        yield x * x
+        x += 1
+
+async def alist(aiterable):
+    return [x async for x in aiterable]
+
+class AioTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.results = []
+        self.metric = lambda name, count, elapsed: self.results.append((name, count, elapsed))
+
+    def test_all(self):
+        result = asyncio.run(alist(instrument.aio.all(amath_is_hard(5), name="all", metric=self.metric)))
+        self.assertEqual(result, [0, 1, 4, 9, 16])
+        self.assertEqual(self.results, [("all", 5, 5.0)])
+
+    def test_each(self):
+        result = asyncio.run(alist(instrument.aio.each(amath_is_hard(3), name="each", metric=self.metric)))
+        self.assertEqual(result, [0, 1, 4])
+        self.assertEqual(self.results, [("each", 1, 1.0)] * 3)
+
+    def test_first(self):
+        result = asyncio.run(alist(instrument.aio.first(amath_is_hard(3), name="first", metric=self.metric)))
+        self.assertEqual(result, [0, 1, 4])
+        self.assertEqual(self.results, [("first", 1, 1.0)])
+
+    def test_decorator(self):
+        @instrument.aio.all(name="gen", metric=self.metric)
+        async def gen(N):
+            async for x in amath_is_hard(N):
+                yield x
+
+        self.assertEqual(asyncio.run(alist(gen(2))), [0, 1])
+        self.assertEqual(self.results, [("gen", 2, 2.0)])
+
+    def test_function(self):
+        @instrument.function(name="func", metric=self.metric)
+        async def func():
+            await slow(2)
+            return "SLOW"
+
+        self.assertEqual(asyncio.run(func()), "SLOW")
+        self.assertEqual(self.results, [("func", 1, 2.0)])
+
+    def test_method(self):
+        metric = self.metric
+
+        class Database(object):
+            @instrument.producer(metric=metric)
+            async def query(self, N):
+                await slow(N)
+                return list(range(N))
+
+        self.assertEqual(asyncio.run(Database().query(3)), [0, 1, 2])
+        self.assertEqual(self.results, [(__name__ + ".Database.query", 3, 3.0)])
+
+    def test_iscoroutinefunction(self):
+        # inspect only recognizes marked objects from python 3.12
+        iscoroutinefunction = inspect.iscoroutinefunction if hasattr(inspect, 'markcoroutinefunction') \
+            else asyncio.iscoroutinefunction
+
+        @instrument.function(metric=self.metric)
+        async def func():
+            pass
+
+        @instrument.producer(metric=self.metric)
+        def sync():
+            return []
+
+        class Database(object):
+            query = func
+
+        self.assertTrue(iscoroutinefunction(func))
+        self.assertTrue(inspect.iscoroutinefunction(Database.query))
+        self.assertTrue(inspect.iscoroutinefunction(Database().query))
+        self.assertFalse(iscoroutinefunction(sync))
+
+    def test_block(self):
+        async def main():
+            async with instrument.aio.block(name="block", metric=self.metric, count=7):
+                await slow(3)
+
+        asyncio.run(main())
+        self.assertEqual(self.results, [("block", 7, 3.0)])
@@ -0,0 +1,139 @@
+import tempfile
+import shutil
+import os
+import unittest
+import multiprocessing
+
+from . import math_is_hard
+
+import instrument
+from instrument.output.binlog import BinaryFileMetric, BinaryLog
+
+
+def read_csv(fname):
+    with open(fname, newline='') as fh:
+        return fh.read()
+
+class BinaryFileMetricTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mktemp()
+        self.addCleanup(os.unlink, self.tmp)
+
+    def test_binlog(self):
+        bfm = BinaryFileMetric(self.tmp, False)
+
+        list(instrument.all(math_is_hard(10), metric=bfm.metric, name="alice"))
+        list(instrument.all(math_is_hard(10), metric=bfm.metric, name="bob"))
+
+        # unnamed metrics are dropped
+        list(instrument.all(math_is_hard(10), metric=bfm.metric))
+
+        list(instrument.all(math_is_hard(20), metric=bfm.metric, name="alice"))
+
+        bfm.dump()
+
+        log = BinaryLog(self.tmp)
+        self.assertEqual(log.names, ["alice", "bob"])
+        self.assertEqual(len(log), 3)
+        records = log.read()
+        self.assertEqual(records['id'].tolist(), [0, 1, 0])
+        self.assertEqual(records['count'].tolist(), [10, 10, 20])
+        self.assertEqual(records['elapsed'].tolist(), [10.0, 10.0, 20.0])
+
+        csv_fname = tempfile.mktemp()
+        self.addCleanup(os.unlink, csv_fname)
+        log.to_csv(csv_fname)
+        s = read_csv(csv_fname)
+        self.assertMultiLineEqual(s, 'alice,10,10.000000\r\nbob,10,10.000000\r\nalice,20,20.000000\r\n')
+
+    def test_chunks(self):
+        bfm = BinaryFileMetric(self.tmp, False)
+        for i in range(100):
+            bfm.metric("carol", i, i / 10)
+            if i == 50:
+                # name records are longer than one record
+                bfm.metric("a much longer name, with a comma", 1, 0.5)
+        bfm.dump()
+
+        log = BinaryLog(self.tmp)
+        log.chunk_size = 7
+        self.assertEqual(log.names, ["carol", "a much longer name, with a comma"])
+        chunks = list(log.chunks())
+        self.assertTrue(all(len(c) <= 7 for c in chunks))
+        self.assertEqual(sum(len(c) for c in chunks), 101)
+        self.assertEqual(sum(c['count'].sum() for c in chunks), sum(range(100)) + 1)
+
+        records = log.read()
+        self.assertEqual(records['id'][51], 1)
+        self.assertEqual(records['count'][:51].tolist(), list(range(51)))
+
+    def test_partial(self):
+        bfm = BinaryFileMetric(self.tmp, False)
+        bfm.metric("dave", 1, 1.0)
+        bfm.metric("dave", 2, 2.0)
+        bfm.dump()
+
+        # a partially written record, as after a crash, is ignored
+        with open(self.tmp, 'r+b') as fh:
+            fh.truncate(os.path.getsize(self.tmp) - 3)
+        log = BinaryLog(self.tmp)
+        self.assertEqual(log.read()['count'].tolist(), [1])
+
+    def test_relative(self):
+        cwd = os.getcwd()
+        self.addCleanup(os.chdir, cwd)
+        os.chdir(os.path.dirname(self.tmp))
+        bfm = BinaryFileMetric(os.path.basename(self.tmp), False)
+
+        # the path is fixed when created, like CSVFileMetric's
+        os.chdir(cwd)
+        self.assertEqual(bfm.outfile, self.tmp)
+        bfm.metric("alice", 1, 1.0)
+        bfm.dump()
+        self.assertEqual(len(BinaryLog(self.tmp)), 1)
+
+    def test_makedirs(self):
+        dirname = self.tmp + '.d'
+        self.addCleanup(shutil.rmtree, dirname)
+        fname = os.path.join(dirname, 'sub', 'log.bin')
+        bfm = BinaryFileMetric(fname, False)
+        bfm.dump()
+
+        os.replace(fname, self.tmp)
+        self.assertEqual(len(BinaryLog(self.tmp)), 0)
+
+    def test_empty(self):
+        bfm = BinaryFileMetric(self.tmp, False)
+        bfm.dump()
+
+        log = BinaryLog(self.tmp)
+        self.assertEqual(log.names, [])
+        self.assertEqual(len(log), 0)
+        self.assertEqual(len(log.read()), 0)
+
+    def test_fork(self):
+        bfm = BinaryFileMetric(self.tmp, False)
+        bfm.metric("erin", 1, 1.0)
+
+        def record(n):
+            bfm.metric("frank", n, float(n))
+            bfm.metric("erin", n, float(n))
+
+        # children's names are interned again by the parent at dump
+        ctx = multiprocessing.get_context('fork')
+        for n in (2, 3):
+            p = ctx.Process(target=record, args=(n,))
+            p.start()
+            p.join()
+            self.assertEqual(p.exitcode, 0)
+
+        bfm.dump()
+
+        log = BinaryLog(self.tmp)
+        self.assertEqual(log.names, ["erin", "frank"])
+        records = log.read()
+        self.assertEqual(records['id'].tolist(), [0, 1, 0, 1, 0])
+        self.assertEqual(sorted(records['count'].tolist()), [1, 2, 2, 3, 3])
+        self.assertFalse([f for f in os.listdir(os.path.dirname(self.tmp))
+                          if f.startswith(os.path.basename(self.tmp) + '.')])
@@ -0,0 +1,52 @@
+import unittest
+
+import instrument
+
+
+class FakeClock(object):
+    """clock advancing a fixed number of nanoseconds per read"""
+
+    def __init__(self, step):
+        self.now = 0
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+class ClockTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.results = []
+        self.metric = lambda name, count, elapsed: self.results.append((name, count, elapsed))
+
+    def test_custom_clock(self):
+        instrument.clock = FakeClock(250)
+
+        list(instrument.all(range(4), name="all", metric=self.metric))
+        list(instrument.each(range(2), name="each", metric=self.metric))
+        list(instrument.first(range(3), name="first", metric=self.metric))
+        with instrument.block(name="block", metric=self.metric):
+            pass
+
+        self.assertEqual(self.results, [
+            # 5 next() calls, 2 clock reads of 250ns each
+            ("all", 4, 1.25e-6),
+            ("each", 1, 2.5e-7),
+            ("each", 1, 2.5e-7),
+            ("first", 1, 2.5e-7),
+            ("block", 1, 2.5e-7),
+        ])
+
+    def test_elapsed_is_float_seconds(self):
+        instrument.clock = FakeClock(1500000000)
+
+        @instrument.function(name="func", metric=self.metric)
+        def func():
+            pass
+
+        func()
+        (name, count, elapsed), = self.results
+        self.assertIsInstance(elapsed, float)
+        self.assertEqual(elapsed, 1.5)
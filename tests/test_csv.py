@@ -3,6 +3,7 @@ import tempfile
 import shutil
 import os
 import unittest
+import multiprocessing
 
 from . import math_is_hard
 
@@ -35,8 +36,41 @@ class CSVFileMetricTestCase(unittest.TestCase):
         s = read_csv(tmp)
         self.assertMultiLineEqual(s, 'alice,10,10.000000\r\nbob,10,10.000000\r\nalice,20,20.000000\r\n')
 
+    def test_fork(self):
+        tmp = tempfile.mktemp()
+        self.addCleanup(os.unlink, tmp)
+
+        csvfm = CSVFileMetric(tmp, False)
+        csvfm.metric("alice", 1, 1.0)
+
+        def record(n):
+            csvfm.metric("bob", n, float(n))
+
+        # children append to the parent's file at dump
+        ctx = multiprocessing.get_context('fork')
+        for n in (2, 3):
+            p = ctx.Process(target=record, args=(n,))
+            p.start()
+            p.join()
+            self.assertEqual(p.exitcode, 0)
+
+        csvfm.dump()
+
+        s = read_csv(tmp)
+        lines = s.splitlines()
+        self.assertEqual(lines[0], 'alice,1,1.000000')
+        self.assertEqual(sorted(lines[1:]), ['bob,2,2.000000', 'bob,3,3.000000'])
+        self.assertEqual(os.listdir(os.path.dirname(tmp)).count(os.path.basename(tmp)), 1)
+        self.assertFalse([f for f in os.listdir(os.path.dirname(tmp))
+                          if f.startswith(os.path.basename(tmp) + '.')])
+
 class CSVDirMetricTestCase(unittest.TestCase):
 
+    def setUp(self):
+        # start afresh; class state persists across tests
+        CSVDirMetric.instances.clear()
+        CSVDirMetric.started = False
+
     def test_csv(self):
         tmp = tempfile.mktemp()
         self.addCleanup(shutil.rmtree, tmp)
@@ -65,3 +99,66 @@ class CSVDirMetricTestCase(unittest.TestCase):
 
         s = read_csv(os.path.join(tmp, 'bob.csv'))
         self.assertMultiLineEqual(s, '10,10.000000\r\n')
+
+    def test_fork(self):
+        tmp = tempfile.mktemp()
+        self.addCleanup(shutil.rmtree, tmp)
+
+        CSVDirMetric.dump_atexit = False
+        CSVDirMetric.outdir = tmp
+
+        def record(n):
+            CSVDirMetric.metric("alice", n, float(n))
+            CSVDirMetric.metric("carol", n, float(n))
+
+        # the parent merges data even when it records nothing itself
+        ctx = multiprocessing.get_context('fork')
+        for n in (1, 2):
+            p = ctx.Process(target=record, args=(n,))
+            p.start()
+            p.join()
+            self.assertEqual(p.exitcode, 0)
+
+        CSVDirMetric.dump()
+        self.assertEqual(sorted(os.listdir(tmp)), ['alice.csv', 'carol.csv'])
+        self.assertEqual(sorted(read_csv(os.path.join(tmp, 'carol.csv')).splitlines()),
+                         ['1,1.000000', '2,2.000000'])
+        self.assertFalse([f for f in os.listdir(os.path.dirname(tmp))
+                          if f.startswith(os.path.basename(tmp) + '.')])
+
+    def test_max_open(self):
+        tmp = tempfile.mktemp()
+        self.addCleanup(shutil.rmtree, tmp)
+
+        CSVDirMetric.dump_atexit = False
+        CSVDirMetric.outdir = tmp
+        self.addCleanup(setattr, CSVDirMetric, 'max_open', CSVDirMetric.max_open)
+        CSVDirMetric.max_open = 2
+
+        names = ["n%d" % i for i in range(5)]
+        for i in range(20):
+            CSVDirMetric.metric(names[i % 5], i, float(i))
+            self.assertLessEqual(len(CSVDirMetric.open_files), 2)
+
+        # least recently used files are closed, and reopened for appending
+        self.assertEqual(list(CSVDirMetric.open_files), ["n3", "n4"])
+        CSVDirMetric.dump()
+
+        self.assertEqual(sorted(os.listdir(tmp)), [n + '.csv' for n in names])
+        for j, n in enumerate(names):
+            s = read_csv(os.path.join(tmp, n + '.csv'))
+            self.assertMultiLineEqual(s, ''.join('%d,%d.000000\r\n' % (i, i) for i in range(j, 20, 5)))
+
+    def test_bad_max_open(self):
+        tmp = tempfile.mktemp()
+        self.addCleanup(shutil.rmtree, tmp)
+
+        CSVDirMetric.dump_atexit = False
+        CSVDirMetric.outdir = tmp
+        self.addCleanup(setattr, CSVDirMetric, 'max_open', CSVDirMetric.max_open)
+        for max_open in (0, -1):
+            CSVDirMetric.max_open = max_open
+            with self.assertRaises(ValueError):
+                CSVDirMetric.metric("oscar", 1, 1.0)
+        self.assertEqual(CSVDirMetric.instances, {})
+        CSVDirMetric.dump()
@@ -0,0 +1,108 @@
+import sqlite3
+import unittest
+
+from instrument.dbapi import connect, fingerprint
+
+class FingerprintTestCase(unittest.TestCase):
+
+    def test_fingerprint(self):
+        self.assertEqual(fingerprint('SELECT a, b FROM users u JOIN posts p ON u.id = p.uid'), 'select.users')
+        self.assertEqual(fingerprint('  insert into "Users" (a) values (?)'), 'insert.users')
+        self.assertEqual(fingerprint('UPDATE OR IGNORE main.users SET a = 1'), 'update.main.users')
+        self.assertEqual(fingerprint('DELETE FROM [users] WHERE id = 1'), 'delete.users')
+        self.assertEqual(fingerprint('-- comment\nCREATE TABLE IF NOT EXISTS users (id)'), 'create.users')
+        self.assertEqual(fingerprint('/* hint */ DROP INDEX idx'), 'drop.idx')
+        self.assertEqual(fingerprint('WITH t AS (SELECT * FROM a) SELECT * FROM t'), 'select.t')
+        self.assertEqual(fingerprint('BEGIN'), 'begin')
+        self.assertEqual(fingerprint(''), 'empty')
+
+    def test_fingerprint_types(self):
+        class Composed(object):
+            def as_string(self, context):
+                return 'SELECT * FROM %s' % context
+
+            def __str__(self):
+                return 'DELETE FROM comments'
+
+        self.assertEqual(fingerprint(b'SELECT * FROM users'), 'select.users')
+        self.assertEqual(fingerprint(Composed(), 'posts'), 'select.posts')
+        # without a context, other objects are rendered with str()
+        self.assertEqual(fingerprint(Composed()), 'delete.comments')
+
+    def test_cache(self):
+        sql = 'SELECT * FROM cached_table'
+        fingerprint(sql)
+        hits = fingerprint.cache_info().hits
+        fingerprint(sql)
+        self.assertEqual(fingerprint.cache_info().hits, hits + 1)
+
+class DBAPITestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.results = []
+        metric = lambda name, count, elapsed: self.results.append((name, count))
+        self.conn = connect(sqlite3.connect(':memory:'), metric=metric)
+        self.addCleanup(self.conn.close)
+
+    def test_cursor(self):
+        cur = self.conn.cursor()
+        cur.execute('CREATE TABLE users (id INTEGER, name TEXT)')
+        cur.executemany('INSERT INTO users VALUES (?, ?)', [(1, 'alice'), (2, 'bob'), (3, 'carol')])
+        # iterators are counted as consumed
+        cur.executemany('INSERT INTO users VALUES (?, ?)', ((i, 'x') for i in range(4, 6)))
+        self.conn.commit()
+
+        cur.execute('SELECT name FROM users ORDER BY id')
+        self.assertEqual(cur.fetchone(), ('alice',))
+        self.assertEqual(cur.fetchmany(2), [('bob',), ('carol',)])
+        self.assertEqual(len(cur.fetchall()), 2)
+        self.assertIsNone(cur.fetchone())
+
+        self.assertEqual(self.results, [
+            ('sql.create.users.execute', 1),
+            ('sql.insert.users.executemany', 3),
+            ('sql.insert.users.executemany', 2),
+            ('sql.select.users.execute', 1),
+            ('sql.select.users.fetch', 1),
+            ('sql.select.users.fetch', 2),
+            ('sql.select.users.fetch', 2),
+            ('sql.select.users.fetch', 0),
+        ])
+
+    def test_iterate(self):
+        self.conn.execute('CREATE TABLE t (x)')
+        self.conn.executemany('INSERT INTO t VALUES (?)', [(i,) for i in range(5)])
+        del self.results[:]
+
+        # cursor is proxied, like the connection
+        cur = self.conn.execute('SELECT x FROM t')
+        self.assertIsNotNone(cur.description)
+        self.assertEqual([row[0] for row in cur], list(range(5)))
+        self.assertEqual(self.results, [('sql.select.t.execute', 1), ('sql.select.t.fetch', 5)])
+
+    def test_error(self):
+        with self.assertRaises(sqlite3.OperationalError):
+            self.conn.execute('SELECT * FROM missing')
+        self.assertEqual(self.results, [('sql.select.missing.execute', 1)])
+
+    def test_context_manager(self):
+        self.conn.execute('CREATE TABLE t (x)')
+        with self.conn as conn:
+            self.assertIs(conn, self.conn)
+            conn.execute('INSERT INTO t VALUES (1)')
+        self.assertEqual(self.conn.execute('SELECT count(*) FROM t').fetchone(), (1,))
+
+    def test_setattr(self):
+        self.conn.execute('CREATE TABLE t (x)')
+        self.conn.executemany('INSERT INTO t VALUES (?)', [(i,) for i in range(10)])
+
+        # attributes are set on the wrapped connection & cursor
+        self.conn.row_factory = sqlite3.Row
+        cur = self.conn.execute('SELECT x FROM t')
+        self.assertEqual(cur.fetchone()['x'], 0)
+
+        cur.arraysize = 5
+        self.assertEqual(len(cur.fetchmany()), 5)
+
+        del self.conn.row_factory
+        self.assertIsNone(self.conn.row_factory)
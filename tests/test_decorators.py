@@ -0,0 +1,74 @@
+import gc
+import weakref
+import unittest
+
+import instrument
+
+class DecoratorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.results = []
+        metric = lambda name, count, elapsed: self.results.append((name, count))
+
+        class Base(object):
+            @instrument.function(metric=metric)
+            def func(self, x):
+                "func docstring"
+                return x
+
+            @instrument.all(metric=metric)
+            def gen(self, n):
+                return range(n)
+
+            @instrument.reducer(metric=metric)
+            def reduce(self, *args):
+                return sum(args)
+
+        class Derived(Base):
+            pass
+
+        self.Base = Base
+        self.Derived = Derived
+
+    def test_names(self):
+        base, derived = self.Base(), self.Derived()
+        self.assertEqual(base.func(1), 1)
+        self.assertEqual(derived.func(2), 2)
+        self.assertEqual(list(derived.gen(3)), [0, 1, 2])
+        self.assertEqual(derived.reduce(1, 2, 3), 6)
+
+        self.assertEqual(self.results, [
+            (__name__ + '.Base.func', 1),
+            (__name__ + '.Derived.func', 1),
+            (__name__ + '.Derived.gen', 3),
+            (__name__ + '.Derived.reduce', 3),
+        ])
+
+    def test_cached(self):
+        a, b = self.Base(), self.Base()
+        for attr in ['func', 'gen', 'reduce']:
+            # one function per class, bound like a plain method
+            self.assertIs(getattr(a, attr).__func__, getattr(b, attr).__func__)
+            self.assertIs(getattr(a, attr).__self__, a)
+            self.assertIsNot(getattr(a, attr).__func__, getattr(self.Derived(), attr).__func__)
+
+        self.assertEqual(a.func.__doc__, "func docstring")
+        self.assertEqual(a.func.__name__, "func")
+
+    def test_class_access(self):
+        base = self.Base()
+        self.assertEqual(self.Base.func(base, 4), 4)
+        self.assertEqual(self.Base.reduce(base, 4, 5), 9)
+        self.assertEqual(self.results, [(__name__ + '.Base.func', 1), (__name__ + '.Base.reduce', 2)])
+
+    def test_class_freed(self):
+        # cached methods don't keep dynamically created classes alive
+        Dynamic = type('Dynamic', (self.Base,), {})
+        obj = Dynamic()
+        for attr in ['func', 'gen', 'reduce']:
+            getattr(obj, attr)
+        ref = weakref.ref(Dynamic)
+
+        del Dynamic, obj
+        gc.collect()
+        self.assertIsNone(ref())
@@ -0,0 +1,137 @@
+import tempfile
+import shutil
+import os
+import threading
+import unittest
+from io import StringIO
+
+from instrument.output import flush
+from instrument.output.flush import Flusher
+from instrument.output.csv import CSVFileMetric, CSVDirMetric
+from instrument.output.binlog import BinaryFileMetric, BinaryLog
+from instrument.output.table import TableMetric
+from instrument.output.plot import PlotMetric
+
+
+def read_csv(fname):
+    with open(fname, newline='') as fh:
+        return fh.read()
+
+class RotateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def test_csv_file(self):
+        outfile = os.path.join(self.tmp, 'metrics.csv')
+        csvfm = CSVFileMetric(outfile, False)
+
+        for i in range(3):
+            csvfm.metric("alice", i, float(i))
+            csvfm.rotate(keep=2)
+        # nothing recorded, so nothing to rotate
+        csvfm.rotate(keep=2)
+        csvfm.metric("alice", 3, 3.0)
+        csvfm.dump()
+
+        # oldest rotated file is removed
+        rotated = flush.rotated_paths(outfile)
+        self.assertEqual(len(rotated), 2)
+        self.assertEqual([read_csv(f) for f in rotated], ['alice,1,1.000000\r\n', 'alice,2,2.000000\r\n'])
+        self.assertEqual(read_csv(outfile), 'alice,3,3.000000\r\n')
+
+    def test_csv_dir(self):
+        outdir = os.path.join(self.tmp, 'csv')
+        CSVDirMetric.dump_atexit = False
+        CSVDirMetric.outdir = outdir
+        CSVDirMetric.instances.clear()
+        CSVDirMetric.started = False
+
+        CSVDirMetric.metric("alice", 1, 1.0)
+        CSVDirMetric.metric("bob", 1, 1.0)
+        CSVDirMetric.rotate()
+        CSVDirMetric.metric("alice", 2, 2.0)
+        CSVDirMetric.dump()
+
+        rotated, = flush.rotated_paths(outdir)
+        self.assertEqual(sorted(os.listdir(rotated)), ['alice.csv', 'bob.csv'])
+        self.assertEqual(read_csv(os.path.join(rotated, 'alice.csv')), '1,1.000000\r\n')
+        self.assertEqual(os.listdir(outdir), ['alice.csv'])
+        self.assertEqual(read_csv(os.path.join(outdir, 'alice.csv')), '2,2.000000\r\n')
+
+    def test_binlog(self):
+        outfile = os.path.join(self.tmp, 'metrics.bin')
+        bfm = BinaryFileMetric(outfile, False)
+
+        bfm.metric("alice", 1, 1.0)
+        bfm.rotate()
+        bfm.metric("bob", 2, 2.0)
+        bfm.dump()
+
+        rotated, = flush.rotated_paths(outfile)
+        self.assertEqual(BinaryLog(rotated).names, ["alice"])
+        # names are interned afresh in each file
+        log = BinaryLog(outfile)
+        self.assertEqual(log.names, ["bob"])
+        self.assertEqual(log.read()['count'].tolist(), [2])
+
+    def test_table(self):
+        TableMetric.dump_atexit = False
+        TableMetric.outfile = StringIO()
+
+        TableMetric.metric("alice", 1, 1.0)
+        TableMetric.rotate()
+        TableMetric.rotate()
+        TableMetric.metric("bob", 2, 2.0)
+        TableMetric.dump()
+
+        lines = TableMetric.outfile.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("Metrics at "))
+        self.assertEqual(lines[2].split()[0], "alice")
+        self.assertEqual(lines[3].split()[0], "Name")
+        self.assertEqual(lines[4].split()[0], "bob")
+        self.assertEqual(len(lines), 5)
+
+    def test_plot(self):
+        outdir = os.path.join(self.tmp, 'plots')
+        PlotMetric.dump_atexit = False
+        PlotMetric.outdir = outdir
+
+        for name in ("alice", "bob", "carol"):
+            PlotMetric.metric(name, 1, 1.0)
+            PlotMetric.rotate(keep=2)
+
+        rotated = flush.rotated_paths(outdir)
+        self.assertEqual([os.listdir(d) for d in rotated], [['bob.png'], ['carol.png']])
+        self.assertFalse(os.path.exists(outdir))
+
+class FlusherTestCase(unittest.TestCase):
+
+    def test_flusher(self):
+        class Target(object):
+            def __init__(self):
+                self.event = threading.Event()
+                self.keep = None
+
+            def rotate(self, keep):
+                self.keep = keep
+                self.event.set()
+
+        class Broken(object):
+            def rotate(self, keep):
+                raise RuntimeError("oops")
+
+        target = Target()
+        flusher = Flusher([Broken(), target], interval=0.01, keep=3)
+        self.addCleanup(flusher.stop)
+
+        # errors are logged & don't stop other targets
+        with self.assertLogs('instrument.output.flush', 'ERROR'):
+            for i in range(2):
+                self.assertTrue(target.event.wait(5))
+                target.event.clear()
+        self.assertEqual(target.keep, 3)
+
+        flusher.stop()
+        self.assertFalse(flusher.thread.is_alive())
@@ -0,0 +1,66 @@
+import unittest
+from io import StringIO
+
+from . import math_is_hard
+
+import instrument
+from instrument.output.histogram import Histogram, HistogramMetric
+
+class HistogramTestCase(unittest.TestCase):
+
+    def test_percentiles(self):
+        hist = Histogram()
+        for i in range(1, 1001):
+            hist.add(i / 1000)
+
+        self.assertEqual(hist.n, 1000)
+        for q, expected in [(50, .5), (90, .9), (99, .99), (99.9, .999)]:
+            self.assertAlmostEqual(hist.percentile(q), expected, delta=expected * hist.precision)
+        self.assertEqual(hist.percentile(100), 1.0)
+        self.assertEqual(hist.percentile(0), 0.001)
+
+    def test_clamp(self):
+        hist = Histogram(lowest=1e-3, highest=1.0)
+        hist.add(0)
+        hist.add(5.0)
+        self.assertEqual(hist.percentile(50), 0.0)
+        self.assertEqual(hist.percentile(100), 5.0)
+
+    def test_merge(self):
+        a, b, c = Histogram(), Histogram(), Histogram()
+        for i in range(1, 101):
+            (a if i % 2 else b).add(i)
+            c.add(i)
+
+        a.merge(b)
+        self.assertEqual(a.buckets, c.buckets)
+        self.assertEqual((a.n, a.total, a.min, a.max), (c.n, c.total, c.min, c.max))
+
+        with self.assertRaises(ValueError):
+            a.merge(Histogram(precision=0.1))
+
+class HistogramMetricTestCase(unittest.TestCase):
+
+    def test_dump(self):
+        HistogramMetric.dump_atexit = False
+        HistogramMetric.outfile = StringIO()
+
+        list(instrument.all(math_is_hard(10), metric=HistogramMetric.metric, name="alice"))
+        list(instrument.all(math_is_hard(20), metric=HistogramMetric.metric, name="alice"))
+        list(instrument.all(math_is_hard(10), metric=HistogramMetric.metric, name="bob"))
+
+        # unnamed metrics are dropped
+        list(instrument.all(math_is_hard(10), metric=HistogramMetric.metric))
+
+        HistogramMetric.dump()
+        lines = [l.split() for l in HistogramMetric.outfile.getvalue().splitlines()]
+        self.assertEqual(lines, [
+            ['Elapsed', '(seconds)'],
+            ['Name', 'Samples', 'p50', 'p90', 'p99', 'p99.9', 'Max'],
+            ['alice', '2', '10.000000', '20.000000', '20.000000', '20.000000', '20.000000'],
+            ['bob', '1', '10.000000', '10.000000', '10.000000', '10.000000', '10.000000'],
+            ['Per', 'Item', '(seconds)'],
+            ['Name', 'Samples', 'p50', 'p90', 'p99', 'p99.9', 'Max'],
+            ['alice', '2', '1.000000', '1.000000', '1.000000', '1.000000', '1.000000'],
+            ['bob', '1', '1.000000', '1.000000', '1.000000', '1.000000', '1.000000'],
+        ])
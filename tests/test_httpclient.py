@@ -0,0 +1,106 @@
+import threading
+import unittest
+import http.client
+import urllib.request
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from instrument import httpclient
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'x' * 100
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.end_headers()
+        self.wfile.write(body + b'\n' + body)
+        self.close_connection = True
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '100')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+class HTTPClientTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.results = []
+        self.metric = lambda name, count, elapsed: self.results.append((name, count, elapsed))
+        httpclient.install(metric=self.metric)
+        self.addCleanup(httpclient.uninstall)
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.addCleanup(self.server.server_close)
+        self.host = '127.0.0.1:%d' % self.server.server_port
+
+    def serve(self, requests=1):
+        thread = threading.Thread(target=lambda: [self.server.handle_request() for i in range(requests)])
+        thread.start()
+        self.addCleanup(thread.join)
+
+    def test_connection(self):
+        # keep-alive connection, reading in pieces
+        self.serve()
+        conn = http.client.HTTPConnection(self.host)
+        self.addCleanup(conn.close)
+        conn.request('GET', '/')
+        response = conn.getresponse()
+        self.assertEqual(response.read(30), b'x' * 30)
+        buf = bytearray(50)
+        self.assertEqual(response.readinto(buf), 50)
+        self.assertEqual(response.read(), b'x' * 20)
+
+        conn.request('HEAD', '/')
+        response = conn.getresponse()
+        self.assertEqual(response.read(), b'')
+
+        name = 'http.%s.' % self.host
+        self.assertEqual([r[:2] for r in self.results], [
+            (name + 'GET.connect', 1),
+            (name + 'GET.first', 1),
+            (name + 'GET.all', 100),
+            (name + 'HEAD.first', 1),
+            (name + 'HEAD.all', 0),
+        ])
+        self.assertTrue(all(elapsed >= 0 for name, count, elapsed in self.results))
+
+    def test_urlopen(self):
+        self.serve()
+        url = 'http://%s/submit' % self.host
+        with urllib.request.urlopen(url, data=b'abc') as response:
+            self.assertEqual(response.readline(), b'abc\n')
+            self.assertEqual(list(response), [b'abc'])
+
+        name = 'http.%s.' % self.host
+        self.assertEqual([r[:2] for r in self.results], [
+            (name + 'POST.connect', 1),
+            (name + 'POST.first', 1),
+            (name + 'POST.all', 7),
+        ])
+
+    def test_uninstall(self):
+        httpclient.uninstall()
+        self.assertFalse(hasattr(http.client.HTTPConnection.connect, '__wrapped__'))
+        self.assertFalse(hasattr(http.client.HTTPResponse.read, '__wrapped__'))
+
+        self.serve()
+        with urllib.request.urlopen('http://%s/' % self.host) as response:
+            response.read()
+        self.assertEqual(self.results, [])
+
+    def test_name(self):
+        # names omit default ports
+        conn = http.client.HTTPConnection('localhost')
+        conn._method = 'PUT'
+        self.assertEqual(httpclient._name(conn, 'api'), 'api.localhost.PUT')
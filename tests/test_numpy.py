@@ -0,0 +1,29 @@
+import unittest
+
+import numpy as np
+
+from instrument.output._numpy import Moments
+
+class MomentsTestCase(unittest.TestCase):
+
+    def test_chunks(self):
+        rng = np.random.default_rng(42)
+        ids = rng.integers(0, 5, 1000)
+        values = rng.exponential(3.0, 1000)
+
+        moments = Moments(6)
+        # uneven chunk sizes
+        for start, stop in [(0, 1), (1, 100), (100, 101), (101, 777), (777, 1000)]:
+            moments.update(ids[start:stop], values[start:stop])
+
+        for i in range(5):
+            data = values[ids == i]
+            mean, std, min_, max_ = moments[i]
+            self.assertEqual(moments.n[i], len(data))
+            self.assertAlmostEqual(mean, np.mean(data))
+            self.assertAlmostEqual(std, np.std(data))
+            self.assertEqual(min_, np.min(data))
+            self.assertEqual(max_, np.max(data))
+
+        # unused ids are left alone
+        self.assertEqual(moments.n[5], 0)
@@ -0,0 +1,56 @@
+import re
+import unittest
+
+from instrument.output import make_multi_metric, make_routing_metric
+
+class RoutingMetricTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.results = []
+
+    def recorder(self, label):
+        return lambda name, count, elapsed: self.results.append((label, name, count))
+
+    def test_routes(self):
+        everything = self.recorder('log')
+        route = make_routing_metric([
+            ('*.debug', None),
+            ('db.*', make_multi_metric(everything, self.recorder('plot'))),
+            (re.compile(r'cache\.(hit|miss)$'), self.recorder('table')),
+        ], default=everything)
+
+        route('db.query', 1, 0.1)
+        route('db.debug', 2, 0.1)
+        route('cache.hit', 3, 0.1)
+        route('cache.hits', 4, 0.1)
+        route(None, 5, 0.1)
+
+        self.assertEqual(self.results, [
+            ('log', 'db.query', 1),
+            ('plot', 'db.query', 1),
+            ('table', 'cache.hit', 3),
+            ('log', 'cache.hits', 4),
+            ('log', None, 5),
+        ])
+
+    def test_drop(self):
+        # unmatched names are dropped by default
+        route = make_routing_metric([('a.*', self.recorder('a'))])
+        route('b', 1, 0.1)
+        route('a.b', 1, 0.1)
+        self.assertEqual(self.results, [('a', 'a.b', 1)])
+
+    def test_cache(self):
+        calls = []
+        class Pattern(object):
+            def match(self, name):
+                calls.append(name)
+                return name == 'x'
+
+        route = make_routing_metric([(Pattern(), self.recorder('x'))], max_names=3)
+        for name in ('x', 'y', 'x', 'y', 'z', 'z'):
+            route(name, 1, 0.1)
+
+        # matched once per name, until the cache is full
+        self.assertEqual(calls, ['x', 'y', 'z', 'z'])
+        self.assertEqual(self.results, [('x', 'x', 1)] * 2)
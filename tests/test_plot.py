@@ -2,11 +2,14 @@ import tempfile
 import shutil
 import os
 import unittest
+import multiprocessing.pool
+from unittest import mock
 
 from . import math_is_hard
 
 import instrument
 from instrument.output.plot import PlotMetric
+from instrument.output.csv import CSVFileMetric
 
 class PlotMetricTestCase(unittest.TestCase):
 
@@ -30,3 +33,105 @@ class PlotMetricTestCase(unittest.TestCase):
 
         # just test that files were created
         self.assertEqual(sorted(os.listdir(tmp)), ['alice.png', 'bob.png'])
+
+    def test_chunks(self):
+        tmp = tempfile.mktemp()
+        self.addCleanup(shutil.rmtree, tmp)
+
+        PlotMetric.dump_atexit = False
+        PlotMetric.outdir = tmp
+        self.addCleanup(setattr, PlotMetric, 'chunk_size', PlotMetric.chunk_size)
+        self.addCleanup(setattr, PlotMetric, 'max_points', PlotMetric.max_points)
+        PlotMetric.chunk_size = 7
+        PlotMetric.max_points = 10
+
+        for i in range(95):
+            PlotMetric.metric("carol", i, i / 10)
+
+        PlotMetric.dump()
+        self.assertEqual(os.listdir(tmp), ['carol.png'])
+
+    def test_timestamps(self):
+        tmp = tempfile.mktemp()
+        self.addCleanup(shutil.rmtree, tmp)
+
+        PlotMetric.dump_atexit = False
+        PlotMetric.outdir = tmp
+        self.addCleanup(setattr, PlotMetric, 'timestamps', False)
+        PlotMetric.timestamps = True
+
+        list(instrument.each(math_is_hard(10), metric=PlotMetric.metric, name="alice"))
+        list(instrument.each(math_is_hard(5), metric=PlotMetric.metric, name="bob"))
+
+        PlotMetric.dump()
+        self.assertEqual(sorted(os.listdir(tmp)), ['alice.png', 'bob.png'])
+
+    def test_density(self):
+        tmp = tempfile.mktemp()
+        self.addCleanup(shutil.rmtree, tmp)
+
+        PlotMetric.dump_atexit = False
+        PlotMetric.outdir = tmp
+        self.addCleanup(setattr, PlotMetric, 'chunk_size', PlotMetric.chunk_size)
+        self.addCleanup(setattr, PlotMetric, 'max_points', PlotMetric.max_points)
+        PlotMetric.chunk_size = 7
+        PlotMetric.max_points = 10
+
+        for i in range(95):
+            PlotMetric.metric("dave", i % 10, i / 10)
+        for i in range(10):
+            PlotMetric.metric("erin", i, i / 10)
+
+        plots = []
+        with mock.patch.object(PlotMetric, '_render_all', plots.extend):
+            PlotMetric.dump()
+
+        dave, erin = sorted(plots, key=lambda plot: plot['name'])
+        # too many points are summed into a density plot, chunk by chunk
+        self.assertNotIn('points', dave)
+        count_edges, elapsed_edges, density = dave['density']
+        self.assertEqual(density.shape, (PlotMetric.density_bins, PlotMetric.density_bins))
+        self.assertEqual(density.sum(), 95)
+        self.assertEqual(len(erin['points']), 10)
+
+    def test_processes(self):
+        for processes in (1, 3):
+            tmp = tempfile.mktemp()
+            self.addCleanup(shutil.rmtree, tmp)
+
+            PlotMetric.dump_atexit = False
+            PlotMetric.outdir = tmp
+            self.addCleanup(setattr, PlotMetric, 'processes', PlotMetric.processes)
+            PlotMetric.processes = processes
+
+            names = ["frank%d" % i for i in range(5)]
+            for name in names:
+                PlotMetric.metric(name, 1, 1.0)
+
+            with mock.patch('multiprocessing.pool.Pool.imap_unordered', autospec=True,
+                            side_effect=multiprocessing.pool.Pool.imap_unordered) as imap:
+                PlotMetric.dump()
+            self.assertEqual(imap.called, processes > 1)
+            self.assertEqual(sorted(os.listdir(tmp)), [name + '.png' for name in names])
+
+    def test_no_fork(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+
+        # other outputs' fork handlers would save data from forked workers
+        csvfm = CSVFileMetric(os.path.join(tmp, 'out.csv'), dump_atexit=False)
+        csvfm.metric("grace", 1, 1.0)
+        forks = []
+        os.register_at_fork(before=lambda: forks.append(True))
+
+        PlotMetric.dump_atexit = False
+        PlotMetric.outdir = os.path.join(tmp, 'plots')
+        self.addCleanup(setattr, PlotMetric, 'processes', PlotMetric.processes)
+        PlotMetric.processes = 3
+        for i in range(3):
+            PlotMetric.metric("heidi%d" % i, 1, 1.0)
+        PlotMetric.dump()
+        csvfm.dump()
+
+        self.assertEqual(forks, [])
+        self.assertEqual(sorted(os.listdir(tmp)), ['out.csv', 'plots'])
@@ -0,0 +1,81 @@
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+import instrument
+from instrument.output.prometheus import PrometheusMetric
+
+class PrometheusMetricTestCase(unittest.TestCase):
+
+    def test_collect(self):
+        pm = PrometheusMetric(buckets=(1, 0.1))
+        with instrument.block(name="alice", metric=pm.metric, count=3):
+            pass
+        pm.metric("alice", 2, 0.5)
+        pm.metric('bob "b"', 1, 5.0)
+
+        self.assertEqual(pm.collect().split('\n'), [
+            '# HELP instrument_items_total Number of items measured.',
+            '# TYPE instrument_items_total counter',
+            'instrument_items_total{name="alice"} 5',
+            'instrument_items_total{name="bob \\"b\\""} 1',
+            '# HELP instrument_elapsed_seconds Elapsed time of measurements.',
+            '# TYPE instrument_elapsed_seconds histogram',
+            'instrument_elapsed_seconds_bucket{name="alice",le="0.1"} 1',
+            'instrument_elapsed_seconds_bucket{name="alice",le="1.0"} 2',
+            'instrument_elapsed_seconds_bucket{name="alice",le="+Inf"} 2',
+            'instrument_elapsed_seconds_sum{name="alice"} 0.5',
+            'instrument_elapsed_seconds_count{name="alice"} 2',
+            'instrument_elapsed_seconds_bucket{name="bob \\"b\\"",le="0.1"} 0',
+            'instrument_elapsed_seconds_bucket{name="bob \\"b\\"",le="1.0"} 0',
+            'instrument_elapsed_seconds_bucket{name="bob \\"b\\"",le="+Inf"} 1',
+            'instrument_elapsed_seconds_sum{name="bob \\"b\\""} 5.0',
+            'instrument_elapsed_seconds_count{name="bob \\"b\\""} 1',
+            '',
+        ])
+
+    def test_threads(self):
+        pm = PrometheusMetric()
+
+        def record():
+            for i in range(1000):
+                pm.metric("carol", 2, 0.001)
+
+        threads = [threading.Thread(target=record) for i in range(4)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+
+        # one shard per thread, summed on collection
+        self.assertEqual(len(pm.shards), 4)
+        totals = pm.totals()
+        self.assertEqual(totals["carol"][0], 8000)
+        self.assertEqual(sum(totals["carol"][2:]), 4000)
+
+        # exited threads' shards are folded into the base total & dropped
+        self.assertEqual(pm.shards, {})
+        pm.metric("carol", 1, 0.001)
+        totals = pm.totals()
+        self.assertEqual(totals["carol"][0], 8001)
+        self.assertEqual(sum(totals["carol"][2:]), 4001)
+        self.assertEqual(list(pm.shards), [threading.current_thread()])
+
+    def test_server(self):
+        pm = PrometheusMetric(port=0, namespace='app')
+        self.addCleanup(pm.stop)
+        pm.metric("dave", 1, 0.01)
+
+        url = 'http://127.0.0.1:%d/metrics' % pm.server.server_port
+        with urllib.request.urlopen(url) as response:
+            self.assertEqual(response.headers['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+            body = response.read().decode('utf-8')
+        self.assertIn('app_items_total{name="dave"} 1\n', body)
+        self.assertIn('app_elapsed_seconds_bucket{name="dave",le="0.01"} 1\n', body)
+
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            urllib.request.urlopen('http://127.0.0.1:%d/other' % pm.server.server_port)
+        self.assertEqual(cm.exception.code, 404)
+        cm.exception.close()
+
+        pm.stop()
+        self.assertIsNone(pm.server)
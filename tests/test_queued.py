@@ -0,0 +1,119 @@
+import threading
+import unittest
+from unittest import mock
+
+import instrument
+from instrument.output.queued import QueuedMetric
+
+class QueuedMetricTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.results = []
+        self.threads = []
+
+    def record(self, name, count, elapsed):
+        self.results.append((name, count, elapsed))
+        self.threads.append(threading.current_thread())
+
+    def test_dump(self):
+        qm = QueuedMetric(self.record, dump_atexit=False)
+
+        with instrument.block(name="alice", metric=qm.metric, count=3):
+            pass
+        qm.metric("bob", 1, 1.0)
+
+        qm.dump()
+        self.assertFalse(qm.thread.is_alive())
+        self.assertEqual([r[:2] for r in self.results], [("alice", 3), ("bob", 1)])
+        self.assertEqual(self.threads, [qm.thread] * 2)
+
+        # called directly once stopped
+        qm.metric("carol", 1, 1.0)
+        self.assertEqual(self.results[-1], ("carol", 1, 1.0))
+        self.assertIs(self.threads[-1], threading.current_thread())
+
+    def test_flush(self):
+        qm = QueuedMetric(self.record, self.record, batch_size=2, dump_atexit=False)
+        self.addCleanup(qm.dump)
+
+        for i in range(5):
+            qm.metric("dave", i, 0.1)
+        qm.flush()
+        self.assertEqual([r[1] for r in self.results], [0, 0, 1, 1, 2, 2, 3, 3, 4, 4])
+        self.assertTrue(qm.thread.is_alive())
+
+    def blocked(self, **kwargs):
+        """a QueuedMetric whose thread waits on an event"""
+        release = threading.Event()
+        def wait(name, count, elapsed):
+            release.wait()
+            self.record(name, count, elapsed)
+
+        qm = QueuedMetric(wait, maxsize=2, dump_atexit=False, **kwargs)
+        qm.metric("first", 1, 0.1)
+        # wait for the thread to take the first event
+        while not qm.queue.empty():
+            threading.Event().wait(0.001)
+        return qm, release
+
+    def test_drop(self):
+        qm, release = self.blocked()
+        for i in range(4):
+            qm.metric("erin", i, 0.1)
+        self.assertEqual(qm.dropped, 2)
+
+        release.set()
+        qm.dump()
+        self.assertEqual([r[:2] for r in self.results], [("first", 1), ("erin", 0), ("erin", 1)])
+
+    def test_block(self):
+        qm, release = self.blocked(block=True)
+        qm.metric("frank", 0, 0.1)
+        qm.metric("frank", 1, 0.1)
+
+        thread = threading.Thread(target=qm.metric, args=("frank", 2, 0.1))
+        thread.start()
+        thread.join(0.1)
+        self.assertTrue(thread.is_alive())
+
+        release.set()
+        thread.join()
+        qm.dump()
+        self.assertEqual(qm.dropped, 0)
+        self.assertEqual([r[1] for r in self.results], [1, 0, 1, 2])
+
+    def test_error(self):
+        def broken(name, count, elapsed):
+            raise RuntimeError("oops")
+
+        qm = QueuedMetric(broken, self.record, dump_atexit=False)
+        with mock.patch('sys.stderr') as stderr:
+            qm.metric("grace", 1, 0.1)
+            qm.dump()
+        self.assertEqual(self.results, [("grace", 1, 0.1)])
+        self.assertTrue(stderr.write.called)
+
+    def test_metric_at(self):
+        ends = []
+        class Timed(object):
+            @classmethod
+            def metric(cls, name, count, elapsed):
+                raise AssertionError("metric_at should be called")
+
+            @classmethod
+            def metric_at(cls, name, count, elapsed, end):
+                ends.append(end)
+                self.record(name, count, elapsed)
+
+        release = threading.Event()
+        qm = QueuedMetric(lambda *args: release.wait(), Timed.metric, dump_atexit=False)
+        before = instrument.clock()
+        qm.metric("heidi", 1, 0.1)
+        after = instrument.clock()
+        threading.Event().wait(0.01)
+        release.set()
+        qm.dump()
+
+        # stamped when queued, not when the thread got to it
+        self.assertEqual(self.results, [("heidi", 1, 0.1)])
+        self.assertTrue(before <= ends[0] <= after)
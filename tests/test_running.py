@@ -0,0 +1,77 @@
+import unittest
+import threading
+import statistics
+from io import StringIO
+
+from . import math_is_hard
+
+import instrument
+from instrument.output.running import RunningStats, RunningMetric
+
+class RunningStatsTestCase(unittest.TestCase):
+
+    def test_stats(self):
+        data = [2, 4, 4, 4, 5, 5, 7, 9]
+        stats = RunningStats()
+        for x in data:
+            stats.add(x)
+
+        self.assertEqual(stats.n, 8)
+        self.assertEqual(stats.total, 40)
+        self.assertEqual(stats.mean, 5)
+        self.assertAlmostEqual(stats.std, statistics.pstdev(data))
+        self.assertEqual((stats.min, stats.max), (2, 9))
+
+    def test_empty(self):
+        self.assertEqual(RunningStats().std, 0.0)
+
+class RunningMetricTestCase(unittest.TestCase):
+
+    def test_dump(self):
+        rm = RunningMetric(StringIO(), interval=None, dump_atexit=False)
+
+        list(instrument.all(math_is_hard(10), metric=rm.metric, name="alice"))
+        list(instrument.all(math_is_hard(20), metric=rm.metric, name="alice"))
+
+        list(instrument.all(math_is_hard(10), metric=rm.metric, name="bob"))
+
+        # unnamed metrics are dropped
+        list(instrument.all(math_is_hard(10), metric=rm.metric))
+
+        # nothing is output until dump
+        self.assertEqual(rm.outfile.getvalue(), '')
+
+        rm.dump()
+        result = 'Name         Count Mean        Count Stddev        Count Min        Count Max        Elapsed Mean        Elapsed Stddev        Elapsed Min        Elapsed Max        \nalice          15.00               5.00              10.00            20.00             15.00                 5.00                10.00              20.00           \nbob            10.00               0.00              10.00            10.00             10.00                 0.00                10.00              10.00           \n'
+        self.assertMultiLineEqual(rm.outfile.getvalue(), result)
+
+    def test_interval(self):
+        rm = RunningMetric(StringIO(), interval=0.01, dump_atexit=False)
+        self.addCleanup(rm.dump)
+
+        rm.metric("alice", 1, 1.0)
+        rm.metric("alice", 3, 2.0)
+
+        # reported by the background thread, without further metrics
+        while rm.outfile.getvalue().count('Name') < 2:
+            threading.Event().wait(0.01)
+        rm.dump()
+        self.assertIsNone(rm.thread)
+
+        tables = rm.outfile.getvalue().split('Name')
+        self.assertEqual(tables[-1].splitlines()[1].split(),
+                         ['alice', '2.00', '1.00', '1.00', '3.00', '1.50', '0.50', '1.00', '2.00'])
+
+    def test_columns(self):
+        rm = RunningMetric(StringIO(), interval=None, dump_atexit=False,
+                           columns=['samples', 'count_total', 'elapsed_max'])
+        rm.metric("bob", 2, 1.0)
+        rm.metric("bob", 3, 4.0)
+        rm.dump()
+
+        lines = rm.outfile.getvalue().splitlines()
+        self.assertEqual(lines[0].split(), ['Name', 'Samples', 'Count', 'Total', 'Elapsed', 'Max'])
+        self.assertEqual(lines[1].split(), ['bob', '2', '5.00', '4.00'])
+
+        with self.assertRaises(ValueError):
+            RunningMetric(columns=['elapsed_p99'], interval=None, dump_atexit=False)
@@ -0,0 +1,109 @@
+import random
+import unittest
+
+from . import math_is_hard
+
+import instrument
+from instrument.output.sampling import SampledMetric, EveryNthMetric, RandomMetric, ReservoirMetric
+
+class Recorder(object):
+    def __init__(self):
+        self.results = []
+
+    def __call__(self, name, count, elapsed):
+        self.results.append((name, count, elapsed))
+
+class CountingClock(object):
+    def __init__(self):
+        self.reads = 0
+
+    def __call__(self):
+        self.reads += 1
+        return self.reads * 1000
+
+class SampledMetricTestCase(unittest.TestCase):
+
+    def test_abstract(self):
+        with self.assertRaises(TypeError):
+            SampledMetric(Recorder())
+
+class EveryNthMetricTestCase(unittest.TestCase):
+
+    def test_sample(self):
+        rec = Recorder()
+        metric = EveryNthMetric(rec, 3)
+        for i in range(7):
+            metric("alice", 2, float(i))
+
+        self.assertEqual(rec.results, [("alice", 6, 0.0), ("alice", 6, 3.0), ("alice", 6, 6.0)])
+
+    def test_each_skips_clock(self):
+        rec = Recorder()
+        instrument.clock = clock = CountingClock()
+
+        result = list(instrument.each(range(10), name="bob", metric=EveryNthMetric(rec, 5)))
+        self.assertEqual(result, list(range(10)))
+        self.assertEqual([r[:2] for r in rec.results], [("bob", 5), ("bob", 5)])
+        # only sampled items read the clock: items 0 & 5, plus final next() for "item" 10
+        self.assertEqual(clock.reads, 5)
+
+    def test_each_time(self):
+        rec = Recorder()
+        list(instrument.each(math_is_hard(4), name="carol", metric=EveryNthMetric(rec, 2)))
+        self.assertEqual(rec.results, [("carol", 2, 1.0), ("carol", 2, 1.0)])
+
+    def test_each_short(self):
+        # the final next() of each loop isn't an event
+        rec = Recorder()
+        metric = EveryNthMetric(rec, 2)
+        for i in range(100):
+            list(instrument.each([i], name="dave", metric=metric))
+        self.assertEqual(sum(r[1] for r in rec.results), 100)
+
+class RandomMetricTestCase(unittest.TestCase):
+
+    def test_sample(self):
+        random.seed(42)
+        rec = Recorder()
+        metric = RandomMetric(rec, 0.25)
+        for i in range(10000):
+            metric("alice", 1, 0.5)
+
+        total = sum(r[1] for r in rec.results)
+        self.assertTrue(9000 < total < 11000)
+        self.assertEqual(set(r[1:] for r in rec.results), {(4, 0.5)})
+
+class ReservoirMetricTestCase(unittest.TestCase):
+
+    def test_sample(self):
+        random.seed(42)
+        rec = Recorder()
+        metric = ReservoirMetric(rec, 10, dump_atexit=False)
+        for i in range(1000):
+            metric("alice", 1, float(i))
+        for i in range(5):
+            metric("bob", 2, float(i))
+
+        # nothing is passed on until dump
+        self.assertEqual(rec.results, [])
+        metric.dump()
+
+        alice = [r for r in rec.results if r[0] == "alice"]
+        bob = [r for r in rec.results if r[0] == "bob"]
+        self.assertEqual(len(alice), 10)
+        self.assertEqual(sum(r[1] for r in alice), 1000)
+        self.assertEqual(bob, [("bob", 2, float(i)) for i in range(5)])
+
+        # starts afresh
+        metric.dump()
+        self.assertEqual(len(rec.results), 15)
+
+    def test_each_short(self):
+        random.seed(42)
+        rec = Recorder()
+        metric = ReservoirMetric(rec, 10, dump_atexit=False)
+        for i in range(100):
+            list(instrument.each([i], name="erin", metric=metric))
+        metric.dump()
+        self.assertEqual(len(rec.results), 10)
+        self.assertEqual(sum(r[1] for r in rec.results), 100)
@@ -0,0 +1,146 @@
+import time
+import asyncio
+import unittest
+from io import StringIO
+
+import instrument
+import instrument.aio
+from instrument.output.table import TableMetric
+
+class SpanMetric(object):
+    """records spans"""
+    def __init__(self):
+        self.results = []
+
+    def __call__(self, name, count, elapsed):
+        self.results.append((name, count, elapsed))
+
+    def span(self, name, count, elapsed, self_elapsed, parent):
+        self.results.append((name, count, elapsed, self_elapsed, parent))
+
+class SpansTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, instrument, 'track_spans', False)
+        instrument.track_spans = True
+        self.metric = SpanMetric()
+
+    def test_nested(self):
+        metric = self.metric
+
+        @instrument.function(name="inner", metric=metric)
+        def inner():
+            time.sleep(1)
+
+        @instrument.reducer(name="reduce", metric=metric)
+        def reduce(iterable):
+            time.sleep(2)
+            inner()
+            return sum(iterable)
+
+        @instrument.producer(name="produce", metric=metric)
+        def produce():
+            inner()
+            return [1, 2]
+
+        with instrument.block(name="outer", metric=metric):
+            time.sleep(1)
+            self.assertEqual(instrument.current_span().name, "outer")
+            inner()
+            self.assertEqual(reduce(range(3)), 3)
+            produce()
+        self.assertIsNone(instrument.current_span())
+
+        self.assertEqual(metric.results, [
+            ("inner", 1, 1.0, 1.0, "outer"),
+            ("inner", 1, 1.0, 1.0, "reduce"),
+            ("reduce", 3, 3.0, 2.0, "outer"),
+            ("inner", 1, 1.0, 1.0, "produce"),
+            ("produce", 2, 1.0, 0.0, "outer"),
+            ("outer", 1, 6.0, 1.0, None),
+        ])
+
+    def test_exception(self):
+        metric = self.metric
+
+        @instrument.function(name="fails", metric=metric)
+        def fails():
+            time.sleep(1)
+            raise ValueError
+
+        with instrument.block(name="outer", metric=metric):
+            with self.assertRaises(ValueError):
+                fails()
+
+        self.assertEqual(metric.results, [("fails", 1, 1.0, 1.0, "outer"), ("outer", 1, 1.0, 0.0, None)])
+
+    def test_plain_metric(self):
+        # metrics without a span method get inclusive time
+        results = []
+        metric = lambda name, count, elapsed: results.append((name, count, elapsed))
+
+        with instrument.block(name="outer", metric=metric):
+            with instrument.block(name="inner", metric=metric):
+                time.sleep(1)
+
+        self.assertEqual(results, [("inner", 1, 1.0), ("outer", 1, 1.0)])
+
+    def test_default_metric(self):
+        self.addCleanup(setattr, instrument, 'default_metric', instrument.default_metric)
+        instrument.default_metric = self.metric
+
+        with instrument.block(name="outer"):
+            time.sleep(1)
+
+        self.assertEqual(self.metric.results, [("outer", 1, 1.0, 1.0, None)])
+
+    def test_tasks(self):
+        metric = self.metric
+
+        @instrument.function(name="task", metric=metric)
+        async def task():
+            time.sleep(1)
+            await asyncio.sleep(0)
+
+        async def main():
+            async with instrument.aio.block(name="outer", metric=metric):
+                await asyncio.gather(task(), task())
+
+        asyncio.run(main())
+
+        # each task has its own stack, inheriting the span that created it.
+        # Elapsed time includes other tasks'
+        self.assertEqual(sorted(metric.results[:2]), [("task", 1, 1.0, 1.0, "outer"),
+                                                      ("task", 1, 2.0, 2.0, "outer")])
+        # concurrent enclosed spans overlap, so self time is clamped
+        self.assertEqual(metric.results[2], ("outer", 1, 2.0, 0.0, None))
+
+    def test_disabled(self):
+        instrument.track_spans = False
+        with instrument.block(name="outer", metric=self.metric):
+            self.assertIsNone(instrument.current_span())
+            time.sleep(1)
+
+        self.assertEqual(self.metric.results, [("outer", 1, 1.0)])
+
+    def test_table(self):
+        TableMetric.dump_atexit = False
+        TableMetric.outfile = StringIO()
+        self.addCleanup(setattr, TableMetric, 'spans', False)
+        TableMetric.spans = True
+
+        for i in range(2):
+            with instrument.block(name="outer", metric=TableMetric.metric):
+                time.sleep(1)
+                with instrument.block(name="inner", metric=TableMetric.metric):
+                    time.sleep(2)
+
+        # plain calls to metric have no enclosed measurements
+        TableMetric.metric("plain", 1, 3.0)
+
+        TableMetric.dump()
+        lines = TableMetric.outfile.getvalue().splitlines()
+        self.assertEqual(lines[0].split()[-4:], ['Self', 'Mean', 'Self', 'Stddev'])
+        self.assertEqual(lines[1].split(), ['inner', '1.00', '0.00', '2.00', '0.00', '2.00', '0.00'])
+        self.assertEqual(lines[2].split(), ['outer', '1.00', '0.00', '3.00', '0.00', '1.00', '0.00'])
+        self.assertEqual(lines[3].split(), ['plain', '1.00', '0.00', '3.00', '0.00', '3.00', '0.00'])
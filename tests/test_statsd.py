@@ -0,0 +1,85 @@
+import socket
+import unittest
+
+import statsd
+
+import instrument
+from instrument.output.statsd import BufferedStatsdMetric
+
+class BufferedStatsdMetricTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.addCleanup(self.sock.close)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(5)
+        self.client = statsd.StatsClient(*self.sock.getsockname())
+        self.addCleanup(self.client.close)
+
+    def recv(self):
+        return self.sock.recv(65536).decode('ascii').split('\n')
+
+    def test_dump(self):
+        bsm = BufferedStatsdMetric(self.client, interval=3600, dump_atexit=False)
+
+        with instrument.block(name="alice", metric=bsm.metric, count=3):
+            pass
+        bsm.metric("alice", 2, 0.25)
+        bsm.metric("bob", 1, 1.0)
+
+        bsm.dump()
+        self.assertFalse(bsm.thread.is_alive())
+
+        # aggregated & packed into one datagram
+        self.assertEqual(self.recv(), ['alice:5|c', 'bob:1|c', 'alice:0.000000|ms',
+                                       'alice:250.000000|ms', 'bob:1000.000000|ms'])
+
+    def test_max_pending(self):
+        bsm = BufferedStatsdMetric(self.client, interval=3600, max_pending=3, dump_atexit=False)
+        self.addCleanup(bsm.dump)
+
+        for i in range(3):
+            bsm.metric("carol", 1, 0.001)
+
+        # flushed by the background thread
+        self.assertEqual(self.recv(), ['carol:3|c'] + ['carol:1.000000|ms'] * 3)
+
+    def test_datagram_size(self):
+        bsm = BufferedStatsdMetric(self.client, interval=3600, dump_atexit=False)
+
+        for i in range(100):
+            bsm.metric("dave.%d" % i, 1, 0.001)
+        bsm.dump()
+
+        lines = []
+        while len(lines) < 200:
+            data = self.recv()
+            self.assertLess(len('\n'.join(data)), 512)
+            lines.extend(data)
+        self.assertEqual(len(lines), 200)
+
+    def test_aggregate(self):
+        bsm = BufferedStatsdMetric(self.client, interval=3600, dump_atexit=False)
+
+        for i in range(1000):
+            bsm.metric("erin", 1, 0.002)
+        with self.assertWarns(UserWarning):
+            bsm.metric(None, 1, 0.002)
+
+        # timings are counted per value
+        self.assertEqual(dict(bsm.timings), {"erin": {2: 1000}})
+        bsm.dump()
+
+        lines = []
+        while len(lines) < 1001:
+            lines.extend(self.recv())
+        self.assertEqual(lines, ['erin:1000|c'] + ['erin:2.000000|ms'] * 1000)
+
+    def test_after_dump(self):
+        bsm = BufferedStatsdMetric(self.client, interval=3600, dump_atexit=False)
+        bsm.dump()
+
+        # sent directly, as nothing would send buffered stats
+        bsm.metric("frank", 2, 0.5)
+        self.assertEqual(self.recv(), ['frank:2|c', 'frank:500.000000|ms'])
+        self.assertFalse(bsm.pending)
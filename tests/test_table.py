@@ -1,5 +1,8 @@
 import unittest
+import threading
+import multiprocessing
 from io import StringIO
+from unittest import mock
 
 from . import math_is_hard
 
@@ -23,3 +26,202 @@ class TableMetricTestCase(unittest.TestCase):
         TableMetric.dump()
         result = 'Name         Count Mean        Count Stddev        Elapsed Mean        Elapsed Stddev        \nalice          15.00               5.00               15.00                 5.00             \nbob            10.00               0.00               10.00                 0.00             \n'
         self.assertMultiLineEqual(TableMetric.outfile.getvalue(), result)
+
+    def test_threads(self):
+        TableMetric.dump_atexit = False
+        TableMetric.outfile = StringIO()
+
+        def record():
+            for i in range(1000):
+                TableMetric.metric("carol", 2, 3.0)
+
+        threads = [threading.Thread(target=record) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        # per-thread buffers are merged at dump
+        TableMetric.dump()
+        result = 'Name         Count Mean        Count Stddev        Elapsed Mean        Elapsed Stddev        \ncarol           2.00               0.00                3.00                 0.00             \n'
+        self.assertMultiLineEqual(TableMetric.outfile.getvalue(), result)
+
+    def test_thread_exit(self):
+        TableMetric.dump_atexit = False
+        TableMetric.outfile = StringIO()
+
+        def record(name):
+            TableMetric.metric(name, 2, 3.0)
+
+        threads = [threading.Thread(target=record, args=(name,)) for name in ("carol", "dave")]
+        for t in threads:
+            t.start()
+            t.join()
+
+        # exited threads' buffers are merged & dropped when another registers
+        self.assertNotIn(threads[0], TableMetric.buffers)
+        self.assertIn(threads[1], TableMetric.buffers)
+
+        TableMetric.dump()
+        lines = TableMetric.outfile.getvalue().splitlines()
+        self.assertEqual([l.split()[0] for l in lines[1:]], ["carol", "dave"])
+
+    def test_thread_exit_dump(self):
+        TableMetric.dump_atexit = False
+        TableMetric.outfile = StringIO()
+
+        t = threading.Thread(target=TableMetric.metric, args=("frank", 2, 3.0))
+        t.start()
+        t.join()
+
+        # and at dump, after its data is output
+        TableMetric.dump()
+        self.assertNotIn(t, TableMetric.buffers)
+        self.assertIn("frank", TableMetric.outfile.getvalue())
+
+    def test_many_names(self):
+        TableMetric.dump_atexit = False
+        TableMetric.outfile = StringIO()
+
+        for i in range(3000):
+            TableMetric.metric("name%04d" % i, i, float(i))
+
+        # all metrics share one arena
+        TableMetric.dump()
+        lines = TableMetric.outfile.getvalue().splitlines()
+        self.assertEqual(len(lines), 3001)
+        self.assertEqual(lines[-1].split(), ['name2999', '2999.00', '0.00', '2999.00', '0.00'])
+
+    def test_chunks(self):
+        TableMetric.dump_atexit = False
+        TableMetric.outfile = StringIO()
+        self.addCleanup(setattr, TableMetric, 'chunk_size', TableMetric.chunk_size)
+        TableMetric.chunk_size = 7
+
+        for i in range(100):
+            TableMetric.metric("dave", i, i / 10)
+            TableMetric.metric("erin", 1, 0.5)
+
+        TableMetric.dump()
+        result = 'Name        Count Mean        Count Stddev        Elapsed Mean        Elapsed Stddev        \ndave          49.50              28.87                4.95                 2.89             \nerin           1.00               0.00                0.50                 0.00             \n'
+        self.assertMultiLineEqual(TableMetric.outfile.getvalue(), result)
+
+    def test_fork(self):
+        TableMetric.dump_atexit = False
+        TableMetric.outfile = StringIO()
+
+        TableMetric.metric("frank", 1, 1.0)
+
+        def record(i):
+            for _ in range(10):
+                TableMetric.metric("grace", i, float(i))
+            TableMetric.metric("frank", 3, 3.0)
+
+        # children save their data when they exit; the parent merges at dump
+        ctx = multiprocessing.get_context('fork')
+        procs = [ctx.Process(target=record, args=(i,)) for i in (1, 3)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+            self.assertEqual(p.exitcode, 0)
+
+        TableMetric.dump()
+        result = 'Name         Count Mean        Count Stddev        Elapsed Mean        Elapsed Stddev        \nfrank           2.33               0.94                2.33                 0.94             \ngrace           2.00               1.00                2.00                 1.00             \n'
+        self.assertMultiLineEqual(TableMetric.outfile.getvalue(), result)
+
+    def test_timestamps(self):
+        TableMetric.dump_atexit = False
+        TableMetric.outfile = StringIO()
+        self.addCleanup(setattr, TableMetric, 'timestamps', False)
+        TableMetric.timestamps = True
+
+        # samples take 0.5s & start at 0, 0.5, 1.5, 1.75 and 5.5s
+        ends = [int((t + 0.5) * 1e9) for t in (100, 100.5, 101.5, 101.75, 105.5)]
+        with mock.patch.object(instrument, 'clock', iter(ends).__next__):
+            for count in (1, 3, 2, 2, 4):
+                TableMetric.metric("heidi", count, 0.5)
+
+        # 1s windows hold 4, 4, 0, 0, 0 & 4 items
+        TableMetric.dump()
+        lines = TableMetric.outfile.getvalue().splitlines()
+        self.assertEqual(lines[0].split()[-6:], ['Throughput', 'Mean', 'Throughput', 'Min', 'Throughput', 'Max'])
+        self.assertEqual(lines[1].split(), ['heidi', '2.40', '1.02', '0.50', '0.00', '2.00', '0.00', '4.00'])
+
+    def test_metric_at(self):
+        TableMetric.dump_atexit = False
+        TableMetric.outfile = StringIO()
+        self.addCleanup(setattr, TableMetric, 'timestamps', False)
+        TableMetric.timestamps = True
+
+        # as in test_timestamps, with end times given rather than taken now
+        ends = [int((t + 0.5) * 1e9) for t in (100, 100.5, 101.5, 101.75, 105.5)]
+        with mock.patch.object(instrument, 'clock', side_effect=AssertionError):
+            for count, end in zip((1, 3, 2, 2, 4), ends):
+                TableMetric.metric_at("heidi", count, 0.5, end)
+
+        TableMetric.dump()
+        lines = TableMetric.outfile.getvalue().splitlines()
+        self.assertEqual(lines[1].split(), ['heidi', '2.40', '1.02', '0.50', '0.00', '2.00', '0.00', '4.00'])
+
+    def test_columns(self):
+        TableMetric.dump_atexit = False
+        TableMetric.outfile = StringIO()
+        self.addCleanup(setattr, TableMetric, 'columns', None)
+        self.addCleanup(setattr, TableMetric, 'chunk_size', TableMetric.chunk_size)
+        TableMetric.columns = ['samples', 'count_min', 'count_max', 'count_total', 'elapsed_total',
+                               'rate', 'p50', 'p90', 'p99.9']
+        TableMetric.chunk_size = 7
+
+        for i in range(1, 101):
+            TableMetric.metric("ivan", i, i / 10)
+            TableMetric.metric("judy", 2, 0.5)
+
+        TableMetric.dump()
+        lines = TableMetric.outfile.getvalue().splitlines()
+        self.assertEqual(lines[0].split(), ['Name', 'Samples', 'Count', 'Min', 'Count', 'Max', 'Count', 'Total',
+                                            'Elapsed', 'Total', 'Items/Second', 'p50', 'p90', 'p99.9'])
+        self.assertEqual(lines[1].split(), ['ivan', '100', '1.00', '100.00', '5050.00', '505.00',
+                                            '10.00', '5.05', '9.01', '9.99'])
+        self.assertEqual(lines[2].split(), ['judy', '100', '2.00', '2.00', '200.00', '50.00',
+                                            '4.00', '0.50', '0.50', '0.50'])
+
+    def test_bad_columns(self):
+        TableMetric.dump_atexit = False
+        TableMetric.outfile = StringIO()
+        self.addCleanup(setattr, TableMetric, 'columns', None)
+
+        for columns in (['count_median'], ['pfoo'], ['throughput_mean'], ['self_std']):
+            TableMetric.columns = columns
+            TableMetric.metric("mallory", 1, 1.0)
+            with self.assertRaises(ValueError):
+                TableMetric.dump()
+
+        # nothing was output, so data is kept
+        TableMetric.columns = None
+        TableMetric.dump()
+        self.assertEqual(TableMetric.outfile.getvalue().splitlines()[1].split(),
+                         ['mallory', '1.00', '0.00', '1.00', '0.00'])
+
+    def test_fork_failed_dump(self):
+        TableMetric.dump_atexit = False
+        TableMetric.outfile = StringIO()
+        self.addCleanup(setattr, TableMetric, 'columns', None)
+
+        def record():
+            TableMetric.metric("ivan", 2, 2.0)
+
+        ctx = multiprocessing.get_context('fork')
+        p = ctx.Process(target=record)
+        p.start()
+        p.join()
+        self.assertEqual(p.exitcode, 0)
+
+        # children's data is kept until it's output
+        TableMetric.columns = ['bogus']
+        with self.assertRaises(ValueError):
+            TableMetric.dump()
+        TableMetric.columns = None
+        TableMetric.dump()
+        self.assertEqual(TableMetric.outfile.getvalue().splitlines()[1].split(),
+                         ['ivan', '2.00', '0.00', '2.00', '0.00'])
@@ -0,0 +1,125 @@
+import time
+import threading
+import unittest
+import urllib.request
+from wsgiref.util import setup_testing_defaults
+from wsgiref.validate import validator
+from wsgiref.simple_server import make_server, WSGIRequestHandler
+
+from instrument.wsgi import Middleware, normalize_path
+
+def app(environ, start_response):
+    time.sleep(1)
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return body(3)
+
+def body(N):
+    for i in range(N):
+        time.sleep(1)
+        yield b'x' * (i + 1)
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+class WSGITestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.results = []
+        self.metric = lambda name, count, elapsed: self.results.append((name, count, elapsed))
+
+    def request(self, wsgi_app, **environ):
+        environ.setdefault('SCRIPT_NAME', '')
+        setup_testing_defaults(environ)
+        response = []
+        result = wsgi_app(environ, lambda status, headers, exc_info=None: response.append(status))
+        try:
+            data = b''.join(result)
+        finally:
+            result.close()
+        return response[0], data
+
+    def test_middleware(self):
+        mw = Middleware(app, metric=self.metric)
+        status, data = self.request(validator(mw), PATH_INFO='/users/42/', REQUEST_METHOD='POST')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(data, b'xxxxxx')
+        self.assertEqual(self.results, [
+            ('wsgi.POST.users.{id}.app', 1, 1.0),
+            ('wsgi.POST.users.{id}.first', 1, 1.0),
+            ('wsgi.POST.users.{id}.all', 3, 3.0),
+        ])
+
+    def test_close(self):
+        closed = []
+        class Body(list):
+            def close(self):
+                closed.append(True)
+
+        def app(environ, start_response):
+            start_response('200 OK', [])
+            return Body([b'a', b'b'])
+
+        mw = Middleware(app, metric=self.metric, prefix='site')
+        # server closes the body without iterating, as for HEAD
+        environ = {}
+        setup_testing_defaults(environ)
+        mw(environ, lambda status, headers: None).close()
+        self.assertEqual(closed, [True])
+        self.assertEqual([r[:2] for r in self.results], [('site.GET.index.app', 1), ('site.GET.index.all', 0)])
+
+    def test_max_routes(self):
+        mw = Middleware(app, metric=self.metric, max_routes=2)
+        for user in ('alice', 'bob', 'carol', 'alice'):
+            self.request(mw, PATH_INFO='/users/%s' % user)
+
+        names = [name for name, count, elapsed in self.results if name.endswith('.app')]
+        self.assertEqual(names, ['wsgi.GET.users.alice.app', 'wsgi.GET.users.bob.app',
+                                 'wsgi.GET.other.app', 'wsgi.GET.users.alice.app'])
+
+    def test_methods(self):
+        mw = Middleware(app, metric=self.metric, max_routes=1)
+        for method in ('GET', 'FOO', 'BAR', 'PATCH'):
+            self.request(mw, PATH_INFO='/items/%s' % method.lower(), REQUEST_METHOD=method)
+
+        # non-standard methods can't grow the number of names either
+        names = [name for name, count, elapsed in self.results if name.endswith('.app')]
+        self.assertEqual(names, ['wsgi.GET.items.get.app', 'wsgi.OTHER.other.app',
+                                 'wsgi.OTHER.other.app', 'wsgi.PATCH.other.app'])
+        self.assertEqual(len(mw.names), 3)
+
+    def test_error(self):
+        def broken(environ, start_response):
+            raise RuntimeError("oops")
+
+        mw = Middleware(broken, metric=self.metric)
+        with self.assertRaises(RuntimeError):
+            self.request(mw)
+        self.assertEqual([r[:2] for r in self.results], [('wsgi.GET.index.app', 1)])
+
+    def test_normalize_path(self):
+        self.assertEqual(normalize_path('/'), 'index')
+        self.assertEqual(normalize_path('/static/app.js'), 'static.app_js')
+        self.assertEqual(normalize_path('/orders/123e4567-e89b-12d3-a456-426614174000/items/7'),
+                         'orders.{uuid}.items.{id}')
+        self.assertEqual(normalize_path('/blobs/0123456789abcdef0123'), 'blobs.{hex}')
+        # words made of hex digits are kept
+        self.assertEqual(normalize_path('/feedbackcafebabe/deadbeef'), 'feedbackcafebabe.deadbeef')
+
+    def test_server(self):
+        mw = Middleware(app, metric=self.metric)
+        server = make_server('127.0.0.1', 0, mw, handler_class=QuietHandler)
+        self.addCleanup(server.server_close)
+        thread = threading.Thread(target=server.handle_request)
+        thread.start()
+
+        url = 'http://127.0.0.1:%d/items/9' % server.server_port
+        with urllib.request.urlopen(url) as response:
+            self.assertEqual(response.read(), b'xxxxxx')
+        thread.join()
+
+        self.assertEqual([r[:2] for r in self.results], [
+            ('wsgi.GET.items.{id}.app', 1),
+            ('wsgi.GET.items.{id}.first', 1),
+            ('wsgi.GET.items.{id}.all', 3),
+        ])